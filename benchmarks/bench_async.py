@@ -0,0 +1,51 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+from binapi import asyncbinance
+from binapi.ratelimit import ratelimiter
+
+"""
+Compares the throughput of the sync client, called in a loop and from a
+thread pool, with the asyncio client, on small kline pages of many
+symbols read from the local mock server with some latency.
+Args:
+    number of requests per path (default 1000), mock latency in seconds (default 0.02)
+Returns:
+    prints requests/sec of every path
+"""
+
+async def run_async(client, calls, concurrency):
+    async with asyncbinance(client=client, pool_size=concurrency) as aclient:
+        await aclient.reqs.warmup(client.basev1 + client.endpoints['ping'], concurrency)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(aclient.GetSymbolKlines(symbol, '1m', 50, fmt='numpy') for symbol in calls))
+        return time.perf_counter() - t0
+
+if __name__ == '__main__':
+    count   = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    with mockserver(latency=latency, weight_limit=10**9, symbols=50) as server:
+        client  = server.client(limiter=ratelimiter(weight_limit=10**9), pool_size=64)
+        symbols = [symbol for symbol, *_ in server.symbols]
+        calls   = [symbols[i % len(symbols)] for i in range(count)]
+        fetch   = lambda symbol: client.GetSymbolKlines(symbol, '1m', 50, fmt='numpy')
+
+        print('{:<16}{:>12}'.format('path', 'req/s'))
+        t0 = time.perf_counter()
+        for symbol in calls[:count//10]:
+            fetch(symbol)
+        print('{:<16}{:>12.0f}'.format('sync loop', count//10/(time.perf_counter() - t0)))
+        for workers in (16, 64):
+            client.reqs.warmup(client.basev1 + client.endpoints['ping'], workers)
+            with ThreadPoolExecutor(workers) as pool:
+                t0 = time.perf_counter()
+                list(pool.map(fetch, calls))
+                print('{:<16}{:>12.0f}'.format('threads x{}'.format(workers), count/(time.perf_counter() - t0)))
+        for concurrency in (16, 64):
+            spent = asyncio.run(run_async(client, calls, concurrency))
+            print('{:<16}{:>12.0f}'.format('async x{}'.format(concurrency), count/spent))
+        client.close()
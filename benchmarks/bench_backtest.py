@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+from binapi import binance, recorder, replayer, simexchange
+from binapi.ratelimit import ratelimiter
+
+"""
+Runs one moving average strategy, reading 30 candles and its position and
+trading on every candle, against the local mock server and on a
+simexchange over a day of synthetic 1m candles, then records a session of
+kline and order calls against the mock and replays it from the recording.
+Args:
+    number of strategy steps against the mock (default 200), mock latency in seconds (default 0.005)
+Returns:
+    prints steps/sec of every path, the simulated time per wall second and
+    the size of the recording
+"""
+
+def strategy(client, symbol='BTCUSDT'):
+    candles = client.GetSymbolKlines(symbol, '1m', 30, fmt='numpy')
+    fast    = candles['close'][-5:].mean()
+    slow    = candles['close'].mean()
+    amount  = float(client.GetPositionData(symbol)[0]['positionAmt'])
+    if fast > slow and amount <= 0:
+        client.place_market_order(symbol, 'BUY', 1 - amount)
+    elif fast < slow and amount >= 0:
+        client.place_market_order(symbol, 'SELL', 1 + amount)
+
+
+def walk(count, seed=1, start=1600000000000):
+    rng   = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.2, count))
+    open_ = np.r_[100, close[:-1]]
+    return {'time': start + 60000*np.arange(count), 'open': open_.round(2),
+            'high': (np.maximum(open_, close) + rng.random(count)*0.3).round(2),
+            'low': (np.minimum(open_, close) - rng.random(count)*0.3).round(2),
+            'close': close.round(2), 'volume': rng.random(count)*10}
+
+
+def session(client, symbols):
+    for symbol in symbols:
+        client.GetSymbolKlines(symbol, '1m', 500, fmt='numpy')
+        order = client.place_limit_order(symbol, 'BUY', 1, 1000)
+        client.GetOrderInfo(symbol, order['orderId'])
+        client.CancelOrder(symbol, order['orderId'])
+        client.GetPositionData(symbol)
+
+
+if __name__ == '__main__':
+    count   = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+
+    print('{:<24}{:>12}{:>22}'.format('path', 'steps/s', 'simulated s/wall s'))
+    with mockserver(latency=latency, weight_limit=10**9) as server:
+        client = server.client(limiter=ratelimiter(weight_limit=10**9))
+        t0 = time.perf_counter()
+        for _ in range(count):
+            strategy(client)
+        spent = time.perf_counter() - t0
+        print('{:<24}{:>12.0f}{:>22}'.format('mock, {:.0f}ms'.format(latency*1000), count/spent, 'real time'))
+
+        sim   = simexchange({'BTCUSDT': walk(1440 + 30)}, '1m', start=1600000000000 + 30*60000)
+        fills = sim.client()
+        t0    = time.perf_counter()
+        sim.run(lambda: strategy(fills))
+        spent = time.perf_counter() - t0
+        print('{:<24}{:>12.0f}{:>22.0f}'.format('simexchange', 1440/spent, 1440*60/spent))
+
+        path    = os.path.join(tempfile.mkdtemp(), 'session.jsonl.gz')
+        symbols = [symbol for symbol, *_ in server.symbols if symbol.endswith('USDT')]*20
+        with recorder(path, headers=client.headers) as record:
+            live = server.client(transport=record, check=False)
+            t0   = time.perf_counter()
+            session(live, symbols)
+            spent = time.perf_counter() - t0
+            calls = record.calls
+        client.close()
+    replay = replayer(path)
+    again  = binance(api_key='mock-api-key', secret_key='mock-secret-key', transport=replay, check=False)
+    t0     = time.perf_counter()
+    session(again, symbols)
+    replayed = time.perf_counter() - t0
+    print('\n{:<24}{:>12}'.format('session of {} calls'.format(calls), 'calls/s'))
+    print('{:<24}{:>12.0f}'.format('recorded live', calls/spent))
+    print('{:<24}{:>12.0f}'.format('replayed', calls/replayed))
+    print('recording: {:.0f} kB, {} unanswered on replay'.format(os.path.getsize(path)/1000, replay.missed))
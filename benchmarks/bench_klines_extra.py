@@ -0,0 +1,44 @@
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+
+"""
+Times a long GetSymbolKlinesExtra download on a local stand-in server
+with some artificial latency, serially and with concurrent pages, and
+checks both give the very same frame.
+Args:
+    number of candles (default 60000) and latency in ms (default 20)
+Returns:
+    prints the time of every path
+"""
+
+def old_serial(client, symbol, interval, limit):
+    ''' The previous page-after-page loop, with pd.concat in place of df.append '''
+    initial_limit = limit % client.mxlimit or client.mxlimit
+    df = client.GetSymbolKlines(symbol, interval, limit=initial_limit)
+    for _ in range(-(-(limit - initial_limit)//client.mxlimit)):
+        df2 = client.GetSymbolKlines(symbol, interval, limit=client.mxlimit, end_time=df['time'][0])
+        df  = pd.concat([df2, df], ignore_index=True)
+    return df
+
+def timed(call):
+    t0 = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - t0
+
+if __name__ == '__main__':
+    limit   = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with mockserver(latency=latency/1000) as server:
+        client = server.client(pool_size=16)
+        old, t_old = timed(lambda: old_serial(client, 'BTCUSDT', '1m', limit))
+        ser, t_ser = timed(lambda: client.GetSymbolKlinesExtra('BTCUSDT', '1m', limit, workers=1))
+        con, t_con = timed(lambda: client.GetSymbolKlinesExtra('BTCUSDT', '1m', limit, workers=8))
+        client.close()
+    print('old serial loop     {:8.3f}s  {} rows ({} duplicated)'.format(t_old, len(old), old['time'].duplicated().sum()))
+    print('windowed, 1 worker  {:8.3f}s  {} rows'.format(t_ser, len(ser)))
+    print('windowed, 8 workers {:8.3f}s  {} rows'.format(t_con, len(con)))
+    print('identical:', con.equals(ser))
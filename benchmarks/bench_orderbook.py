@@ -0,0 +1,50 @@
+import random
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from binapi.orderbook import orderbook
+
+"""
+Measures how many depth diff events a local orderbook absorbs per second.
+The events are generated like the @depth@100ms stream of a busy symbol:
+a few levels changed or removed near the top of a 1000 level book.
+"""
+
+def events(count, levels=1000, per_event=10, seed=1):
+    rnd   = random.Random(seed)
+    out   = []
+    last  = 1000
+    for _ in range(count):
+        bids = [['{:.1f}'.format(100 - 0.1*rnd.randint(1, levels)), '0' if rnd.random() < 0.2 else '{:.3f}'.format(rnd.random()*5)]
+                for _ in range(per_event)]
+        asks = [['{:.1f}'.format(100 + 0.1*rnd.randint(1, levels)), '0' if rnd.random() < 0.2 else '{:.3f}'.format(rnd.random()*5)]
+                for _ in range(per_event)]
+        out.append({'e': 'depthUpdate', 's': 'BTCUSDT', 'U': last + 1, 'u': last + 5, 'pu': last, 'b': bids, 'a': asks})
+        last += 5
+    out[0]['U'] = 1000
+    return out
+
+
+if __name__ == '__main__':
+    count    = 50000
+    snapshot = {'lastUpdateId': 1000,
+                'bids': [['{:.1f}'.format(100 - 0.1*(i + 1)), '1.000'] for i in range(1000)],
+                'asks': [['{:.1f}'.format(100 + 0.1*(i + 1)), '1.000'] for i in range(1000)]}
+    stream   = events(count)
+    book     = orderbook('BTCUSDT')
+    book.load(snapshot)
+    t0 = time.perf_counter()
+    for event in stream:
+        book.apply(event)
+    elapsed = time.perf_counter() - t0
+    print('applied {} events ({} level updates) in {:.3f}s: {:.0f} events/s, {:.0f} levels/s'.format(
+        book.updates, 20*book.updates, elapsed, book.updates/elapsed, 20*book.updates/elapsed))
+    t0 = time.perf_counter()
+    for _ in range(count):
+        book.bid(); book.ask()
+    print('best bid/ask: {:.2f} us'.format((time.perf_counter() - t0)/count*1e6))
+    t0 = time.perf_counter()
+    for _ in range(10000):
+        book.slippage('BUY', 25)
+    print('slippage of 25: {:.2f} us'.format((time.perf_counter() - t0)/10000*1e6))
@@ -0,0 +1,44 @@
+import json
+import sys
+import timeit
+import pandas as pd
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+from binapi import klines
+
+"""
+Micro-benchmark of kline parsing on a 1500-row response: the previous
+json.loads + object DataFrame + per-column astype path against the
+columnar parser, with and without the final DataFrame.
+Args:
+    number of rows (default 1500)
+Returns:
+    prints the time per parse of every path
+"""
+
+def old_parse(raw):
+    data = json.loads(raw)
+    df   = pd.DataFrame(data)
+    df   = df.drop(range(6, 12), axis=1)
+    col_names = ['time', 'open', 'high', 'low', 'close', 'volume']
+    df.columns = col_names
+    for col in col_names:
+        df[col] = df[col].astype(float)
+    df['time'] = df['time'].astype(int)
+    df['date'] = pd.to_datetime(df['time'] * 1000000)
+    return df
+
+if __name__ == '__main__':
+    rows   = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    raw    = json.dumps([mockserver.candle('BTCUSDT', 1600000000000 + i*60000, 60000)
+                         for i in range(rows)]).encode()
+    assert old_parse(raw).equals(klines.frame(klines.parse(raw)))
+    paths = {'json + astype':        lambda: old_parse(raw),
+             'columnar numpy':       lambda: klines.parse(raw),
+             'columnar numpy extra': lambda: klines.parse(raw, extra=True),
+             'columnar + frame':     lambda: klines.frame(klines.parse(raw))}
+    for name, call in paths.items():
+        number = 200
+        best   = min(timeit.repeat(call, number=number, repeat=5))/number
+        print('{:<22}{:>10.1f} us'.format(name, best*1e6))
@@ -0,0 +1,46 @@
+import sys
+import time
+import requests
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+from binapi.reqs import reqs
+from binapi.ratelimit import ratelimiter
+
+"""
+Compares the old one-shot `requests.get` path against the pooled
+session of `reqs` on a local stand-in server.
+Args:
+    number of requests per path (default 2000)
+Returns:
+    prints requests/sec and p50/p99 latency of both paths
+"""
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples)-1, int(q*len(samples)))]
+
+def run(call, count):
+    lat = []
+    t0  = time.perf_counter()
+    for _ in range(count):
+        t1 = time.perf_counter()
+        call()
+        lat.append(time.perf_counter() - t1)
+    total = time.perf_counter() - t0
+    return count/total, percentile(lat, 0.5)*1000, percentile(lat, 0.99)*1000
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # both paths together go over the real weight budget, which is not what is measured here
+    with mockserver(weight_limit=10**9) as server:
+        url = server.base_url + '/fapi/v1/time'
+        session = reqs(pool_size=4, limiter=ratelimiter(weight_limit=10**9))
+        session.warmup(url)
+        paths = {'per-call': lambda: requests.get(url).json(),
+                 'pooled':   lambda: session._get(url)}
+        print('{:<10}{:>12}{:>10}{:>10}'.format('path', 'req/s', 'p50 ms', 'p99 ms'))
+        for name, call in paths.items():
+            rps, p50, p99 = run(call, count)
+            print('{:<10}{:>12.0f}{:>10.3f}{:>10.3f}'.format(name, rps, p50, p99))
+        session.close()
@@ -0,0 +1,70 @@
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+
+"""
+Measures what a short lived job pays before its first order: the import
+of binapi, and the time from the construction of a binance instance to
+the answer of its first order, with the connectivity check made up
+front, in the background or not at all. Every sample is a new python
+process, so nothing is warm but the os file cache.
+Args:
+    number of processes per measure (default 7), mock latency in seconds (default 0.005)
+Returns:
+    prints the median of every measure in ms
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = '''
+import sys, time
+t = time.perf_counter()
+import {module}
+print((time.perf_counter() - t)*1000, 'pandas' in sys.modules)
+'''
+
+ORDER = '''
+import time
+t0 = time.perf_counter()
+from binapi import binance
+t1 = time.perf_counter()
+client = binance(api_key='mock-api-key', secret_key='mock-secret-key', base_url='{url}', check={check})
+t2 = time.perf_counter()
+order = client.place_limit_order('BTCUSDT', 'BUY', 0.01, 1000)
+t3 = time.perf_counter()
+assert order.get('status') == 'NEW', order
+print((t1 - t0)*1000, (t2 - t1)*1000, (t3 - t2)*1000)
+'''
+
+
+def run(code, count):
+    samples = []
+    for _ in range(count):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        samples.append(out.stdout.strip().splitlines()[-1].split())
+    return samples
+
+
+def median(samples, i):
+    return statistics.median(float(sample[i]) for sample in samples)
+
+
+if __name__ == '__main__':
+    count   = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+
+    print('{:<34}{:>10}'.format('import', 'ms'))
+    for module in ('binapi', 'pandas', 'binapi, pandas'):
+        samples = run(IMPORT.format(module=module), count)
+        print('{:<34}{:>10.1f}   pandas loaded: {}'.format(module, median(samples, 0), samples[0][1]))
+
+    with mockserver(latency=latency) as server:
+        print('\n{:<14}{:>10}{:>14}{:>14}{:>10}'.format('check', 'import', 'construct', 'first order', 'total'))
+        for check in ('True', "'lazy'", 'False'):
+            samples = run(ORDER.format(url=server.base_url, check=check), count)
+            parts   = [median(samples, i) for i in range(3)]
+            print('{:<14}{:>10.1f}{:>14.1f}{:>14.1f}{:>10.1f}'.format(check, *parts, sum(parts)))
@@ -0,0 +1,519 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+"""
+A small local stand-in for the binance futures REST api, so the
+library can be exercised and benchmarked without keys or network.
+Args:
+    latency:    seconds of artificial delay added to every response
+    jitter:     extra random delay of every response, up to this many seconds
+    error_rate: share of the calls answered 503, picked at random
+    symbols:    synthetic symbols listed on top of the usual ones, to size
+                exchangeInfo, positionRisk and the tickers
+    weight_limit: request weight per minute before answering 429
+    skew:       ms the server clock runs ahead of the local clock
+    gaps:       list of (start, end) ms ranges with no candles, like
+                exchange maintenance windows
+Faults are injected per endpoint with inject(), see there.
+Returns:
+    a running server, base_url points at it
+"""
+
+SYMBOLS = [('BTCUSDT', 'BTC', 'USDT', '0.10', '0.001', '5', 'TRADING'),
+           ('ETHUSDT', 'ETH', 'USDT', '0.01', '0.001', '5', 'TRADING'),
+           ('XRPUSDT', 'XRP', 'USDT', '0.0001', '0.1', '5', 'TRADING'),
+           ('BTCBUSD', 'BTC', 'BUSD', '0.1', '0.001', '5', 'SETTLING')]
+
+
+class _handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'          # keep-alive, like the real api
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _serve(self, method):
+        parts  = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query))
+        signed = parts.query
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body   = self.rfile.read(length).decode()
+            params.update(parse_qsl(body))
+            signed = signed + body if signed else body
+        server = self.server.owner
+        server.hits += 1
+        if server.latency or server.jitter:
+            time.sleep(server.latency + (server.random.random()*server.jitter if server.jitter else 0))
+        name   = parts.path.split('/fapi/')[-1][3:]
+        route  = server.routes.get((method, name))
+        fault  = server.fault(method, name)
+        if fault == None and server.error_rate and server.random.random() < server.error_rate:
+            fault = 503
+        if isinstance(fault, float):
+            time.sleep(fault)
+        if fault == 'reset':                    # dropped before being executed
+            self.close_connection = True
+            return
+        used   = server.weigh(method, parts.path, params)
+        if isinstance(fault, int):
+            status, body = fault, {'code': -1001 if fault >= 500 else -1003, 'msg': 'Injected fault.'}
+        elif used > server.weight_limit:
+            status, body = 429, {'code': -1003, 'msg': 'Too many requests.'}
+        elif 'signature' in params and self.headers.get('X-MBX-APIKEY') not in server.keys:
+            status, body = 401, {'code': -2015, 'msg': 'Invalid API-key, IP, or permissions for action.'}
+        elif 'signature' in params and not server.verify(signed, self.headers.get('X-MBX-APIKEY')):
+            status, body = 400, {'code': -1022, 'msg': 'Signature for this request is not valid.'}
+        elif 'timestamp' in params and abs(server.now() - int(params['timestamp'])) > int(params.get('recvWindow', 5000)):
+            status, body = 400, {'code': -1021, 'msg': 'Timestamp for this request is outside of the recvWindow.'}
+        elif route is None:
+            status, body = 404, {'code': -5000, 'msg': 'Path {} not found'.format(parts.path)}
+        else:
+            status, body = route(params, self.headers)
+        if fault == 'lost':                     # executed, but the answer never arrives
+            self.close_connection = True
+            return
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+        if status == 429:
+            self.send_header('Retry-After', '1' if fault == 429 else str(60 - int(time.time()) % 60))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._serve('GET')
+
+    def do_POST(self):
+        self._serve('POST')
+
+    def do_PUT(self):
+        self._serve('PUT')
+
+    def do_DELETE(self):
+        self._serve('DELETE')
+
+
+class _server(ThreadingHTTPServer):
+    request_queue_size = 128                    # bursts of new connections must not hit a full backlog
+    daemon_threads     = True
+
+    def handle_error(self, request, client_address):
+        # clients that exit with keep-alive connections open are no error of the mock
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class mockserver:
+
+    INTERVALS = {'1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+                 '1h': 3600, '2h': 7200, '4h': 14400, '6h': 21600, '8h': 28800,
+                 '12h': 43200, '1d': 86400, '3d': 259200, '1w': 604800}
+
+    def __init__(self, latency:float=0.0, port:int=0, gaps=None, listed:int=1500000000000,
+                 weight_limit:int=2400, skew:int=0, jitter:float=0.0, error_rate:float=0.0,
+                 symbols:int=0, seed:int=1):
+        self.latency = latency
+        self.jitter  = jitter                  # extra random delay, up to this many seconds
+        self.error_rate = error_rate           # share of the calls answered 503 without being executed
+        self.random  = random.Random(seed)
+        # the listed symbols, with `symbols` synthetic ones to grow the account wide payloads
+        self.symbols = SYMBOLS + [('SYM{}USDT'.format(i), 'SYM{}'.format(i), 'USDT', '0.001', '1', '5', 'TRADING')
+                                  for i in range(symbols)]
+        self.skew    = skew                    # ms the server clock is ahead of the local one
+        self.secret  = 'mock-secret-key'
+        self.keys    = {'mock-api-key': self.secret}   # api key -> secret of every known account
+        self.weight_limit = weight_limit
+        self.used    = {}                      # weight used per minute
+        self.lock    = threading.Lock()
+        self.gaps    = gaps or []
+        self.listed  = listed                  # first candle ever traded
+        self.hits    = 0
+        self.routes  = {('GET', 'time'):   self.time,
+                        ('GET', 'ping'):   self.ping,
+                        ('GET', 'klines'): self.klines,
+                        ('GET', 'exchangeInfo'): self.exchangeInfo,
+                        ('GET', 'depth'):  self.depth,
+                        ('GET', 'ticker/24hr'): self.ticker,
+                        ('GET', 'avgPrice'): self.avgPrice,
+                        ('GET', 'account'): self.account,
+                        ('POST', 'leverage'): self.leverage,
+                        ('POST', 'marginType'): self.marginType,
+                        ('POST', 'order/test'): self.testOrder,
+                        ('POST', 'order'): self.order,
+                        ('GET', 'order'): self.getorder,
+                        ('DELETE', 'order'): self.cancel,
+                        ('GET', 'openOrders'): self.openOrders,
+                        ('GET', 'allOrders'): self.allOrders,
+                        ('GET', 'positionRisk'): self.positionRisk,
+                        ('POST', 'batchOrders'): self.batchOrders,
+                        ('DELETE', 'batchOrders'): self.cancelBatch,
+                        ('DELETE', 'allOpenOrders'): self.cancelAll,
+                        ('POST', 'listenKey'): self.newListenKey,
+                        ('PUT', 'listenKey'): self.keepListenKey,
+                        ('DELETE', 'listenKey'): self.closeListenKey}
+        self.listenKeys = set()
+        self.bookId  = 1000                    # lastUpdateId of the depth snapshots
+        self.orders  = {}
+        self.clientIds = {}                    # clientOrderId -> orderId
+        self.positions = {}                    # symbol -> (positionAmt, entryPrice), as strings
+        self.orderIds = 0
+        self.httpd   = _server(('127.0.0.1', port), _handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.base_url = 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread  = None
+        self.faults  = {}                      # (method, endpoint) -> faults of the next calls
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client(self, **kwargs):
+        """ A binance client pointed at this server, with throwaway keys """
+        from binapi import binance
+        fd, keys = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('mock-api-key\n{}\n'.format(self.secret))
+        try:
+            return binance(keys, base_url=self.base_url, **kwargs)
+        finally:
+            os.remove(keys)
+
+    def credentials(self, count:int):
+        """ Registers count more accounts, returns {name: (api_key, secret_key)} """
+        accounts = {}
+        for i in range(len(self.keys), len(self.keys) + count):
+            accounts['sub{}'.format(i)] = ('mock-api-key-{}'.format(i), 'mock-secret-{}'.format(i))
+            self.keys['mock-api-key-{}'.format(i)] = 'mock-secret-{}'.format(i)
+        return accounts
+
+    def inject(self, method, name, *faults):
+        """ Makes the next calls of an endpoint fail, one fault per call:
+            a status code answers it without executing it, 'reset' drops
+            the connection before executing it, 'lost' executes it and
+            drops the connection before answering, a float delays it """
+        with self.lock:
+            self.faults.setdefault((method, name), []).extend(faults)
+
+    def fault(self, method, name):
+        with self.lock:
+            faults = self.faults.get((method, name))
+            return faults.pop(0) if faults else None
+
+    def weigh(self, method, path, params):
+        """ Books the weight of a call and returns the weight used this minute """
+        from binapi.ratelimit import ratelimiter
+        weight = ratelimiter.cost(method, path, params)[0]
+        minute = int(time.time()) // 60
+        with self.lock:
+            self.used[minute] = self.used.get(minute, 0) + weight
+            return self.used[minute]
+
+    def verify(self, query, api_key='mock-api-key'):
+        """ Checks the signature against exactly the text that was received """
+        text, _, signature = query.rpartition('&signature=')
+        expected = hmac.new(self.keys[api_key].encode(), text.encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def now(self):
+        return int(time.time()*1000) + self.skew
+
+    def time(self, params, headers):
+        return 200, {'serverTime': self.now()}
+
+    def ping(self, params, headers):
+        return 200, {}
+
+    @staticmethod
+    def candle(symbol, opentime, width):
+        """ A deterministic candle for a symbol and open time, in api layout """
+        base  = 100 + sum(symbol.encode()) % 1000 + (opentime // width) % 97
+        close = base + (opentime // width) % 7 - 3
+        return [opentime, '%.2f' % base, '%.2f' % (max(base, close) + 1.5),
+                '%.2f' % (min(base, close) - 1.25), '%.2f' % close, '%.3f' % (opentime % 1000 + 1),
+                opentime + width - 1, '%.4f' % (close*10), opentime // width % 50, '%.3f' % 5,
+                '%.4f' % (close*5), '0']
+
+    def opentimes(self, width, start, end, limit):
+        """ Open times of existing candles in [start, end], at most limit of
+            them, counted from start if given, otherwise back from end """
+        end    = min(end, self.now())
+        first  = -(-max(start or 0, self.listed)//width)*width
+        last   = end//width*width
+        step   = width if start is not None else -width
+        cursor = first if start is not None else last
+        times  = []
+        while first <= cursor <= last and len(times) < limit:
+            if not any(a <= cursor <= b for a, b in self.gaps):
+                times.append(cursor)
+            cursor += step
+        return sorted(times)
+
+    def klines(self, params, headers):
+        width = self.INTERVALS.get(params.get('interval'), 0)*1000
+        if not width:
+            return 400, {'code': -1120, 'msg': 'Invalid interval.'}
+        limit = min(int(params.get('limit', 500)), 1500)
+        end   = int(params.get('endTime', 2**62))
+        start = int(params['startTime']) if 'startTime' in params else None
+        times = self.opentimes(width, start, end, limit)
+        symbol = params.get('symbol', '')
+        return 200, [self.candle(symbol, t, width) for t in times]
+
+    def exchangeInfo(self, params, headers):
+        symbols = []
+        for symbol, base, quote, tick, step, notional, status in self.symbols:
+            symbols.append({'symbol': symbol, 'status': status, 'baseAsset': base, 'quoteAsset': quote,
+                            'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': tick,
+                                         'minPrice': tick, 'maxPrice': '1000000'},
+                                        {'filterType': 'LOT_SIZE', 'stepSize': step,
+                                         'minQty': step, 'maxQty': '1000'},
+                                        {'filterType': 'MARKET_LOT_SIZE', 'stepSize': step,
+                                         'minQty': step, 'maxQty': '120'},
+                                        {'filterType': 'MIN_NOTIONAL', 'notional': notional}]})
+        return 200, {'timezone': 'UTC', 'serverTime': self.now(), 'symbols': symbols,
+                     'rateLimits': [{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE',
+                                     'intervalNum': 1, 'limit': self.weight_limit},
+                                    {'rateLimitType': 'ORDERS', 'interval': 'MINUTE',
+                                     'intervalNum': 1, 'limit': 1200},
+                                    {'rateLimitType': 'ORDERS', 'interval': 'SECOND',
+                                     'intervalNum': 10, 'limit': 300}]}
+
+    def order(self, params, headers):
+        with self.lock:
+            clientOrderId = params.get('newClientOrderId')
+            if clientOrderId in self.clientIds:
+                return 400, {'code': -4116, 'msg': 'ClientOrderId is duplicated.'}
+            self.orderIds += 1
+            order = {'orderId': self.orderIds, 'symbol': params.get('symbol'), 'status': 'NEW',
+                     'clientOrderId': params.get('newClientOrderId', 'mock{}'.format(self.orderIds)),
+                     'price': params.get('price', '0'), 'origQty': params.get('quantity', '0'),
+                     'executedQty': '0', 'type': params.get('type'), 'side': params.get('side'),
+                     'stopPrice': params.get('stopPrice', '0'), 'reduceOnly': str(params.get('reduceOnly')).lower() == 'true',
+                     'updateTime': int(time.time()*1000)}
+            self.orders[order['orderId']] = order
+            self.clientIds[order['clientOrderId']] = order['orderId']
+        return 200, order
+
+    def depth(self, params, headers):
+        limit = int(params.get('limit', 500))
+        return 200, {'lastUpdateId': self.bookId, 'E': self.now(), 'T': self.now(),
+                     'bids': [['{:.1f}'.format(100 - 0.1*(i + 1)), '1.000'] for i in range(limit)],
+                     'asks': [['{:.1f}'.format(100 + 0.1*(i + 1)), '1.000'] for i in range(limit)]}
+
+    def testOrder(self, params, headers):
+        return 200, {}
+
+    def ticker(self, params, headers):
+        tickers = []
+        for symbol, base, quote, tick, step, notional, status in self.symbols:
+            if status != 'TRADING' or params.get('symbol', symbol) != symbol:
+                continue
+            last = self.candle(symbol, self.now()//60000*60000, 60000)
+            tickers.append({'symbol': symbol, 'lastPrice': last[4], 'openPrice': last[1], 'highPrice': last[2],
+                            'lowPrice': last[3], 'volume': last[5], 'quoteVolume': last[7],
+                            'priceChangePercent': '0.000', 'count': last[8], 'closeTime': last[6]})
+        return 200, tickers[0] if 'symbol' in params else tickers
+
+    def avgPrice(self, params, headers):
+        last = self.candle(params.get('symbol', ''), self.now()//60000*60000, 60000)
+        return 200, {'mins': 5, 'price': last[4]}
+
+    def account(self, params, headers):
+        positions = self.positionRisk({}, headers)[1]
+        return 200, {'totalWalletBalance': '1000.00000000', 'availableBalance': '1000.00000000',
+                     'totalUnrealizedProfit': '0.00000000',
+                     'assets': [{'asset': 'USDT', 'walletBalance': '1000.00000000', 'availableBalance': '1000.00000000'}],
+                     'positions': [{'symbol': p['symbol'], 'positionAmt': p['positionAmt'], 'entryPrice': p['entryPrice'],
+                                    'leverage': p['leverage'], 'positionSide': 'BOTH'} for p in positions]}
+
+    def leverage(self, params, headers):
+        return 200, {'symbol': params.get('symbol'), 'leverage': int(params.get('leverage', 1)),
+                     'maxNotionalValue': '1000000'}
+
+    def marginType(self, params, headers):
+        return 200, {'code': 200, 'msg': 'success'}
+
+    def getorder(self, params, headers):
+        if 'origClientOrderId' in params:
+            order = self.orders.get(self.clientIds.get(params['origClientOrderId']))
+        else:
+            order = self.orders.get(int(params.get('orderId', 0)))
+        if order == None:
+            return 400, {'code': -2013, 'msg': 'Order does not exist.'}
+        return 200, order
+
+    def cancel(self, params, headers):
+        order = self.orders.get(int(params.get('orderId', 0)))
+        if order == None or order['status'] != 'NEW':
+            return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+        order['status'] = 'CANCELED'
+        return 200, order
+
+    def openOrders(self, params, headers):
+        return 200, [order for order in list(self.orders.values()) if order['status'] == 'NEW'
+                     and params.get('symbol', order['symbol']) == order['symbol']]
+
+    def allOrders(self, params, headers):
+        orders = [order for orderId, order in sorted(self.orders.items())
+                  if order['symbol'] == params.get('symbol') and orderId >= int(params.get('orderId', 0))]
+        return 200, orders[:int(params.get('limit', 500))]
+
+    def positionRisk(self, params, headers):
+        positions = []
+        for symbol, base, quote, tick, step, notional, status in self.symbols:
+            if status != 'TRADING' or params.get('symbol', symbol) != symbol:
+                continue
+            amount, entry = self.positions.get(symbol, ('0.000', '0.0'))
+            positions.append({'symbol': symbol, 'positionAmt': amount, 'entryPrice': entry,
+                              'markPrice': entry, 'unRealizedProfit': '0.00000000',
+                              'liquidationPrice': '0', 'leverage': '1', 'marginType': 'cross',
+                              'positionSide': 'BOTH', 'updateTime': int(time.time()*1000)})
+        return 200, positions
+
+    def batchOrders(self, params, headers):
+        results = []
+        for order in json.loads(params['batchOrders']):
+            if 'quantity' not in order and order.get('closePosition') != 'true':
+                results.append({'code': -1102, 'msg': "Mandatory parameter 'quantity' was not sent."})
+            else:
+                results.append(self.order(order, headers)[1])
+        return 200, results
+
+    def cancelBatch(self, params, headers):
+        return 200, [self.cancel({'orderId': orderId}, headers)[1]
+                     for orderId in json.loads(params['orderIdList'])]
+
+    def cancelAll(self, params, headers):
+        for order in list(self.orders.values()):
+            if order['symbol'] == params.get('symbol') and order['status'] == 'NEW':
+                order['status'] = 'CANCELED'
+        return 200, {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    def newListenKey(self, params, headers):
+        with self.lock:
+            key = 'mockkey{}'.format(len(self.listenKeys) + 1)
+            self.listenKeys.add(key)
+        return 200, {'listenKey': key}
+
+    def keepListenKey(self, params, headers):
+        if not self.listenKeys:
+            return 400, {'code': -1125, 'msg': 'This listenKey does not exist.'}
+        return 200, {}
+
+    def closeListenKey(self, params, headers):
+        self.listenKeys.clear()
+        return 200, {}
+
+    def fill(self, orderId, status:str='FILLED'):
+        """ Moves an order to a final status and returns its ORDER_TRADE_UPDATE
+            event, to be pushed on the user data stream """
+        order = self.orders[orderId]
+        order['status']     = status
+        order['updateTime'] = int(time.time()*1000)
+        if status == 'FILLED':
+            order['executedQty'] = order['origQty']
+        return {'e': 'ORDER_TRADE_UPDATE', 'E': order['updateTime'], 'T': order['updateTime'],
+                'o': {'s': order['symbol'], 'c': order['clientOrderId'], 'S': order['side'],
+                      'o': order['type'], 'f': 'GTC', 'q': order['origQty'], 'p': order['price'],
+                      'ap': order['price'], 'sp': order['stopPrice'], 'x': 'TRADE' if status == 'FILLED' else status,
+                      'X': status, 'i': orderId, 'l': order['executedQty'], 'z': order['executedQty'],
+                      'L': order['price'], 'T': order['updateTime'], 'R': order['reduceOnly'], 'ps': 'BOTH'}}
+
+
+class mockstream:
+    """ A local stand-in for the binance websocket api. Clients connect to
+        /stream?streams=a/b or /ws/<listenKey>, and push() sends a payload
+        to every client subscribed to a stream """
+
+    def __init__(self, port:int=0):
+        import asyncio
+        self.asyncio  = asyncio
+        self.port     = port
+        self.clients  = {}             # connection -> set of streams
+        self.loop     = None
+        self.server   = None
+        self.ready    = threading.Event()
+        self.base_url = None
+
+    async def _handle(self, socket):
+        path    = socket.request.path
+        streams = set()
+        if path.startswith('/stream?streams='):
+            streams.update(path.split('=', 1)[1].split('/'))
+        elif path.startswith('/ws/'):
+            streams.add(path[4:])
+        self.clients[socket] = streams
+        try:
+            async for message in socket:
+                request = json.loads(message)
+                if request.get('method') == 'SUBSCRIBE':
+                    streams.update(request['params'])
+                elif request.get('method') == 'UNSUBSCRIBE':
+                    streams.difference_update(request['params'])
+                await socket.send(json.dumps({'result': None, 'id': request.get('id')}))
+        except Exception:
+            pass
+        finally:
+            self.clients.pop(socket, None)
+
+    async def _serve(self):
+        import websockets
+        self.loop   = self.asyncio.get_running_loop()
+        self.server = await websockets.serve(self._handle, '127.0.0.1', self.port)
+        port        = self.server.sockets[0].getsockname()[1]
+        self.base_url = 'ws://127.0.0.1:{}'.format(port)
+        self.ready.set()
+        await self.server.wait_closed()
+
+    def start(self):
+        threading.Thread(target=lambda: self.asyncio.run(self._serve()), daemon=True).start()
+        self.ready.wait(5)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def subscribers(self, stream):
+        return [c for c, streams in list(self.clients.items()) if stream in streams]
+
+    def push(self, stream, data, combined:bool=True):
+        """ Sends a payload to every client of a stream """
+        payload = json.dumps({'stream': stream, 'data': data} if combined else data)
+        for client in self.subscribers(stream):
+            self.asyncio.run_coroutine_threadsafe(client.send(payload), self.loop).result(5)
+
+    def drop(self):
+        """ Closes every client connection, as the exchange does every 24h """
+        for client in list(self.clients):
+            self.asyncio.run_coroutine_threadsafe(client.close(), self.loop).result(5)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, __file__.rsplit('/', 2)[0])
+from benchmarks.mockserver import mockserver
+from binapi import klines
+from binapi.ratelimit import ratelimiter
+
+"""
+Runs the hot paths of the library against the local mock futures server
+and reports their throughput and latency: kline backfills, single kline
+pages, signed order placement, cancel sweeps, portfolio sweeps, kline
+parsing and request signing. Results can be saved as a baseline, and
+later runs are compared to it so a regression shows up as a number.
+Args:
+    --latency:   seconds the mock adds to every answer (default 0.005)
+    --save:      write the results as the new baseline
+    --baseline:  baseline file (default benchmarks/baseline.json)
+    --tolerance: share a metric may worsen before it is flagged (default 0.25)
+    --only:      run only the named scenarios
+Returns:
+    prints one line per metric, exits 1 if a metric regressed
+"""
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q*len(samples)))]
+
+
+def timed(call, count):
+    ''' (calls per second, p50 ms, p99 ms) of count sequential calls '''
+    lat = []
+    t0  = time.perf_counter()
+    for _ in range(count):
+        t1 = time.perf_counter()
+        call()
+        lat.append(time.perf_counter() - t1)
+    total = time.perf_counter() - t0
+    return count/total, percentile(lat, 0.5)*1000, percentile(lat, 0.99)*1000
+
+
+def server(latency, **kwargs):
+    # limits are lifted, the limiter has its own benchmark and would only add waits here
+    return mockserver(latency=latency, weight_limit=10**9, **kwargs)
+
+
+def client(srv):
+    return srv.client(limiter=ratelimiter(weight_limit=10**9))
+
+
+def klines_backfill(latency):
+    with server(latency) as srv:
+        c = client(srv)
+        c.GetSymbolKlines('BTCUSDT', '1m', 10)
+        t0 = time.perf_counter()
+        df = c.GetSymbolKlinesExtra('BTCUSDT', '1m', 15000)
+        elapsed = time.perf_counter() - t0
+        c.close()
+    return {'candles_per_s': len(df)/elapsed, 'backfill_15000_ms': elapsed*1000}
+
+
+def klines_page(latency):
+    with server(latency) as srv:
+        c = client(srv)
+        rps, p50, p99 = timed(lambda: c.GetSymbolKlines('BTCUSDT', '1m', 1500), 50)
+        c.close()
+    return {'pages_per_s': rps, 'page_p50_ms': p50, 'page_p99_ms': p99}
+
+
+def order_place(latency):
+    with server(latency) as srv:
+        c = client(srv)
+        c.symbolinfo('BTCUSDT')
+        rps, p50, p99 = timed(lambda: c.place_limit_order('BTCUSDT', 'BUY', 0.01, 1000), 100)
+        c.close()
+    return {'orders_per_s': rps, 'order_p50_ms': p50, 'order_p99_ms': p99}
+
+
+def cancel_sweep(latency):
+    with server(latency) as srv:
+        c = client(srv)
+        c.PlaceBatchOrders([{'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'LIMIT', 'quantity': '0.01',
+                             'price': '1000', 'timeInForce': 'GTC'}]*50)
+        t0 = time.perf_counter()
+        c.cancel_all_orders('BTCUSDT')
+        sweep = time.perf_counter() - t0
+        c.PlaceBatchOrders([{'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'LIMIT', 'quantity': '0.01',
+                             'price': '1000', 'timeInForce': 'GTC'}]*50)
+        t0 = time.perf_counter()
+        for order in c.GetOpenOrders('BTCUSDT'):            # one cancel per order, as it used to be done
+            c.CancelOrder('BTCUSDT', order['orderId'])
+        single = time.perf_counter() - t0
+        c.close()
+    return {'sweep_50_ms': sweep*1000, 'sweep_50_one_by_one_ms': single*1000}
+
+
+def portfolio_sweep(latency):
+    with server(latency, symbols=80) as srv:
+        srv.positions = {symbol: ('1', '10') for symbol, *_ in srv.symbols}
+        c = client(srv)
+        t0 = time.perf_counter()
+        c.proctor_all(maxage=0)
+        sweep = time.perf_counter() - t0
+        c.close()
+    return {'proctor_all_83_ms': sweep*1000}
+
+
+def parse(latency):
+    srv  = mockserver()
+    now  = srv.now()//60000*60000
+    raw  = json.dumps([srv.candle('BTCUSDT', now - i*60000, 60000) for i in range(1500)]).encode()
+    count = 200
+    parse = timeit.timeit(lambda: klines.parse(raw), number=count)/count
+    frame = timeit.timeit(lambda: klines.frame(klines.parse(raw)), number=count)/count
+    srv.httpd.server_close()
+    return {'parse_1500_us': parse*1e6, 'frame_1500_us': frame*1e6}
+
+
+def sign(latency):
+    with server(latency) as srv:
+        c = client(srv)
+        params = {'symbol': 'BTCUSDT', 'side': 'BUY', 'type': 'LIMIT', 'quantity': '0.010',
+                  'price': '1000.0', 'timeInForce': 'GTC', 'recvWindow': 6000, 'timestamp': srv.now()}
+        count  = 20000
+        spent  = timeit.timeit(lambda: c.signRequest(params), number=count)/count
+        c.close()
+    return {'sign_us': spent*1e6}
+
+
+SCENARIOS = {'klines_backfill': klines_backfill, 'klines_page': klines_page, 'order_place': order_place,
+             'cancel_sweep': cancel_sweep, 'portfolio_sweep': portfolio_sweep, 'parse': parse, 'sign': sign}
+
+
+def worse(name, value, base, tolerance):
+    ''' True if a metric regressed, throughputs (_per_s) should not drop, times should not grow '''
+    if name.endswith('_per_s'):
+        return value < base*(1 - tolerance)
+    return value > base*(1 + tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='binapi benchmarks against the local mock server')
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--save', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--only', nargs='*', choices=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline.get('latency', args.latency) != args.latency:
+        print('baseline was recorded with latency {}, comparisons are off'.format(baseline['latency']))
+
+    results    = {}
+    regressed  = []
+    print('{:<18}{:<26}{:>12}{:>12}{:>9}'.format('scenario', 'metric', 'value', 'baseline', 'change'))
+    for name, scenario in SCENARIOS.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = scenario(args.latency)
+        for metric, value in results[name].items():
+            base = baseline.get('results', {}).get(name, {}).get(metric)
+            if base:
+                change = '{:+.0%}'.format(value/base - 1)
+                if worse(metric, value, base, args.tolerance):
+                    regressed.append('{}.{}'.format(name, metric))
+                    change += ' !'
+            else:
+                base, change = float('nan'), ''
+            print('{:<18}{:<26}{:>12.2f}{:>12.2f}{:>9}'.format(name, metric, value, base, change))
+
+    if args.save:
+        saved = baseline.get('results', {}) if args.only else {}
+        saved.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'latency': args.latency, 'python': sys.version.split()[0], 'results': saved}, f, indent=2)
+        print('baseline written to {}'.format(args.baseline))
+    if regressed:
+        print('regressed: ' + ', '.join(regressed))
+        sys.exit(1)
@@ -1,2 +1,14 @@
 from binapi.reqs import reqs as reqs
 from binapi.binapi import binance
+from binapi.store import klinestore
+from binapi.streams import marketstream, candlebuffer
+from binapi.orderbook import orderbook
+from binapi.portfolio import portfolio
+from binapi.orderindex import orderindex
+from binapi.resilience import retrypolicy, circuitbreaker
+from binapi.metrics import metrics
+from binapi.accounts import accounts
+from binapi.aiobinance import asyncbinance
+from binapi.snapshot import marketsnapshot
+from binapi.sharedbuffer import klinepublisher, klinereader
+from binapi.backtest import recorder, replayer, simexchange
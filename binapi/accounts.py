@@ -0,0 +1,137 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .binapi import binance
+from .reqs import reqs
+from .ratelimit import ratelimiter
+
+"""
+Here a manager of many binance accounts is defined. The accounts share
+one pooled transport and one rate limiter, whose request weight is
+shared, as binance counts it per IP, and whose order budgets are kept
+per account, plus one server clock and one copy of the exchange
+metadata. Loading them costs a single connectivity check, and the same
+operation can be run on every account in parallel, on a thread pool or
+from asyncio. A failing account only fails its own entry of the results.
+Args:
+    files:       key files, one per account, named after the file
+    credentials: {name: (api_key, secret_key)} of more accounts
+    base_url:    the api base url
+    pool_size:   keep-alive connections of the shared transport
+    workers:     threads running the operations of the accounts
+Returns:
+    {name: result} of every dispatched operation
+"""
+
+class accounts:
+
+    def __init__(self, files:list=None, credentials:dict=None, base_url:str='https://fapi.binance.com',
+                 pool_size:int=20, workers:int=16, metrics=None):
+        credentials  = dict(credentials or {})
+        files        = list(files or [])
+        # weight is counted per IP and shared, orders per account, by the api key of every call
+        self.limiter = ratelimiter()
+        self.reqs    = reqs(pool_size=pool_size, limiter=self.limiter, metrics=metrics)
+        self.pool    = ThreadPoolExecutor(max_workers=workers)
+        self.clients = {}
+        self.errors  = {}             # name -> exception of the accounts that could not be loaded
+
+        def load(name, kwargs):
+            return name, binance(base_url=base_url, transport=self.reqs, check=False, **kwargs)
+        jobs = [(os.path.splitext(os.path.basename(f))[0], {'filename': f}) for f in files]
+        jobs += [(name, {'api_key': key, 'secret_key': secret}) for name, (key, secret) in credentials.items()]
+        futures = [(name, self.pool.submit(load, name, kwargs)) for name, kwargs in jobs]
+        for name, future in futures:
+            try:
+                self.clients[name] = future.result()[1]
+            except Exception as e:
+                self.errors[name] = e
+        if not self.clients:
+            raise Exception("No account could be loaded: {}".format(self.errors))
+
+        # one clock and one exchangeInfo cache serve every account
+        first         = next(iter(self.clients.values()))
+        self.clock    = first.clock
+        self.exchange = first.exchange
+        for client in self.clients.values():
+            client.clock, client.exchange = self.clock, self.exchange
+            client.owns_clock = False
+        if self.clock.sync():
+            print('Connection Successful to the brokers API, {} accounts'.format(len(self.clients)))
+            self.clock.start()
+            # open the connections the parallel dispatches will need, all at once
+            self.reqs.warmup(first.basev1 + first.endpoints['ping'], workers)
+        else:
+            print('Connection Failed to the brokers API')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __getitem__(self, name):
+        return self.clients[name]
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self.clock.stop()
+        self.pool.shutdown(wait=False)
+        self.reqs.close()
+
+    @staticmethod
+    def _call(client, operation, args, kwargs):
+        if callable(operation):
+            return operation(client, *args, **kwargs)
+        return getattr(client, operation)(*args, **kwargs)
+
+    def dispatch(self, operation, *args, names:list=None, timeout:float=None, **kwargs):
+        '''
+        Runs an operation on every account in parallel
+
+        Parameters:
+        --
+            operation:         A binance method name, like 'setleverage', or a callable(client, *args)
+            names list:        The accounts to run it on, all of them if None
+            timeout float:     Seconds to wait for every account, None for ever
+        Returns {name: result}, the result of a failed account is its exception
+        '''
+        names   = list(self.clients) if names == None else names
+        futures = {name: self.pool.submit(self._call, self.clients[name], operation, args, kwargs) for name in names}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout)
+            except Exception as e:
+                results[name] = e
+        return results
+
+    async def gather(self, operation, *args, names:list=None, **kwargs):
+        ''' dispatch() for asyncio code, the calls run on the same thread pool '''
+        loop  = asyncio.get_running_loop()
+        names = list(self.clients) if names == None else names
+        calls = [loop.run_in_executor(self.pool, self._call, self.clients[name], operation, args, kwargs)
+                 for name in names]
+        return dict(zip(names, await asyncio.gather(*calls, return_exceptions=True)))
+
+    @staticmethod
+    def failed(results:dict):
+        ''' The accounts whose operation raised or came back with an error code '''
+        return {name: result for name, result in results.items()
+                if isinstance(result, Exception) or (isinstance(result, dict) and str(result.get('code', '200')) != '200')}
+
+    def set_leverage(self, symbol:str, leverage:int=1):
+        return self.dispatch('setleverage', symbol, leverage)
+
+    def flatten(self):
+        ''' Closes every open position of every account, returns {name: [symbols closed]} '''
+        def run(client):
+            symbols = client.portfolio.snapshot(0).open_positions()
+            with ThreadPoolExecutor(max(1, min(8, len(symbols)))) as pool:
+                list(pool.map(client.closeposition, symbols))
+            return symbols
+        return self.dispatch(run)
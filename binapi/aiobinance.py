@@ -0,0 +1,382 @@
+import asyncio
+import json
+import time
+from .binapi import binance, whichside, reverse
+from .aioreqs import aioreqs
+from .portfolio import protected
+from . import klines
+
+"""
+Here the asyncio client is defined, a twin of binance whose calls are
+coroutines. It stands on a binance instance for the keys, the server
+clock, the cached exchange information, the rate limiter and the metrics,
+and its calls go out on an aioreqs, so many symbols can be watched or
+traded from one event loop. Calls that only build their params and send
+them are the very methods of binance, the params, the signing and the
+validation of orders are shared, only the sending is awaited. The
+shared helpers that read the trading rules of a symbol would download
+them when missing, so the calls that place orders load them first, off
+the event loop. Every public call of binance has its twin here.
+Args:
+    filename:    full path to a text file containing api access keys
+    client:      a binance instance to stand on, instead of keys
+    pool_size:   keep-alive connections of the async transport
+    concurrency: calls allowed on the wire at the same time
+Returns:
+    data
+"""
+
+def _ruled(method):
+    ''' A place_* call of binance that loads the rules of its symbol off the event loop first '''
+    async def place(self, symbol, *args, **kwargs):
+        await self._rules(symbol)
+        return await method(self, symbol, *args, **kwargs)
+    place.__name__ = method.__name__
+    place.__doc__  = method.__doc__
+    return place
+
+class asyncbinance:
+
+    recvWindow      = binance.recvWindow
+    mxlimit         = binance.mxlimit
+    prec            = binance.prec
+    KLINE_INTERVALS = binance.KLINE_INTERVALS
+    INTERVAL_DETAIL = binance.INTERVAL_DETAIL
+
+    # shared with binance, they return what _signed or reqs return, here a coroutine to await
+    symbolinfo                = binance.symbolinfo
+    round_price               = binance.round_price
+    round_quantity            = binance.round_quantity
+    signRequest               = binance.signRequest
+    servertime                = binance.servertime
+    tighten_recv_window       = binance.tighten_recv_window
+    floatToString             = binance.floatToString
+    _stamped                  = binance._stamped
+    _klines_params            = binance._klines_params
+    _klines_data              = binance._klines_data
+    _klines_out               = binance._klines_out
+    _order_params             = binance._order_params
+    _batch_chunks             = binance._batch_chunks
+    _bracket_orders           = binance._bracket_orders
+    _iter_start               = binance._iter_start
+    _iter_page                = staticmethod(binance._iter_page)
+    _subdata_params           = binance._subdata_params
+    _subdata_windows          = binance._subdata_windows
+    _subdata_split            = binance._subdata_split
+    GetAccountData            = binance.GetAccountData
+    GetPositionData           = binance.GetPositionData
+    GetOpenOrders             = binance.GetOpenOrders
+    Get24hrTicker             = binance.Get24hrTicker
+    GetOrderBook              = binance.GetOrderBook
+    CancelOrder               = binance.CancelOrder
+    CancelAllOpenOrders       = binance.CancelAllOpenOrders
+    GetOrderInfo              = binance.GetOrderInfo
+    GetOrderHistory           = binance.GetOrderHistory
+    place_limit_order         = _ruled(binance.place_limit_order)
+    place_market_order        = _ruled(binance.place_market_order)
+    place_redOnly_limit_order = _ruled(binance.place_redOnly_limit_order)
+    place_tp_limit_order      = _ruled(binance.place_tp_limit_order)
+    place_tp_market_order     = _ruled(binance.place_tp_market_order)
+    place_sl_limit_order      = _ruled(binance.place_sl_limit_order)
+    place_sl_market_order     = _ruled(binance.place_sl_market_order)
+
+    def __init__(self, filename=None, base_url='https://fapi.binance.com', pool_size:int=100,
+                 concurrency:int=None, limiter=None, metrics=None, api_key:str=None, secret_key:str=None,
+                 client=None):
+        self.owns_client = client == None
+        if client == None:
+            client = binance(filename, base_url=base_url, limiter=limiter, metrics=metrics,
+                             api_key=api_key, secret_key=secret_key, check=False)
+        self.client    = client                  # serves the clock and the exchange information
+        self.basev1    = client.basev1
+        self.basev2    = client.basev2
+        self.endpoints = client.endpoints
+        self.headers   = client.headers
+        self.hmac      = client.hmac
+        self.limiter   = client.limiter
+        self.metrics   = client.metrics
+        self.clock     = client.clock
+        self.exchange  = client.exchange
+        self.portfolio = client.portfolio
+        self.reqs      = aioreqs(headers=self.headers, pool_size=pool_size, limiter=self.limiter,
+                                 metrics=self.metrics, concurrency=concurrency)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self):
+        ''' Syncs the clock and reads the exchange information, off the event loop '''
+        if await asyncio.to_thread(self.clock.sync):
+            print('Connection Successful to the brokers API')
+            self.clock.start()
+            await asyncio.to_thread(self.exchange.refresh)
+        else:
+            print('Connection Failed to the brokers API')
+        return self
+
+    async def close(self):
+        ''' Shuts down the pooled connections, and the binance instance if it was made here '''
+        await self.reqs.close()
+        if self.owns_client:
+            self.client.close()
+
+    async def test_connectivity(self):
+        return await asyncio.to_thread(self.clock.sync)
+
+    async def _signed(self, method:str, url:str, params:dict, lookup=None):
+        ''' Stamps a request with the server time, signs and sends it,
+            every retry of the request is stamped and signed again '''
+        query = self._stamped(params)
+        if method == 'POST':
+            data = await self.reqs._post(url, params=query, headers=self.headers, lookup=lookup)
+        else:
+            send = {'GET': self.reqs._get, 'PUT': self.reqs._put, 'DELETE': self.reqs._delete}[method]
+            data = await send(url, params=query, headers=self.headers)
+        if method != 'GET':
+            self.portfolio.invalidate()
+        if isinstance(data, dict) and data.get('code') == -1021:
+            self.clock.resync()
+        return data
+
+    async def _rules(self, *symbols):
+        ''' Loads the trading rules of the symbols off the event loop, when they are not cached yet '''
+        if any(symbol not in self.exchange.symbols for symbol in symbols):
+            await asyncio.to_thread(lambda: [self.symbolinfo(symbol) for symbol in symbols])
+
+    async def _lookup_order(self, symbol:str, clientOrderId:str):
+        ''' The order of a client order id, None if binance does not know it '''
+        url  = self.basev1 + self.endpoints['order']
+        data = await self._signed('GET', url, {'symbol': symbol, 'origClientOrderId': clientOrderId})
+        if isinstance(data, dict) and data.__contains__('orderId'):
+            return data
+        return None
+
+    async def GetAllSymbols(self, quoteAssets:list=None, refresh:bool=False):
+        ''' binance.GetAllSymbols, off the event loop '''
+        return await asyncio.to_thread(self.client.GetAllSymbols, quoteAssets, refresh)
+
+    async def GetSymbolKlines(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None, start_time=None,
+                              fmt:str='pandas', extra:bool=False):
+        ''' binance.GetSymbolKlines, awaited '''
+        if limit > self.mxlimit and start_time == None:
+            return await self.GetSymbolKlinesExtra(symbol, interval, limit, end_time, fmt=fmt)
+        url  = self.basev1 + self.endpoints['klines']
+        data = await self.reqs._get(url, self._klines_params(symbol, interval, limit, end_time, start_time),
+                                    raw=True)
+        return self._klines_data(symbol, data, fmt, extra)
+
+    async def GetSymbolKlinesExtra(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None,
+                                   fmt:str='pandas'):
+        ''' binance.GetSymbolKlinesExtra, the older pages are all awaited at once '''
+        initial_limit = limit % self.mxlimit or self.mxlimit
+        df = await self.GetSymbolKlines(symbol, interval, limit=initial_limit, end_time=end_time, fmt='numpy')
+        if limit <= initial_limit or not len(df['time']):
+            return self._klines_out(df, fmt)
+
+        pages = -(-(limit - initial_limit)//self.mxlimit)
+        if interval == '1M':
+            frames = [df]
+            for _ in range(pages):
+                frames.insert(0, await self.GetSymbolKlines(symbol, interval, limit=self.mxlimit,
+                                                            end_time=frames[0]['time'][0] - 1, fmt='numpy'))
+                if not len(frames[0]['time']):
+                    break
+        else:
+            width  = self.INTERVAL_DETAIL[interval]['insec']*1000
+            ends   = [df['time'][0] - width - page*self.mxlimit*width for page in range(pages)]
+            frames = await asyncio.gather(*(self.GetSymbolKlines(symbol, interval, limit=self.mxlimit, end_time=end,
+                                                                 fmt='numpy') for end in ends))
+            frames = frames[::-1] + [df]
+
+        df = klines.merge(frames)
+        while len(df['time']) < limit:
+            older = await self.GetSymbolKlines(symbol, interval, limit=min(self.mxlimit, limit - len(df['time'])),
+                                               end_time=df['time'][0] - 1, fmt='numpy')
+            if not len(older['time']):
+                break
+            df = klines.merge([older, df])
+        return self._klines_out({name: values[-limit:] for name, values in df.items()}, fmt)
+
+    async def GetSymbolKlinesRange(self, symbol:str, interval:str, start_time:int, end_time:int,
+                                   fmt:str='pandas'):
+        ''' binance.GetSymbolKlinesRange, every page is awaited at once '''
+        if interval == '1M':
+            frames = [await self.GetSymbolKlines(symbol, interval, self.mxlimit, end_time, start_time, fmt='numpy')]
+            while len(frames[-1]['time']) == self.mxlimit:
+                frames.append(await self.GetSymbolKlines(symbol, interval, self.mxlimit, end_time,
+                                                         frames[-1]['time'][-1] + 1, fmt='numpy'))
+            return self._klines_out(klines.merge(frames), fmt)
+
+        span    = self.INTERVAL_DETAIL[interval]['insec']*1000*self.mxlimit
+        windows = [(start, min(end_time, start + span - 1)) for start in range(int(start_time), int(end_time) + 1, span)]
+        frames  = await asyncio.gather(*(self.GetSymbolKlines(symbol, interval, self.mxlimit, end, start, fmt='numpy')
+                                         for start, end in windows))
+        return self._klines_out(klines.merge(frames), fmt)
+
+    async def IterSymbolKlines(self, symbol:str, interval:str, start_time=None, end_time=None, limit:int=None,
+                               chunk:int=mxlimit, newest_first:bool=False, prefetch:bool=True, fmt:str='pandas'):
+        ''' binance.IterSymbolKlines as an async generator, the next chunk is awaited in a task '''
+        start_time = self._iter_start(interval, start_time, end_time, limit, newest_first)
+        chunk      = max(1, min(chunk, self.mxlimit))
+
+        def fetch(cursor, count):
+            if newest_first:
+                return self.GetSymbolKlines(symbol, interval, count, end_time=cursor, fmt='numpy')
+            return self.GetSymbolKlines(symbol, interval, count, end_time=end_time, start_time=cursor, fmt='numpy')
+
+        cursor = end_time if newest_first else start_time
+        left   = limit
+        ahead  = None
+        try:
+            page = await fetch(cursor, chunk if left == None else min(chunk, left))
+            while len(page['time']):
+                page, left, last, cursor = self._iter_page(page, start_time, left, chunk, newest_first)
+                if not len(page['time']):
+                    break                           # the candles left were all before start_time
+                ahead  = None
+                if not last:
+                    size  = chunk if left == None else min(chunk, left)
+                    ahead = asyncio.ensure_future(fetch(cursor, size)) if prefetch else (cursor, size)
+                yield self._klines_out(page, fmt)
+                if ahead == None:
+                    break
+                page = await ahead if prefetch else await fetch(*ahead)
+        finally:
+            if prefetch and ahead != None and not ahead.done():
+                ahead.cancel()
+
+    async def GetSymbolSubData(self, symbol:str, interval:str, start_time:int, subinterval:str, fmt:str='pandas'):
+        ''' binance.GetSymbolSubData, awaited '''
+        limit, end_time = self._subdata_params(interval, start_time, subinterval)
+        return await self.GetSymbolKlines(symbol, subinterval, limit=limit, end_time=end_time, fmt=fmt)
+
+    async def GetSymbolSubDataBulk(self, symbol:str, interval:str, start_times:list, subinterval:str,
+                                   fmt:str='pandas'):
+        ''' binance.GetSymbolSubDataBulk, every page is awaited at once '''
+        starts, ends, windows = self._subdata_windows(interval, start_times, subinterval)
+        width = self.INTERVAL_DETAIL[subinterval]['insec']*1000
+        parts = await asyncio.gather(*(self.GetSymbolKlines(symbol, subinterval, (end - start)//width + 1,
+                                                            end, start, fmt='numpy') for start, end in windows))
+        return self._subdata_split(list(parts), starts, ends, fmt)
+
+    async def setleverage(self, symbol, leverage:int=1):
+        if leverage<1 or leverage>125:
+            raise Exception("leverage is not standard")
+        await self._signed('POST', self.basev1 + self.endpoints['leverage'], {'symbol': symbol, 'leverage': leverage})
+        await self._signed('POST', self.basev1 + self.endpoints['marginType'], {'symbol': symbol, 'marginType': 'ISOLATED'})
+        return True
+
+    async def PlaceOrder(self, params:dict, test:bool=True):
+        ''' binance.PlaceOrder, awaited '''
+        await self._rules(params['symbol'])
+        return await binance.PlaceOrder(self, params, test)
+
+    async def PlaceBatchOrders(self, orders:list):
+        ''' binance.PlaceBatchOrders, the chunks of 5 orders are sent at once '''
+        await self._rules(*{order['symbol'] for order in orders})
+        url = self.basev1 + self.endpoints['batchOrders']
+        async def place(chunk):
+            async def lookup():
+                found = await asyncio.gather(*(self._lookup_order(order['symbol'], order['newClientOrderId'])
+                                               for order in chunk))
+                return None if None in found else list(found)
+            data = await self._signed('POST', url, {'batchOrders': json.dumps(chunk, separators=(',', ':'))}, lookup)
+            return data if isinstance(data, list) else [data]*len(chunk)
+        chunks = await asyncio.gather(*(place(chunk) for chunk in self._batch_chunks(orders)))
+        return [result for chunk in chunks for result in chunk]
+
+    async def CancelBatchOrders(self, symbol:str, orderIds:list):
+        ''' binance.CancelBatchOrders, the chunks of 10 orders are sent at once '''
+        url = self.basev1 + self.endpoints['batchOrders']
+        async def cancel(chunk):
+            data = await self._signed('DELETE', url, {'symbol': symbol,
+                                                      'orderIdList': json.dumps(chunk, separators=(',', ':'))})
+            return data if isinstance(data, list) else [data]*len(chunk)
+        chunks = [[int(orderId) for orderId in orderIds[i:i + 10]] for i in range(0, len(orderIds), 10)]
+        chunks = await asyncio.gather(*(cancel(chunk) for chunk in chunks))
+        return [result for chunk in chunks for result in chunk]
+
+    async def GetAllOrderInfo(self, symbol, status:str='NEW'):
+        ''' binance.GetAllOrderInfo, awaited '''
+        if status in ('NEW', 'PARTIALLY_FILLED'):
+            data = await self.GetOpenOrders(symbol)
+        else:
+            data = await self.GetOrderHistory(symbol)
+        if status == 'ALL':
+            return data
+        return [order for order in data if order['status'] == status]
+
+    async def place_bracket_order(self, symbol, side, quantity, price, tp_stprice, sl_stprice,
+                                  tp_price=None, sl_price=None):
+        ''' binance.place_bracket_order, awaited '''
+        await self._rules(symbol)
+        entry, tp, sl = await self.PlaceBatchOrders(self._bracket_orders(symbol, side, quantity, price, tp_stprice,
+                                                                         sl_stprice, tp_price, sl_price))
+        return {'entry': entry, 'tp': tp, 'sl': sl}
+
+    async def cancel_all_orders(self, symbol):
+        ''' Cancels every open order of a symbol in one request,
+            False if it had no open order to cancel '''
+        if not await self.GetOpenOrders(symbol):
+            return False
+        data = await self.CancelAllOpenOrders(symbol)
+        return isinstance(data, dict) and str(data.get('code')) == '200'
+
+    async def proctor(self, symbol):
+        position           = (await self.GetPositionData(symbol))[0]
+        posamt_signed      = position['positionAmt']
+        if posamt_signed=='0.000':
+            return None
+        else:
+            neworders      = await self.GetAllOrderInfo(symbol)
+            if protected(neworders):
+                print('position is safe!')
+                return 'PROTECTED'
+            print('position is not safe! Need to close emergentically')
+            return 'NOT PROTECTED'
+
+    async def proctor_all(self, maxage:float=None):
+        ''' binance.proctor_all, off the event loop '''
+        return await asyncio.to_thread(self.portfolio.protection, maxage)
+
+    async def closeposition(self, symbol):
+        position           = (await self.GetPositionData(symbol))[0]
+        posamt_signed      = position['positionAmt']
+        if not (posamt_signed=='0.000'):
+            posamt         = str(abs(float(posamt_signed)))
+            side           = whichside(position['entryPrice'], position['liquidationPrice'])
+            # the close and the cancel of the protecting orders go out together
+            await asyncio.gather(self.place_market_order(symbol, reverse(side), posamt, True),
+                                 self.cancel_all_orders(symbol))
+            return True
+        else:
+            return False
+
+
+    async def pending_tofill_order(self, symbol, orderId, durab:int=60, poll:float=1):
+        ''' binance.pending_tofill_order, awaited, on the user data stream of the binance instance when started '''
+        endtime = time.time() + durab
+        if self.client.userstream != None:
+            order = await self.client.userstream.wait_async(symbol, orderId, timeout=durab)
+            if order == None:
+                order = await self.GetOrderInfo(symbol, orderId)    # it may have filled unseen by the stream
+            if order.get('status') == 'FILLED':
+                print('Order number {} filled successfully'.format(orderId))
+                return True
+            if order.get('status') not in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                await self.CancelOrder(symbol, orderId)
+            return False
+        while True:
+            order = await self.GetOrderInfo(symbol, orderId)
+            if order.get('status') == 'FILLED':
+                print('Order number {} filled successfully'.format(orderId))
+                return True
+            if order.get('status') in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                return False
+            if time.time() > endtime:
+                await self.CancelOrder(symbol, orderId)
+                return False
+            await asyncio.sleep(min(poll, max(0, endtime - time.time())))
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+from .ratelimit import ratelimiter
+from .metrics import metrics as _metrics
+from .resilience import retrypolicy, circuitbreaker, classify, sent, NETWORK, SERVER, RATELIMIT, BUSINESS
+
+aiohttp = None                            # imported by the first aioreqs, it is slow to import and optional
+
+"""
+Here the asyncio twin of reqs is defined. Calls go out on one aiohttp
+session whose connector keeps up to `pool_size` keep-alive connections,
+so thousands of calls can be in flight on a single event loop while at
+most `concurrency` of them are on the wire. Calls go through the same
+rate limiter, retry policy, circuit breakers and metrics as reqs, and
+the _get/_post/_put/_delete methods take the same arguments, only they
+are coroutines.
+Args:
+    headers:     default headers sent with every request
+    pool_size:   number of keep-alive connections kept open
+    timeout:     seconds to wait for the server before giving up
+    limiter:     the weight-aware rate limiter every call goes through,
+                 a new one if not given
+    policy:      the retrypolicy of failed calls, a default one if not given
+    metrics:     where latencies and counts are recorded, a disabled one
+                 if not given
+    concurrency: calls allowed on the wire at the same time, pool_size if not given
+Returns:
+    data
+"""
+
+class aioreqs:
+
+    def __init__(self, headers=None, pool_size:int=100, timeout=10, limiter=None, policy=None, metrics=None,
+                 concurrency:int=None):
+        global aiohttp, URL
+        if aiohttp == None:
+            try:
+                import aiohttp
+                from yarl import URL
+            except ImportError:
+                raise Exception("aioreqs needs the aiohttp package")
+        self.headers     = dict(headers or {})
+        self.pool_size   = pool_size
+        self.timeout     = timeout
+        self.limiter     = limiter if limiter is not None else ratelimiter()
+        self.policy      = policy if policy is not None else retrypolicy()
+        self.metrics     = metrics if metrics is not None else _metrics(enabled=False)
+        self.concurrency = concurrency or pool_size
+        self.breakers    = {}            # endpoint -> circuitbreaker
+        self.session     = None          # made on first use, it belongs to the running loop
+        self.slots       = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            connector    = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.slots   = asyncio.Semaphore(self.concurrency)
+        return self.session
+
+    async def warmup(self, url, connections:int=1):
+        ''' Opens up to `connections` pooled connections to the host of url ahead of time '''
+        connections = max(1, min(connections, self.pool_size))
+        results     = await asyncio.gather(*(self._get(url) for _ in range(connections)))
+        return results[0]
+
+    async def close(self):
+        ''' Closes every pooled connection '''
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def breaker(self, url):
+        ''' The circuit breaker of the endpoint of a url '''
+        name = ratelimiter.endpoint(url)
+        if name not in self.breakers:
+            self.breakers[name] = circuitbreaker()
+        return self.breakers[name]
+
+    async def _send(self, method, url, params=None, headers=None):
+        """ Sends a request once the rate limiter lets it through,
+            returns (status, headers, body) """
+        weight, orders, priority = self.limiter.cost(method, url, params)
+        account = headers.get('X-MBX-APIKEY') if headers else None     # orders are counted per account
+        session = self._session()
+        queued  = time.time()
+        async with self.slots:
+            await self.limiter.acquire_async(weight, orders, priority, account)
+            started = time.time()
+            if params:
+                # a signed query is sent as it is, the signature covers its exact text
+                query = params if isinstance(params, str) else urlencode(params)
+                url   = URL(url + '?' + query, encoded=True)
+            async with session.request(method, url, headers=headers) as response:
+                body = await response.read()
+                status, received = response.status, response.headers
+        self.limiter.update(received, status, started, account)
+        if self.metrics.enabled:
+            name = ratelimiter.endpoint(str(url))
+            self.metrics.observe('request', name, time.time() - started)
+            self.metrics.observe('queue', name, started - queued)
+            self.metrics.inc('calls', name)
+            self.metrics.inc('weight', name, weight)
+        return status, received, body
+
+    async def _request(self, method, url, params=None, headers=None, raw:bool=False, lookup=None):
+        """ Sends a request under the retry policy and the circuit breaker of its endpoint,
+            like reqs._request. lookup may be a coroutine function """
+        breaker  = self.breaker(url)
+        data     = None
+        executed = False
+        for attempt in range(self.policy.retries + 1):
+            if attempt:
+                self.metrics.inc('retries', ratelimiter.endpoint(url))
+                await asyncio.sleep(self.policy.delay(attempt - 1, retry_after))
+                if executed and lookup is not None:
+                    found = lookup()
+                    if asyncio.iscoroutine(found):
+                        found = await found
+                    if found is not None:
+                        return found
+            if not breaker.allow():
+                return {'code': -1, 'kind': 'circuit', 'url': url,
+                        'msg': 'Circuit open on {}, {} failures in a row'.format(url, breaker.failures)}
+            retry_after = None
+            query       = params() if callable(params) else params     # signed calls sign every attempt anew
+            try:
+                status, received, body = await self._send(method, url, query, headers)
+            except Exception as e:
+                kind, executed = NETWORK, sent(e)
+                data = {'code': -1, 'kind': NETWORK, 'url': url, 'msg': e}
+            else:
+                retry_after = received.get('Retry-After')
+                try:
+                    with self.metrics.stage(ratelimiter.endpoint(url), 'decode'):
+                        data = json.loads(body) if not raw or status >= 400 else None
+                except ValueError:
+                    data = {'code': -1, 'url': url, 'msg': body.decode('utf-8', 'replace')}
+                kind     = classify(status, data)
+                executed = kind != RATELIMIT
+                if kind is None or kind == BUSINESS:
+                    if kind == BUSINESS:
+                        self.metrics.inc('errors_' + kind, ratelimiter.endpoint(url))
+                    breaker.success()
+                    return body if raw and kind is None else data
+                data = dict(data, kind=kind) if isinstance(data, dict) else data
+            self.metrics.inc('errors_' + kind, ratelimiter.endpoint(url))
+            if kind in (NETWORK, SERVER):
+                breaker.failure()
+            else:
+                breaker.release()                   # rate limited, says nothing of the endpoint
+            if not self.policy.retry(method, kind, executed) and lookup is None:
+                break
+        print("Request to {} failed: {}".format(url, data.get('msg') if isinstance(data, dict) else data))
+        return data
+
+    async def _get(self, url, params=None, headers=None, raw:bool=False):
+        """ Makes a Get Request, raw returns the undecoded body """
+        return await self._request('GET', url, params, headers, raw=raw)
+
+    async def _post(self, url, params=None, headers=None, lookup=None):
+        """ Makes a Post Request """
+        return await self._request('POST', url, params, headers, lookup=lookup)
+
+    async def _put(self, url, params=None, headers=None):
+        """ Makes a Put Request """
+        return await self._request('PUT', url, params, headers)
+
+    async def _delete(self, url, params=None, headers=None):
+        """ Makes a delete Request """
+        return await self._request('DELETE', url, params, headers)
@@ -0,0 +1,761 @@
+import gzip
+import heapq
+import json
+import os
+import threading
+import numpy as np
+from bisect import bisect_left
+from urllib.parse import parse_qsl
+from .reqs import reqs
+from .ratelimit import ratelimiter
+from .exchangeinfo import symbolinfo
+from . import klines
+from . import resample
+from .metrics import metrics as _metrics
+
+"""
+Here the transports of backtests are defined, they sit under binance in
+place of reqs and take the same _get/_post/_put/_delete calls.
+A recorder passes every call on to a real transport and writes what came
+back to a gzipped json-lines file, a replayer answers the same calls from
+such a file, so a session can be run again without the network.
+A simexchange is a matching engine over historical candles: it serves
+the klines, the exchange information, the orders and the positions of a
+futures account, and steps through the candles one at a time, filling the
+working orders on the way. Strategy code runs unchanged on a binance made
+with transport=simexchange(...), as fast as the candles can be stepped,
+and the same data and calls always give the same fills.
+Fills are decided on the path of every candle, open, low, high, close for
+a rising candle and open, high, low, close for a falling one: an order is
+filled at its price where the path crosses it, or at the open when the
+candle gaps through it. Only closed candles are served, the clock of the
+simulation is the close of the last stepped candle. Caches of binance
+that age by the wall clock, like the portfolio, still do.
+Args:
+    path:       the recording, written by a recorder and read by a replayer
+    candles:    {symbol: candles} of a simexchange, GetSymbolKlines frames,
+                numpy columns (fmt='numpy') or klinestore records, all of one interval
+    interval:   the interval of the candles, the simulation steps by it
+Returns:
+    data
+"""
+
+VOLATILE = ('timestamp', 'signature', 'recvWindow', 'newClientOrderId')   # differ between two runs
+
+
+def _query(params):
+    ''' The params of a call as a dict, whether given as a dict, a query string or a signing callable '''
+    if callable(params):
+        params = params()
+    if not params:
+        return {}
+    if isinstance(params, str):
+        return dict(parse_qsl(params, keep_blank_values=True))
+    return dict(params)
+
+
+def callkey(method:str, url:str, params=None):
+    ''' What identifies a call in a recording: its method, endpoint and params, without the ones
+        that change from one run to the next, like the timestamp or the client order ids '''
+    query = {k: v for k, v in _query(params).items() if k not in VOLATILE}
+    if 'batchOrders' in query:
+        orders = [{k: v for k, v in order.items() if k not in VOLATILE} for order in json.loads(query['batchOrders'])]
+        query['batchOrders'] = json.dumps(orders, sort_keys=True, separators=(',', ':'))
+    return [method, ratelimiter.endpoint(url), sorted([k, str(v)] for k, v in query.items())]
+
+
+class recorder:
+
+    def __init__(self, path:str, transport=None, **kwargs):
+        '''
+        Parameters:
+        --
+            path str:          The file to write, gzipped json lines
+            transport reqs:    The transport that really sends the calls, a new reqs made of kwargs if None
+        '''
+        self.transport = transport if transport != None else reqs(**kwargs)
+        self.limiter   = self.transport.limiter
+        self.metrics   = self.transport.metrics
+        self.path      = os.path.expanduser(path)
+        self.lock      = threading.Lock()
+        self.calls     = 0
+        self.file      = gzip.open(self.path, 'wt', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record(self, method, url, params, data):
+        raw  = isinstance(data, bytes)
+        body = data.decode('utf-8') if raw else json.dumps(data, separators=(',', ':'), default=str)
+        line = json.dumps(callkey(method, url, params) + [raw, body], separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.calls += 1
+        return data
+
+    def warmup(self, url, connections:int=1):
+        return self.transport.warmup(url, connections)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        ''' Closes the recording, and the transport if it was made here '''
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        self.transport.close()
+
+    def _get(self, url, params=None, headers=None, raw:bool=False, hedge=None):
+        return self._record('GET', url, params, self.transport._get(url, params, headers, raw=raw, hedge=hedge))
+
+    def _post(self, url, params=None, headers=None, lookup=None):
+        return self._record('POST', url, params, self.transport._post(url, params, headers, lookup=lookup))
+
+    def _put(self, url, params=None, headers=None):
+        return self._record('PUT', url, params, self.transport._put(url, params, headers))
+
+    def _delete(self, url, params=None, headers=None):
+        return self._record('DELETE', url, params, self.transport._delete(url, params, headers))
+
+
+class replayer:
+
+    def __init__(self, path:str, limiter=None, metrics=None):
+        '''
+        Answers calls from a recording. The answers of a call made several times are
+        served in the recorded order, the last one again once they run out
+
+        Parameters:
+        --
+            path str:          A recording written by a recorder
+        '''
+        self.path    = os.path.expanduser(path)
+        self.limiter = limiter if limiter is not None else ratelimiter()     # never waited on
+        self.metrics = metrics if metrics is not None else _metrics(enabled=False)
+        self.lock    = threading.Lock()
+        self.answers = {}            # call key -> [(raw, body), ...]
+        self.served  = {}            # call key -> answers served
+        self.missed  = 0
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                method, endpoint, query, raw, body = json.loads(line)
+                key = json.dumps([method, endpoint, query])
+                self.answers.setdefault(key, []).append((raw, body))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self):
+        ''' Serves every call from its first recorded answer again '''
+        with self.lock:
+            self.served = {}
+
+    def _answer(self, method, url, params, raw:bool=False):
+        key = json.dumps(callkey(method, url, params))
+        with self.lock:
+            answers = self.answers.get(key)
+            if not answers:
+                self.missed += 1
+                return {'code': -1, 'kind': 'replay', 'url': url,
+                        'msg': 'No recorded answer to {} {}'.format(method, ratelimiter.endpoint(url))}
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+            wasraw, body = answers[min(served, len(answers) - 1)]
+        if wasraw:
+            return body.encode('utf-8') if raw else json.loads(body)
+        return json.loads(body)      # decoded anew, callers may change what they get
+
+    def warmup(self, url, connections:int=1):
+        return self._answer('GET', url, None)
+
+    def close(self):
+        pass
+
+    def _get(self, url, params=None, headers=None, raw:bool=False, hedge=None):
+        return self._answer('GET', url, params, raw)
+
+    def _post(self, url, params=None, headers=None, lookup=None):
+        return self._answer('POST', url, params)
+
+    def _put(self, url, params=None, headers=None):
+        return self._answer('PUT', url, params)
+
+    def _delete(self, url, params=None, headers=None):
+        return self._answer('DELETE', url, params)
+
+
+class simclock:
+    ''' The clock of a simexchange, in place of a clocksync, it is never synced '''
+
+    rtt     = None
+    latency = None
+    offset  = 0
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    def now(self):
+        return self.exchange.now
+
+    def sync(self):
+        return True
+
+    def resync(self):
+        pass
+
+    def start(self, sync:bool=False):
+        pass
+
+    def stop(self):
+        pass
+
+    def recv_window(self, margin:float=250, minimum:int=1000, maximum:int=60000):
+        return maximum
+
+
+def _columns(data):
+    ''' Candles as contiguous time, open, high, low, close and volume columns, by open time '''
+    columns = {name: np.asarray(data[name], dtype=np.int64 if name == 'time' else np.float64)
+               for name in klines.COLUMNS}
+    order   = np.argsort(columns['time'], kind='stable')
+    return {name: np.ascontiguousarray(values[order]) for name, values in columns.items()}
+
+
+def _decimals(values):
+    ''' The fewest decimals, up to 8, that write all the values '''
+    values = np.asarray(values, dtype=np.float64)
+    for decimals in range(8):
+        if not len(values) or np.abs(np.round(values, decimals) - values).max() < 10.0**-(decimals + 3):
+            return decimals
+    return 8
+
+
+def _at(path, position:float):
+    ''' The price on a candle path at a position, 0 the open, len(path)-1 the close '''
+    k = min(int(position), len(path) - 2)
+    return path[k] + (path[k + 1] - path[k])*(position - k)
+
+
+def _cross(path, level:float, below:bool, start:float=0.0):
+    ''' The first (position, price) on a candle path, from start on, where the price is at or
+        below level (below) or at or above it, None if it never is '''
+    price = _at(path, start)
+    if price <= level if below else price >= level:
+        return start, price                     # already there, like a gap through the level
+    for k in range(int(start), len(path) - 1):
+        a, b = path[k], path[k + 1]
+        if b <= level if below else b >= level:
+            return k + (level - a)/(b - a), level
+    return None
+
+
+def _true(value):
+    return str(value).lower() == 'true'
+
+
+class simexchange:
+
+    TYPES = ('LIMIT', 'MARKET', 'STOP', 'STOP_MARKET', 'TAKE_PROFIT', 'TAKE_PROFIT_MARKET')
+    QUOTES = ('USDT', 'BUSD', 'USDC', 'BTC')
+
+    def __init__(self, candles:dict, interval:str='1m', start=None, balance:float=10000, leverage:int=1,
+                 maker:float=0.0002, taker:float=0.0004, slippage:float=0.0, rules:list=None, replay=None):
+        '''
+        Parameters:
+        --
+            candles dict:      {symbol: candles}, frames, numpy columns or klinestore records
+            interval str:      The interval of the candles, the simulation steps by it
+            start int:         The time in ms the simulation starts at, the candles closed by then
+                               are history, after the first candle if None
+            balance float:     The wallet balance, in the quote asset
+            leverage int:      The leverage of every symbol until setleverage
+            maker float:       The fee rate of resting orders
+            taker float:       The fee rate of market orders and of orders filled on arrival
+            slippage float:    The share of the price market fills lose
+            rules list:        exchangeInfo symbols giving the tick and step sizes, taken from the
+                               replay if there is one, otherwise made up from the prices
+            replay replayer:   Answers the calls that are not simulated, like depth
+        '''
+        if interval not in resample.WIDTHS:
+            raise Exception("A simexchange steps by a fixed interval, not {}".format(interval))
+        if not candles:
+            raise Exception("A simexchange needs the candles of at least one symbol")
+        self.interval  = interval
+        self.width     = resample.WIDTHS[interval]
+        self.candles   = {symbol: _columns(data) for symbol, data in candles.items()}
+        self.times     = np.unique(np.concatenate([columns['time'] for columns in self.candles.values()]))
+        self.maker     = maker
+        self.taker     = taker
+        self.slippage  = slippage
+        self.balance   = float(balance)
+        self.replay    = replay
+        self.limiter   = ratelimiter()                  # never waited on
+        self.metrics   = _metrics(enabled=False)
+        self.clock     = simclock(self)
+        self.lock      = threading.RLock()
+        self.orders    = {}                             # orderId -> order, as the api gives it
+        self.clientIds = {}                             # clientOrderId -> orderId
+        self.orderIds  = 0
+        self.history   = {symbol: [] for symbol in self.candles}       # orderIds of every symbol
+        self.working   = {symbol: {} for symbol in self.candles}       # orderId -> spec of the open orders
+        self.positions = {symbol: [0.0, 0.0] for symbol in self.candles}   # [amount, entry price]
+        self.leverage  = {symbol: int(leverage) for symbol in self.candles}
+        self.margin    = {symbol: 'cross' for symbol in self.candles}
+        self.trades    = []
+        self.series    = {}                             # (symbol, interval) -> (times, closes, rows)
+        self.routes    = {('GET', 'time'):           self.time,
+                          ('GET', 'ping'):           self.ping,
+                          ('GET', 'exchangeInfo'):   self.exchangeInfo,
+                          ('GET', 'klines'):         self.klines,
+                          ('GET', 'ticker/24hr'):    self.ticker,
+                          ('GET', 'account'):        self.account,
+                          ('GET', 'positionRisk'):   self.positionRisk,
+                          ('POST', 'leverage'):      self.setleverage,
+                          ('POST', 'marginType'):    self.marginType,
+                          ('POST', 'order/test'):    self.testOrder,
+                          ('POST', 'order'):         self.order,
+                          ('GET', 'order'):          self.getorder,
+                          ('DELETE', 'order'):       self.cancel,
+                          ('GET', 'openOrders'):     self.openOrders,
+                          ('GET', 'allOrders'):      self.allOrders,
+                          ('POST', 'batchOrders'):   self.batchOrders,
+                          ('DELETE', 'batchOrders'): self.cancelBatch,
+                          ('DELETE', 'allOpenOrders'): self.cancelAll}
+
+        if rules == None and replay != None:
+            info  = replay._get('/fapi/v1/exchangeInfo')
+            rules = info.get('symbols') if isinstance(info, dict) else None
+        known      = {pair['symbol']: pair for pair in rules or []}
+        self.rules = {symbol: known.get(symbol) or self._rule(symbol) for symbol in self.candles}
+        self.info  = {symbol: symbolinfo(pair) for symbol, pair in self.rules.items()}
+        self.precision = {symbol: (max(0, -info.tickSize.as_tuple().exponent) if info.tickSize else 8,
+                                   max(0, -info.stepSize.as_tuple().exponent) if info.stepSize else 3)
+                          for symbol, info in self.info.items()}
+
+        # the candles closed by start are history, nothing is matched on them
+        first       = int(self.times[0]) + self.width if start == None else int(start)
+        self.cursor = int(np.searchsorted(self.times, first - self.width, 'right'))
+        self.index  = {symbol: int(np.searchsorted(columns['time'], first - self.width, 'right'))
+                       for symbol, columns in self.candles.items()}    # candles stepped so far
+        self.now    = int(self.times[self.cursor - 1]) + self.width if self.cursor else first
+
+    def _rule(self, symbol):
+        ''' exchangeInfo of a symbol without rules, ticks as fine as the prices need '''
+        decimals = _decimals(self.candles[symbol]['close'][:10000])
+        tick     = '{:.{}f}'.format(10.0**-decimals, decimals)
+        quote    = next((q for q in self.QUOTES if symbol.endswith(q) and symbol != q), '')
+        return {'symbol': symbol, 'status': 'TRADING', 'baseAsset': symbol[:len(symbol) - len(quote)],
+                'quoteAsset': quote,
+                'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': tick, 'minPrice': tick, 'maxPrice': '0'},
+                            {'filterType': 'LOT_SIZE', 'stepSize': '0.001', 'minQty': '0.001', 'maxQty': '0'},
+                            {'filterType': 'MIN_NOTIONAL', 'notional': '0'}]}
+
+    def client(self, **kwargs):
+        ''' A binance instance trading on this exchange, with throwaway keys '''
+        from .binapi import binance
+        return binance(api_key='sim-api-key', secret_key='sim-secret-key', transport=self, check=False, **kwargs)
+
+    # the simulation
+
+    def last(self, symbol:str):
+        ''' The close of the last stepped candle of a symbol, None before the first one '''
+        i = self.index[symbol]
+        return float(self.candles[symbol]['close'][i - 1]) if i else None
+
+    def step(self, count:int=1):
+        '''
+        Moves the simulation `count` candles on, filling the working orders on the way
+
+        Parameters:
+        --
+            count int:         The candles to step
+        Returns False once there are no candles left
+        '''
+        for _ in range(count):
+            if self.cursor >= len(self.times):
+                return False
+            with self.lock:
+                time = int(self.times[self.cursor])
+                for symbol, columns in self.candles.items():
+                    i = self.index[symbol]
+                    if i < len(columns['time']) and columns['time'][i] == time:
+                        self.index[symbol] = i + 1
+                        if self.working[symbol]:
+                            self._match(symbol, i, time)
+                self.cursor += 1
+                self.now     = time + self.width
+        return True
+
+    def run(self, strategy, every:int=1):
+        ''' Calls strategy() every `every` candles until the candles run out, returns the trades '''
+        while True:
+            strategy()
+            if not self.step(every):
+                return self.trades
+
+    def equity(self):
+        ''' The wallet balance plus the unrealized profit of every position '''
+        return self.balance + sum(self._unrealized(symbol) for symbol in self.candles)
+
+    def _unrealized(self, symbol):
+        amount, entry = self.positions[symbol]
+        return amount*(self.last(symbol) - entry) if amount else 0.0
+
+    def _match(self, symbol, i, time):
+        ''' Fills the working orders of a symbol on the path of its candle i '''
+        columns = self.candles[symbol]
+        o, h, l, c = (float(columns[name][i]) for name in ('open', 'high', 'low', 'close'))
+        path    = (o, l, h, c) if c >= o else (o, h, l, c)
+        working = self.working[symbol]
+        events  = []                                # (position, orderId, price, taker)
+        for orderId, spec in working.items():
+            hit = self._hit(spec, path)
+            if hit != None:
+                heapq.heappush(events, (hit[0], orderId, hit[1], False))
+        while events:
+            position, orderId, price, taker = heapq.heappop(events)
+            spec = working.get(orderId)
+            if spec == None:
+                continue
+            if spec['stop'] and not spec['triggered']:
+                spec['triggered'] = True
+                if spec['price']:                   # a stop limit rests from here on as a limit
+                    hit = self._hit(spec, path, position)
+                    if hit != None:
+                        heapq.heappush(events, (hit[0], orderId, hit[1], hit[0] == position))
+                    continue
+                taker = True
+            self._fill(symbol, orderId, price, taker, time + min(self.width - 1, int(position/(len(path) - 1)*self.width)))
+
+    @staticmethod
+    def _hit(spec, path, start:float=0.0):
+        ''' Where on a candle path an order fills, or triggers if it is a stop that did not yet '''
+        buy = spec['side'] == 'BUY'
+        if not spec['stop'] or spec['triggered']:
+            return _cross(path, spec['price'], buy, start)
+        # stops buy on the way up and sell on the way down, take profits the other way around
+        return _cross(path, spec['stop'], buy != spec['type'].startswith('STOP'), start)
+
+    def _reducible(self, symbol, side):
+        ''' The amount an order of a side can take off the position '''
+        amount = self.positions[symbol][0]
+        return abs(amount) if (amount > 0) == (side == 'SELL') and amount else 0.0
+
+    def _fill(self, symbol, orderId, price, taker, time):
+        spec  = self.working[symbol].pop(orderId)
+        order = self.orders[orderId]
+        sign  = 1 if spec['side'] == 'BUY' else -1
+        qty   = spec['quantity']
+        if spec['close'] or spec['reduce']:
+            reducible = self._reducible(symbol, spec['side'])
+            qty       = reducible if spec['close'] else min(qty, reducible)
+            if qty <= 0:
+                order.update(status='EXPIRED', updateTime=time)
+                return order
+        if taker and self.slippage:
+            price = price*(1 + sign*self.slippage)
+            if spec['price']:                       # never past the limit
+                price = min(price, spec['price']) if sign > 0 else max(price, spec['price'])
+        fee    = price*qty*(self.taker if taker else self.maker)
+        amount, entry = self.positions[symbol]
+        profit = 0.0
+        if amount*sign < 0:                         # reduces, closes or flips the position
+            closed = min(abs(amount), qty)
+            profit = closed*(price - entry)*(1 if amount > 0 else -1)
+            rest   = amount + sign*qty
+            if abs(rest) < 1e-9:
+                amount, entry = 0.0, 0.0
+            elif (rest > 0) == (amount > 0):
+                amount = rest
+            else:
+                amount, entry = rest, price
+        else:
+            entry  = (entry*abs(amount) + price*qty)/(abs(amount) + qty)
+            amount = amount + sign*qty
+        self.positions[symbol] = [amount, entry]
+        self.balance += profit - fee
+        pdec, qdec = self.precision[symbol]
+        order.update(status='FILLED', executedQty='{:.{}f}'.format(qty, qdec), avgPrice='{:.8f}'.format(price),
+                     cumQuote='{:.8f}'.format(price*qty), updateTime=time)
+        self.trades.append({'time': time, 'symbol': symbol, 'orderId': orderId, 'side': spec['side'],
+                            'type': order['type'], 'qty': qty, 'price': price, 'fee': fee,
+                            'realizedPnl': profit, 'maker': not taker})
+        return order
+
+    # the api
+
+    def _call(self, method, url, params=None, raw:bool=False):
+        route = self.routes.get((method, ratelimiter.endpoint(url)))
+        if route == None:
+            if self.replay != None:
+                return self.replay._answer(method, url, params, raw)
+            return {'code': -5000, 'msg': 'Path {} is not simulated'.format(ratelimiter.endpoint(url))}
+        query = _query(params)
+        with self.lock:
+            status, body = route(query)
+        if isinstance(body, bytes) and not raw:
+            return json.loads(body)
+        return body
+
+    def warmup(self, url, connections:int=1):
+        return self._call('GET', url)
+
+    def close(self):
+        pass
+
+    def _get(self, url, params=None, headers=None, raw:bool=False, hedge=None):
+        return self._call('GET', url, params, raw)
+
+    def _post(self, url, params=None, headers=None, lookup=None):
+        return self._call('POST', url, params)
+
+    def _put(self, url, params=None, headers=None):
+        return self._call('PUT', url, params)
+
+    def _delete(self, url, params=None, headers=None):
+        return self._call('DELETE', url, params)
+
+    def _price(self, symbol, value):
+        return '{:.{}f}'.format(value, self.precision[symbol][0])
+
+    def _qty(self, symbol, value):
+        return '{:.{}f}'.format(value, self.precision[symbol][1])
+
+    def time(self, query):
+        return 200, {'serverTime': self.now}
+
+    def ping(self, query):
+        return 200, {}
+
+    def exchangeInfo(self, query):
+        return 200, {'timezone': 'UTC', 'serverTime': self.now, 'rateLimits': [],
+                     'symbols': list(self.rules.values())}
+
+    def _series(self, symbol, interval):
+        ''' (open times, close times, encoded rows) of a symbol in an interval, made on first use '''
+        key = (symbol, interval)
+        if key not in self.series:
+            columns = self.candles[symbol]
+            if interval != self.interval:
+                columns = resample.resample(columns, interval, self.interval, complete=True)
+            closes = resample.closetime(columns['time'], interval)
+            rows   = [b'[%d,%r,%r,%r,%r,%r,%d,0,0,0,0,0]' % row
+                      for row in zip(columns['time'].tolist(), columns['open'].tolist(), columns['high'].tolist(),
+                                     columns['low'].tolist(), columns['close'].tolist(), columns['volume'].tolist(),
+                                     (closes - 1).tolist())]
+            self.series[key] = (columns['time'], closes, rows)
+        return self.series[key]
+
+    def klines(self, query):
+        symbol, interval = query.get('symbol'), query.get('interval')
+        if symbol not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        if interval != '1M' and resample.WIDTHS.get(interval, 0) < self.width:
+            return 400, {'code': -1120, 'msg': 'Invalid interval.'}
+        times, closes, rows = self._series(symbol, interval)
+        if interval == self.interval:
+            visible = self.index[symbol]
+        else:
+            visible = int(np.searchsorted(closes, self.now, 'right'))
+        limit = min(int(query.get('limit', 500)), 1500)
+        end   = int(query['endTime']) if 'endTime' in query else None
+        if 'startTime' in query:
+            low  = int(np.searchsorted(times[:visible], int(query['startTime']), 'left'))
+            high = min(low + limit, visible)
+            if end != None:
+                high = min(high, int(np.searchsorted(times, end, 'right')))
+        else:
+            high = visible if end == None else int(np.searchsorted(times[:visible], end, 'right'))
+            low  = max(0, high - limit)
+        return 200, b'[' + b','.join(rows[low:high]) + b']'
+
+    def ticker(self, query):
+        tickers = []
+        for symbol in self.candles:
+            if query.get('symbol', symbol) != symbol or not self.index[symbol]:
+                continue
+            columns = self.candles[symbol]
+            high    = self.index[symbol]
+            low     = int(np.searchsorted(columns['time'][:high], self.now - 86400000, 'left'))
+            tickers.append({'symbol': symbol, 'lastPrice': self._price(symbol, columns['close'][high - 1]),
+                            'openPrice': self._price(symbol, columns['open'][low]),
+                            'highPrice': self._price(symbol, columns['high'][low:high].max()),
+                            'lowPrice': self._price(symbol, columns['low'][low:high].min()),
+                            'volume': '{:.3f}'.format(columns['volume'][low:high].sum()),
+                            'openTime': int(columns['time'][low]), 'closeTime': self.now - 1})
+        if 'symbol' in query:
+            return (200, tickers[0]) if tickers else (400, {'code': -1121, 'msg': 'Invalid symbol.'})
+        return 200, tickers
+
+    def _position(self, symbol):
+        amount, entry = self.positions[symbol]
+        leverage = self.leverage[symbol]
+        last     = self.last(symbol) or 0.0
+        if amount:
+            liquidation = max(0.0, entry*(1 - 1/leverage) if amount > 0 else entry*(1 + 1/leverage))
+        else:
+            liquidation = 0.0
+        return {'symbol': symbol, 'positionAmt': self._qty(symbol, amount), 'entryPrice': '{:.8f}'.format(entry),
+                'markPrice': self._price(symbol, last), 'unRealizedProfit': '{:.8f}'.format(self._unrealized(symbol)),
+                'liquidationPrice': self._price(symbol, liquidation), 'leverage': str(leverage),
+                'maxNotionalValue': '1000000', 'marginType': self.margin[symbol],
+                'isolatedMargin': '0.00000000', 'isAutoAddMargin': 'false', 'positionSide': 'BOTH',
+                'notional': '{:.8f}'.format(amount*last), 'isolatedWallet': '0', 'updateTime': self.now}
+
+    def positionRisk(self, query):
+        if 'symbol' in query and query['symbol'] not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        return 200, [self._position(symbol) for symbol in self.candles if query.get('symbol', symbol) == symbol]
+
+    def _used(self):
+        ''' The initial margin of the open positions '''
+        return sum(abs(amount)*entry/self.leverage[symbol] for symbol, (amount, entry) in self.positions.items())
+
+    def account(self, query):
+        unrealized = sum(self._unrealized(symbol) for symbol in self.candles)
+        available  = self.balance + unrealized - self._used()
+        return 200, {'totalWalletBalance': '{:.8f}'.format(self.balance),
+                     'totalUnrealizedProfit': '{:.8f}'.format(unrealized),
+                     'totalMarginBalance': '{:.8f}'.format(self.balance + unrealized),
+                     'availableBalance': '{:.8f}'.format(available), 'maxWithdrawAmount': '{:.8f}'.format(available),
+                     'assets': [{'asset': 'USDT', 'walletBalance': '{:.8f}'.format(self.balance),
+                                 'availableBalance': '{:.8f}'.format(available)}],
+                     'positions': [self._position(symbol) for symbol in self.candles]}
+
+    def setleverage(self, query):
+        symbol, leverage = query.get('symbol'), int(query.get('leverage', 0))
+        if symbol not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        if not 1 <= leverage <= 125:
+            return 400, {'code': -4028, 'msg': 'Leverage {} is not valid'.format(leverage)}
+        self.leverage[symbol] = leverage
+        return 200, {'symbol': symbol, 'leverage': leverage, 'maxNotionalValue': '1000000'}
+
+    def marginType(self, query):
+        if query.get('symbol') not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        self.margin[query['symbol']] = str(query.get('marginType', 'CROSSED')).lower().replace('crossed', 'cross')
+        return 200, {'code': 200, 'msg': 'success'}
+
+    def testOrder(self, query):
+        return 200, {}
+
+    def order(self, query):
+        symbol = query.get('symbol')
+        if symbol not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        clientOrderId = query.get('newClientOrderId') or 'sim{}'.format(self.orderIds + 1)
+        if clientOrderId in self.clientIds:
+            return 400, {'code': -4116, 'msg': 'ClientOrderId is duplicated.'}
+        side, kind = query.get('side'), query.get('type', 'MARKET')
+        if side not in ('BUY', 'SELL'):
+            return 400, {'code': -1117, 'msg': 'Invalid side.'}
+        if kind not in self.TYPES:
+            return 400, {'code': -1116, 'msg': 'Invalid orderType.'}
+        closing  = _true(query.get('closePosition'))
+        reduce   = _true(query.get('reduceOnly'))
+        quantity = float(query.get('quantity', 0))
+        price    = float(query.get('price', 0))
+        stop     = float(query.get('stopPrice', 0))
+        if quantity <= 0 and not closing:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed."}
+        if kind == 'LIMIT' and price <= 0:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'price' was not sent, was empty/null, or malformed."}
+        if kind not in ('LIMIT', 'MARKET') and stop <= 0:
+            return 400, {'code': -1102, 'msg': "Mandatory parameter 'stopPrice' was not sent, was empty/null, or malformed."}
+        last = self.last(symbol)
+        if last == None:
+            return 400, {'code': -1, 'msg': 'No price of {} before its first candle.'.format(symbol)}
+        # STOP and TAKE_PROFIT without a price, like place_sl_market_order sends, fill as market orders
+        spec = {'side': side, 'type': kind, 'quantity': quantity, 'price': 0.0 if kind.endswith('MARKET') else price,
+                'stop': stop if kind not in ('LIMIT', 'MARKET') else 0.0, 'reduce': reduce, 'close': closing,
+                'triggered': False}
+        fills = kind == 'MARKET' or kind == 'LIMIT' and _cross((last, last), price, side == 'BUY') != None
+        if spec['stop'] and self._hit(spec, (last, last)) != None:
+            return 400, {'code': -2021, 'msg': 'Order would immediately trigger.'}
+        if fills and kind == 'LIMIT' and query.get('timeInForce') == 'GTX':
+            return 400, {'code': -5022, 'msg': 'Due to the order could not be executed as maker, '
+                                               'the Post Only order will be rejected.'}
+        if fills and (reduce or closing) and not self._reducible(symbol, side):
+            return 400, {'code': -2022, 'msg': 'ReduceOnly Order is rejected.'}
+        if fills and not reduce and not closing:
+            cost = quantity*last*(1/self.leverage[symbol] + self.taker)
+            if cost > self.balance + sum(self._unrealized(s) for s in self.candles) - self._used():
+                return 400, {'code': -2019, 'msg': 'Margin is insufficient.'}
+
+        self.orderIds += 1
+        orderId = self.orderIds
+        order   = {'orderId': orderId, 'symbol': symbol, 'status': 'NEW', 'clientOrderId': clientOrderId,
+                   'price': self._price(symbol, spec['price']), 'avgPrice': '0.00000', 'origQty': self._qty(symbol, quantity),
+                   'executedQty': '0', 'cumQuote': '0', 'timeInForce': query.get('timeInForce', 'GTC'),
+                   'type': kind, 'origType': kind, 'reduceOnly': reduce, 'closePosition': closing, 'side': side,
+                   'positionSide': 'BOTH', 'stopPrice': self._price(symbol, spec['stop']),
+                   'workingType': query.get('workingType', 'CONTRACT_PRICE'),
+                   'priceProtect': _true(query.get('priceProtection')), 'time': self.now, 'updateTime': self.now}
+        self.orders[orderId]         = order
+        self.clientIds[clientOrderId] = orderId
+        self.history[symbol].append(orderId)
+        self.working[symbol][orderId] = spec
+        if fills:
+            self._fill(symbol, orderId, last, True, self.now)
+        return 200, dict(order)
+
+    def _find(self, query):
+        if 'origClientOrderId' in query:
+            return self.orders.get(self.clientIds.get(query['origClientOrderId']))
+        return self.orders.get(int(query.get('orderId', 0)))
+
+    def getorder(self, query):
+        order = self._find(query)
+        if order == None:
+            return 400, {'code': -2013, 'msg': 'Order does not exist.'}
+        return 200, dict(order)
+
+    def cancel(self, query):
+        order = self._find(query)
+        if order == None or order['status'] != 'NEW':
+            return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+        self.working[order['symbol']].pop(order['orderId'], None)
+        order.update(status='CANCELED', updateTime=self.now)
+        return 200, dict(order)
+
+    def openOrders(self, query):
+        if 'symbol' in query and query['symbol'] not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        return 200, [dict(self.orders[orderId]) for symbol, working in self.working.items()
+                     if query.get('symbol', symbol) == symbol for orderId in working]
+
+    def allOrders(self, query):
+        if query.get('symbol') not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        orderIds = self.history[query['symbol']]
+        limit    = min(int(query.get('limit', 500)), 1000)
+        if 'orderId' in query:
+            orderIds = orderIds[bisect_left(orderIds, int(query['orderId'])):][:limit]
+        else:
+            orderIds = orderIds[-limit:]
+        return 200, [dict(self.orders[orderId]) for orderId in orderIds]
+
+    def batchOrders(self, query):
+        return 200, [self.order(order)[1] for order in json.loads(query['batchOrders'])]
+
+    def cancelBatch(self, query):
+        if 'origClientOrderIdList' in query:
+            return 200, [self.cancel({'origClientOrderId': clientOrderId})[1]
+                         for clientOrderId in json.loads(query['origClientOrderIdList'])]
+        return 200, [self.cancel({'orderId': orderId})[1] for orderId in json.loads(query['orderIdList'])]
+
+    def cancelAll(self, query):
+        if query.get('symbol') not in self.candles:
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        for orderId in list(self.working[query['symbol']]):
+            self.cancel({'orderId': orderId})
+        return 200, {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
@@ -1,11 +1,23 @@
 import decimal
 import hmac
 import time
-import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+import json
 from decimal import Decimal
+import re
+import uuid
+from urllib.parse import quote_plus
 # from reqs import *
-from . import reqs
+from .reqs import reqs
+from . import klines
+from . import resample
+from .exchangeinfo import exchangeinfo
+from .clock import clocksync
+from .userstream import userstream
+from .portfolio import portfolio, protected
+from .orderindex import orderindex
 
 """
 Here a class is defined based on Binance API commands,
@@ -17,7 +29,7 @@ Returns:
 """
 
 def whichside(entryPrice, liqPrice):
-    if liqPrice > entryPrice:
+    if float(liqPrice) > float(entryPrice):
         return 'SELL'
     else:
         return 'BUY'
@@ -31,10 +43,22 @@ def sidebin(side):
 def float2fixed(flt, prec):
     return int(flt * prec)/prec
 
+_unsafe = re.compile(r'[^A-Za-z0-9_.\-~]').search
+
+def encode_query(params:dict):
+    ''' Same output as urlencode, but only values that need it go through quote_plus '''
+    query = []
+    for key, value in params.items():
+        value = str(value)
+        if _unsafe(value):
+            value = quote_plus(value)
+        query.append(key + '=' + value)
+    return '&'.join(query)
+
 
 class binance:
     
-    request_delay  = 150   # tricking binance to get faster requests in miliseconds
+    recvWindow     = 6000  # miliseconds a signed request stays valid, see tighten_recv_window
     mxlimit        = 1500  # maximum possible number of data to retrive
     prec           = 100
     ORDER_STATUS_NEW = 'NEW'
@@ -75,18 +99,36 @@ class binance:
                        '1w' :{'insec': 604800,  'tf_reference': 1000},
                        '1M' :{'insec': 2592000, 'tf_reference': 1000}}
         
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, pool_size:int=10, base_url='https://fapi.binance.com', limiter=None,
+                 metrics=None, api_key:str=None, secret_key:str=None, transport=None, clock=None,
+                 exchange=None, check=True):
+        '''
+        Parameters:
+        --
+            filename str:      A key file, the api key on the first line and the secret on the second
+            api_key str:       The api key, instead of a key file
+            secret_key str:    The secret key, instead of a key file
+            transport reqs:    A reqs shared with other instances, its pool and rate limiter included,
+                               or a recorder, replayer or simexchange of binapi.backtest
+            clock clocksync:   A clocksync shared with other instances
+            exchange:          An exchangeinfo shared with other instances
+            check:             True to test the connectivity and sync the clock now, 'lazy' to sync
+                               it and read the trading rules in the background, False for neither
+        '''
 
-        self.basev1 = 'https://fapi.binance.com/fapi/v1/' #base api url
-        self.basev2 = 'https://fapi.binance.com/fapi/v2/' #base api url
+        self.basev1 = base_url + '/fapi/v1/' #base api url
+        self.basev2 = base_url + '/fapi/v2/' #base api url
         
-        self.reqs = reqs
+        self.reqs = None
         self.endpoints = {                            # endpoints representing each api command
             "ping":          'ping',
             "time":          'time',
             "leverage":      'leverage',
             "marginType":    'marginType',
             "order":         'order',
+            "batchOrders":   'batchOrders',
+            "allOpenOrders": 'allOpenOrders',
+            "openOrders":    'openOrders',
             "testOrder":     'order/test',
             "allOrders":     'allOrders',
             "klines":        'klines',
@@ -95,46 +137,132 @@ class binance:
             "averagePrice" : 'avgPrice',
             "orderBook" :    'depth',
             "account" :      'account',
-            "positionRisk":  'positionRisk'}
+            "positionRisk":  'positionRisk',
+            "listenKey":     'listenKey'}
         
         self.account_access = False                    #Initializing that there is no access to the api yet
 
-        if filename == None:
+        if filename == None and (api_key == None or secret_key == None):
             raise Exception("Cannot access api without the keys.")
             return
     
-        f = open(filename, "r")
-        contents = []
-        if f.mode == 'r':
-            contents = f.read().split('\n')
-
-        self.binance_keys = dict(api_key = contents[0], secret_key=contents[1])
+        if filename != None:
+            f = open(filename, "r")
+            contents = []
+            if f.mode == 'r':
+                contents = f.read().split('\n')
+            f.close()
+            api_key, secret_key = contents[0], contents[1]
+
+        self.binance_keys = dict(api_key = api_key, secret_key=secret_key)
         self.headers = {"X-MBX-APIKEY": self.binance_keys['api_key']}
+        self.hmac    = hmac.new(self.binance_keys['secret_key'].encode('utf-8'), digestmod=hashlib.sha256)
         self.account_access = True
 
-        ret = self.test_connectivity()
+        # one pooled keep-alive transport per instance, the api key header is set once on it,
+        # every call of the instance goes through the same weight-aware rate limiter.
+        # A shared transport serves several accounts, signed calls send their own key header
+        self.owns_transport = transport == None
+        if transport == None:
+            transport = reqs(headers=self.headers, pool_size=pool_size, limiter=limiter, metrics=metrics)
+        self.reqs    = transport
+        self.limiter = self.reqs.limiter
+        self.metrics = self.reqs.metrics            # disabled unless a metrics instance is given
+        self.exchange = exchange if exchange != None else exchangeinfo(self)    # downloaded on first use
+        if clock == None:
+            clock = getattr(self.reqs, 'clock', None)   # a simulated exchange keeps its own time
+        self.owns_clock = clock == None
+        self.clock    = clock if clock != None else clocksync(self)             # offset to the server clock
+        self.userstream = None                      # user data stream, once start_userstream() is called
+        self.portfolio  = portfolio(self)           # account wide positions and open orders, read on demand
+        self.orderindex = orderindex(self)          # local index of the orders, filled on demand
+
+        if check == 'lazy':
+            # nothing is waited for, calls made meanwhile go by the local clock
+            self.clock.start(sync=True)
+            self.exchange._refresh_async()
+            return
+        if not check:
+            return
+        ret = self.test_connectivity()              # also warms up the first pooled connection
         if ret:
             print('Connection Successful to the brokers API')
+            self.clock.start()                      # keeps the clock offset fresh in the background
         else:
             print('Connection Failed to the brokers API')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        ''' Shuts down the pooled connections of this instance '''
+        if self.reqs is not None:
+            if self.userstream != None:
+                self.userstream.stop()
+                self.userstream = None
+            if self.owns_clock:                 # shared ones are stopped and closed by their owner
+                self.clock.stop()
+            if self.owns_transport:
+                self.reqs.close()
     
     def test_connectivity(self):
-        # url  = self.basev1 + self.endpoints["ping"]
-        url  = self.basev1 + self.endpoints["time"]
-        #data  = self.reqs._get(url1, headers = self.headers)
-        data  = self.reqs._get(url)
-        if data.__contains__('code'):
-            if data['code'] == -1:
-                return False
-        return True
+        ''' Reaches the time endpoint a few times, which also measures the
+            offset of the local clock to the server clock '''
+        return self.clock.sync()
+
+    def servertime(self):
+        ''' The current server time in ms, from the synced local clock '''
+        return self.clock.now()
+
+    def tighten_recv_window(self, margin:float=250):
+        ''' Sets recvWindow from the measured latency instead of the fixed 6000 ms '''
+        self.recvWindow = self.clock.recv_window(margin)
+        return self.recvWindow
+
+    def _signed(self, method:str, url:str, params:dict, lookup=None):
+        ''' Stamps a request with the server time, signs and sends it,
+            every retry of the request is stamped and signed again '''
+        query = self._stamped(params)
+        if method == 'POST':
+            data = self.reqs._post(url, params=query, headers=self.headers, lookup=lookup)
+        else:
+            send = {'GET': self.reqs._get, 'PUT': self.reqs._put, 'DELETE': self.reqs._delete}[method]
+            data = send(url, params=query, headers=self.headers)
+        if method != 'GET':
+            self.portfolio.invalidate()                 # our own orders changed the account
+        if isinstance(data, dict) and data.get('code') == -1021:
+            # timestamp outside of recvWindow, the clock drifted. A resend would go out on the
+            # same offset, so the error is returned and the next call is stamped after the sync
+            self.clock.resync()
+        return data
+
+    def _stamped(self, params:dict):
+        ''' A callable giving the query of a signed request, stamped with the time it is called '''
+        params = dict(params)                           # the caller's dict is never changed
+        if not params.keys().__contains__('recvWindow'):
+            params['recvWindow'] = self.recvWindow
+        def query():
+            params['timestamp'] = self.clock.now()
+            with self.metrics.stage('sign'):
+                return self.signRequest(params)         # the very text that was signed is sent
+        return query
+
+    def _lookup_order(self, symbol:str, clientOrderId:str):
+        ''' The order of a client order id, None if binance does not know it '''
+        url  = self.basev1 + self.endpoints['order']
+        data = self._signed('GET', url, {'symbol': symbol, 'origClientOrderId': clientOrderId})
+        if isinstance(data, dict) and data.__contains__('orderId'):
+            return data
+        return None
         
-    def GetAllSymbols(self, quoteAssets:list=None):
+    def GetAllSymbols(self, quoteAssets:list=None, refresh:bool=False):
         ''' Gets All symbols and classifies them to
-            online, offline and trading (currently) '''
-        url  = self.basev1 + self.endpoints["exchangeInfo"]
-        data = self.reqs._get(url)
-        if data.__contains__('code'):
-            raise Exception("Failed to read exchange information")
+            online, offline and trading (currently), 
+            from the cached exchange information '''
+        self.exchange.refresh(force=refresh)
 
         online_symbols        = []  #symbols that are currently being traded
         trading_symbols       = []  #symbols that this bot can trade based on
@@ -142,14 +270,14 @@ class binance:
         offline_symbols       = []  #symbols that are currently on a break
         trading_symbols_data  = []  #whole data of trading symbols
 
-        for pair in data['symbols']:
-            if pair['status'] == 'TRADING':
-                online_symbols.append(pair['symbol'])
-                if quoteAssets != None and pair['quoteAsset'] in quoteAssets:
-                    trading_symbols.append(pair['symbol'])
-                    trading_symbols_data.append(pair)
+        for pair in self.exchange.symbols.values():
+            if pair.status == 'TRADING':
+                online_symbols.append(pair.symbol)
+                if quoteAssets != None and pair.quoteAsset in quoteAssets:
+                    trading_symbols.append(pair.symbol)
+                    trading_symbols_data.append(pair.data)
             else:
-                offline_symbols.append(pair['symbol'])
+                offline_symbols.append(pair.symbol)
 
         symbols = {'online':  online_symbols,
                    'trading': trading_symbols,
@@ -158,7 +286,30 @@ class binance:
         
         return symbols
 
-    def GetSymbolKlines(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None):
+    def symbolinfo(self, symbol:str):
+        ''' Returns the cached trading rules of a symbol, None if they are unknown '''
+        try:
+            return self.exchange.get(symbol)
+        except Exception as e:
+            print(e)
+            return None
+
+    def round_price(self, symbol:str, price):
+        ''' Rounds a price down to the tick size of the symbol '''
+        info = self.symbolinfo(symbol)
+        if info == None:
+            return float2fixed(price, self.prec)
+        return info.price(price)
+
+    def round_quantity(self, symbol:str, quantity, market:bool=False):
+        ''' Rounds a quantity down to the step size of the symbol '''
+        info = self.symbolinfo(symbol)
+        if info == None:
+            return quantity
+        return info.quantity(quantity, market)
+
+    def GetSymbolKlines(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None, start_time=None,
+                        fmt:str='pandas', extra:bool=False):
         ''' 
         Gets trading price data for a given symbol 
         
@@ -169,71 +320,213 @@ class binance:
             limit:             The number of data to get
             end_time:          The time from which to start looking backward for 'limit'
                                Number of data
+            start_time:        If given, 'limit' candles are counted forward from this time
+            fmt str:           'pandas' for a DataFrame, 'numpy' for a dict of typed columns,
+                               'raw' for the undecoded response body
+            extra bool:        Also keep the quote volume, trade count and taker-buy columns
         '''
 
-        if limit > self.mxlimit:
-            return self.GetSymbolKlinesExtra(symbol, interval, limit, end_time)
-        
+        if limit > self.mxlimit and start_time == None:
+            return self.GetSymbolKlinesExtra(symbol, interval, limit, end_time, fmt=fmt)
+
+        url  = self.basev1 + self.endpoints['klines']  # creat the url
+        data = self.reqs._get(url, self._klines_params(symbol, interval, limit, end_time, start_time),
+                              raw=True)                 # download data, undecoded
+        return self._klines_data(symbol, data, fmt, extra)
+
+    def _klines_params(self, symbol, interval, limit, end_time=None, start_time=None):
         params = {'symbol': symbol,
                   'interval': interval,
-                  'limit': str(limit)}
+                  'limit': str(min(limit, self.mxlimit))}
         
         if end_time != None:
             params.update({'endTime': str(int(end_time))})
-
-        url = self.basev1 + self.endpoints['klines']  # creat the url
-        data = self.reqs._get(url, params)               # download data
-        try:
-            df = pd.DataFrame(data)                     # put in dataframe pandas format
-        except Exception as Err:
-            print(data)
-            raise(Err)
-
-        df = df.drop(range(6, 12), axis=1)          # Droping useless columns
-        
-        #print(df)
-        col_names = ['time', 'open', 'high',
-                     'low', 'close', 'volume']      # rename columns
-        df.columns = col_names
-
-        for col in col_names:                       # transform values from strings to floats
-            df[col] = df[col].astype(float)
-
-        df['time'] = df['time'].astype(int)
-
-        df['date'] = pd.to_datetime(df['time'] * 1000000, infer_datetime_format=True)
-                                                    #transfer date and time to human readable
-        return df
+        if start_time != None:
+            params.update({'startTime': str(int(start_time))})
+        return params
+
+    def _klines_data(self, symbol, data, fmt:str='pandas', extra:bool=False):
+        ''' Decodes a raw klines answer, raises on an error answer '''
+        err  = klines.error(data)
+        if err != None:
+            raise Exception("Failed to read klines of {}: {}".format(symbol, err.get('msg')))
+
+        if fmt == 'raw':
+            return data
+        with self.metrics.stage('klines.parse'):
+            columns = klines.parse(data, extra)         # typed columns straight from the bytes
+        return self._klines_out(columns, fmt)
+
+    def _klines_out(self, columns:dict, fmt:str='pandas'):
+        ''' Parsed columns in the asked format, pandas is only imported for a DataFrame '''
+        if fmt == 'numpy':
+            return columns
+        if fmt != 'pandas':
+            raise Exception("Unknown klines format '{}', this call gives 'pandas' or 'numpy'".format(fmt))
+        with self.metrics.stage('klines.frame'):
+            return klines.frame(columns)                # time, open, high, low, close, volume, date
     
-    def GetSymbolKlinesExtra(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None):
+    def GetSymbolKlinesExtra(self, symbol:str, interval:str, limit:int=mxlimit, end_time=None, workers:int=4,
+                             fmt:str='pandas'):
         """ it is to call the GetSymbolKlines as many times as we need 
             in order to get all the historical data required (based on
             the limit parameter) and we'll be merging the results into
-            one long dataframe. """
+            one long dataframe. 
+            
+            The newest page is downloaded first, the windows of all older
+            pages follow from its first candle and the candle width, so they
+            are fetched concurrently on up to `workers` threads and glued
+            together with a single concatenation. The pages stay numpy
+            columns until then, fmt='numpy' keeps them so. """
 
-        repeat_rounds = 0
-        if limit > self.mxlimit:
-            if limit%self.mxlimit==0:
-                repeat_rounds = (limit//self.mxlimit)
-            else:
-                repeat_rounds = (limit//self.mxlimit)+1
-   
         initial_limit = limit % self.mxlimit
         if initial_limit == 0:
             initial_limit = self.mxlimit
         # First, we get the last initial_limit candles, starting at end_time and going
         # backwards (or starting in the present moment, if end_time is False)
-        df = self.GetSymbolKlines(symbol, interval, limit=initial_limit, end_time=end_time)
-        repeat_rounds = repeat_rounds - 1
-        while repeat_rounds > 0:
-            # Then, for every other maximum possible candles, we get them, but starting at the beginning
-            # of the previously received candles.
-            df2 = self.GetSymbolKlines(symbol, interval, limit=self.mxlimit, end_time=df['time'][0])
-            df = df2.append(df, ignore_index = True)
-            repeat_rounds = repeat_rounds - 1
-        return df
+        df = self.GetSymbolKlines(symbol, interval, limit=initial_limit, end_time=end_time, fmt='numpy')
+        if limit <= initial_limit or not len(df['time']):
+            return self._klines_out(df, fmt)
+
+        pages = -(-(limit - initial_limit)//self.mxlimit)
+        if interval == '1M':
+            # months have no fixed width, walk back page by page instead
+            frames = [df]
+            for _ in range(pages):
+                frames.insert(0, self.GetSymbolKlines(symbol, interval, limit=self.mxlimit,
+                                                      end_time=frames[0]['time'][0] - 1, fmt='numpy'))
+                if not len(frames[0]['time']):
+                    break
+        else:
+            # Then, every other page ends right before the first candle of the newer one
+            width = self.INTERVAL_DETAIL[interval]['insec']*1000
+            ends  = [df['time'][0] - width - page*self.mxlimit*width for page in range(pages)]
+            fetch = lambda end: self.GetSymbolKlines(symbol, interval, limit=self.mxlimit, end_time=end, fmt='numpy')
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=min(workers, pages)) as pool:
+                    frames = list(pool.map(fetch, ends))
+            else:
+                frames = [fetch(end) for end in ends]
+            frames = frames[::-1] + [df]
+
+        df = klines.merge(frames)
+        # candles missing on the exchange make pages reach further back than
+        # planned and overlap, top up from the oldest candle until we have enough
+        while len(df['time']) < limit:
+            older = self.GetSymbolKlines(symbol, interval, limit=min(self.mxlimit, limit - len(df['time'])),
+                                         end_time=df['time'][0] - 1, fmt='numpy')
+            if not len(older['time']):
+                break
+            df = klines.merge([older, df])
+        return self._klines_out({name: values[-limit:] for name, values in df.items()}, fmt)
+
+    def GetSymbolKlinesRange(self, symbol:str, interval:str, start_time:int, end_time:int, workers:int=4,
+                             fmt:str='pandas'):
+        ''' 
+        Gets every candle whose open time lies in [start_time, end_time]
+        
+        Parameters:
+        --
+            symbol str:        The symbol for which to get the trading data
+            interval str:      The interval on which to get the trading data
+            start_time:        Open time of the first candle wanted, in ms
+            end_time:          Open time of the last candle wanted, in ms
+            workers:           How many pages to download at the same time
+            fmt str:           'pandas' for a DataFrame, 'numpy' for a dict of typed columns
+        '''
+        if interval == '1M':
+            # months have no fixed width, walk forward page by page instead
+            frames = [self.GetSymbolKlines(symbol, interval, self.mxlimit, end_time, start_time, fmt='numpy')]
+            while len(frames[-1]['time']) == self.mxlimit:
+                frames.append(self.GetSymbolKlines(symbol, interval, self.mxlimit, end_time,
+                                                   frames[-1]['time'][-1] + 1, fmt='numpy'))
+            return self._klines_out(klines.merge(frames), fmt)
+
+        span    = self.INTERVAL_DETAIL[interval]['insec']*1000*self.mxlimit
+        windows = [(start, min(end_time, start + span - 1)) for start in range(int(start_time), int(end_time) + 1, span)]
+        fetch   = lambda window: self.GetSymbolKlines(symbol, interval, self.mxlimit, window[1], window[0], fmt='numpy')
+        if workers > 1 and len(windows) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(windows))) as pool:
+                frames = list(pool.map(fetch, windows))
+        else:
+            frames = [fetch(window) for window in windows]
+        return self._klines_out(klines.merge(frames), fmt)
+
+    def IterSymbolKlines(self, symbol:str, interval:str, start_time=None, end_time=None, limit:int=None,
+                         chunk:int=mxlimit, newest_first:bool=False, prefetch:bool=True, fmt:str='pandas'):
+        ''' 
+        Yields the candles of a symbol chunk by chunk, as they are downloaded
+        
+        Parameters:
+        --
+            symbol str:        The symbol for which to get the trading data
+            interval str:      The interval on which to get the trading data
+            start_time:        Open time of the first candle wanted, in ms
+            end_time:          Open time of the last candle wanted, in ms, now if None
+            limit:             The number of candles to yield at most, every candle from
+                               start_time if None
+            chunk:             Candles per yielded chunk, at most mxlimit
+            newest_first bool: Walk back from end_time instead of forward from start_time
+            prefetch bool:     Download the next chunk while the current one is consumed
+            fmt str:           'pandas' for DataFrames, 'numpy' for dicts of typed columns
+        Only one chunk is held besides the one being consumed, so memory stays
+        the same however long the range, and a slow consumer slows the download.
+        '''
+        start_time = self._iter_start(interval, start_time, end_time, limit, newest_first)
+        chunk      = max(1, min(chunk, self.mxlimit))
+
+        def fetch(cursor, count):
+            if newest_first:
+                return self.GetSymbolKlines(symbol, interval, count, end_time=cursor, fmt='numpy')
+            return self.GetSymbolKlines(symbol, interval, count, end_time=end_time, start_time=cursor, fmt='numpy')
 
-    def GetSymbolSubData(self, symbol:str, interval:str, start_time:int, subinterval:str):
+        pool   = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        cursor = end_time if newest_first else start_time
+        left   = limit
+        try:
+            page = fetch(cursor, chunk if left == None else min(chunk, left))
+            while len(page['time']):
+                page, left, last, cursor = self._iter_page(page, start_time, left, chunk, newest_first)
+                if not len(page['time']):
+                    break                           # the candles left were all before start_time
+                ahead  = None
+                if not last:
+                    size  = chunk if left == None else min(chunk, left)
+                    ahead = pool.submit(fetch, cursor, size) if pool != None else (cursor, size)
+                yield self._klines_out(page, fmt)
+                if ahead == None:
+                    break
+                page = ahead.result() if pool != None else fetch(*ahead)
+        finally:
+            if pool != None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_start(self, interval, start_time, end_time, limit, newest_first):
+        ''' The start_time of IterSymbolKlines, counted back from end_time by limit when walking forward '''
+        if start_time == None and not newest_first:
+            if limit == None or interval == '1M':
+                raise Exception("Walking forward needs a start_time")
+            width      = self.INTERVAL_DETAIL[interval]['insec']*1000
+            start_time = ((end_time if end_time != None else self.servertime())//width - limit + 1)*width
+        return start_time
+
+    @staticmethod
+    def _iter_page(page, start_time, left, chunk, newest_first):
+        ''' Trims a downloaded page of IterSymbolKlines to the range and the limit,
+            returns (page, candles left, True if it is the last page, cursor of the next page) '''
+        if newest_first and start_time != None:
+            page = {name: values[page['time'] >= start_time] for name, values in page.items()}
+        if left != None:
+            page = {name: (values[-left:] if newest_first else values[:left]) for name, values in page.items()}
+            left -= len(page['time'])
+        count = len(page['time'])
+        if count == 0:
+            return page, left, True, None
+        last   = count < chunk or left == 0 or (newest_first and start_time != None and page['time'][0] <= start_time)
+        cursor = page['time'][0] - 1 if newest_first else page['time'][-1] + 1
+        return page, left, last, cursor
+
+    def GetSymbolSubData(self, symbol:str, interval:str, start_time:int, subinterval:str, fmt:str='pandas'):
         ''' 
         Gets trading price data in a lower candle for a given higher candle in a symbol 
         
@@ -242,9 +535,16 @@ class binance:
             symbol str:        The symbol for which to get the trading data
             interval str:      The interval of the great candle that is to look inside for small candles
             subinterval:       The interval of the small candles that are to be in the large one
+            fmt str:           'pandas', 'numpy' or 'raw', as GetSymbolKlines takes it
         '''
+        limit, end_time = self._subdata_params(interval, start_time, subinterval)
+        df = self.GetSymbolKlines(symbol, subinterval, limit=limit, end_time=end_time, fmt=fmt)
+        return df
+
+    def _subdata_params(self, interval, start_time, subinterval):
+        ''' The (limit, end_time) of the small candles of a great candle, the ones to come left out '''
         end_time = start_time + self.INTERVAL_DETAIL[interval]['insec']*1000 - self.INTERVAL_DETAIL[subinterval]['insec']*1000
-        noww = time.time_ns()//1000000
+        noww = self.servertime()
         if end_time<=noww:
             limit = self.INTERVAL_DETAIL[interval]['insec']//self.INTERVAL_DETAIL[subinterval]['insec']
         else:
@@ -252,39 +552,107 @@ class binance:
             remcandles = (diff//self.INTERVAL_DETAIL[subinterval]['tf_reference'] + 1)
             limit = self.INTERVAL_DETAIL[interval]['insec']//self.INTERVAL_DETAIL[subinterval]['insec'] - remcandles
             end_time = None
+        return limit, end_time
 
-        df = self.GetSymbolKlines(symbol, subinterval, limit=limit, end_time=end_time)
-        return df
+    def GetSymbolSubDataBulk(self, symbol:str, interval:str, start_times:list, subinterval:str,
+                             fmt:str='pandas', workers:int=4):
+        ''' 
+        GetSymbolSubData for many great candles at once
+        
+        Parameters:
+        --
+            symbol str:        The symbol for which to get the trading data
+            interval str:      The interval of the great candles that are to look inside for small candles
+            start_times list:  The open times of the great candles, in ms
+            subinterval:       The interval of the small candles that are to be in the large ones
+            fmt str:           'pandas' for DataFrames, 'numpy' for dicts of typed columns
+            workers:           How many pages to download at the same time
+        Returns {start_time: small candles of that great candle}, by start time
+
+        The small candles of neighbouring great candles are merged into
+        contiguous ranges, every range is downloaded once, in pages, and the
+        rows are split back per great candle with a binary search.
+        '''
+        starts, ends, windows = self._subdata_windows(interval, start_times, subinterval)
+        width = self.INTERVAL_DETAIL[subinterval]['insec']*1000
+        fetch = lambda window: self.GetSymbolKlines(symbol, subinterval, (window[1] - window[0])//width + 1,
+                                                    window[1], window[0], fmt='numpy')
+        if workers > 1 and len(windows) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(windows))) as pool:
+                parts = list(pool.map(fetch, windows))
+        else:
+            parts = [fetch(window) for window in windows]
+        return self._subdata_split(parts, starts, ends, fmt)
+
+    def _subdata_windows(self, interval, start_times, subinterval):
+        ''' The great candles by open time, their ends, and the (start, end) pages of small candles to download '''
+        if subinterval == '1M':
+            raise Exception("Great candles can not be split into months")
+        width  = self.INTERVAL_DETAIL[subinterval]['insec']*1000
+        starts = np.unique(np.asarray(start_times, dtype=np.int64))
+        ends   = resample.closetime(starts, interval)        # open time of the next great candle
+
+        # great candles that touch or overlap share one range of small candles
+        ranges = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if ranges and start <= ranges[-1][1] + width:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end - width))
+            else:
+                ranges.append((start, end - width))
+
+        span    = width*self.mxlimit
+        windows = [(start, min(last, start + span - width)) for first, last in ranges
+                   for start in range(first, last + 1, span)]
+        return starts, ends, windows
+
+    def _subdata_split(self, parts, starts, ends, fmt):
+        ''' The downloaded pages split back per great candle '''
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]} if parts else \
+                  {name: np.empty(0, dtype=np.int64 if name == 'time' else np.float64) for name in klines.COLUMNS}
+        times, unique = np.unique(columns['time'], return_index=True)
+        columns = {name: values[unique] for name, values in columns.items()}
+        lows    = np.searchsorted(times, starts)
+        highs   = np.searchsorted(times, ends)
+        data    = {}
+        for start, low, high in zip(starts.tolist(), lows.tolist(), highs.tolist()):
+            part = {name: values[low:high] for name, values in columns.items()}
+            data[start] = self._klines_out(part, fmt)
+        return data
 
     def signRequest(self, params:dict):
-        ''' Signs the request using keys and sha256 '''
+        ''' Signs the request using keys and sha256, and returns the signed
+            query string that is to be sent as it is. params is left untouched '''
 
-        query_string = '&'.join(["{}={}".format(d, params[d]) for d in params])
-        signature    = hmac.new(self.binance_keys['secret_key'].encode('utf-8'),
-                             query_string.encode('utf-8'), hashlib.sha256)
-        params['signature'] = signature.hexdigest()
+        query_string = encode_query(params)
+        signature    = self.hmac.copy()             # keyed once per instance
+        signature.update(query_string.encode('utf-8'))
+        return query_string + '&signature=' + signature.hexdigest()
 
     def GetAccountData(self):
         """ Gets Balances & Account Data """
 
         url = self.basev2 + self.endpoints["account"]
         
-        params = { 'recvWindow': 6000,
-                   'timestamp': int(round(time.time()*1000)) + self.request_delay }
-        self.signRequest(params)
-        data = self.reqs._get(url, params, self.headers)
+        params = {}
+        data = self._signed('GET', url, params)
         return data
 
-    def GetPositionData(self, symbol):
-        """ Gets Position Data on a symbol """
+    def GetPositionData(self, symbol=None):
+        """ Gets Position Data on a symbol, or on every symbol if None """
 
         url = self.basev2 + self.endpoints["positionRisk"]
         
-        params = { 'symbol': symbol,
-                   'recvWindow': 6000,
-                   'timestamp': int(round(time.time()*1000)) + self.request_delay }
-        self.signRequest(params)
-        data = self.reqs._get(url, params, self.headers)
+        params = {} if symbol == None else { 'symbol': symbol }
+        data = self._signed('GET', url, params)
+        return data
+
+    def GetOpenOrders(self, symbol=None):
+        """ Gets the open orders of a symbol, or of the whole account if None """
+
+        url = self.basev1 + self.endpoints["openOrders"]
+
+        params = {} if symbol == None else { 'symbol': symbol }
+        data = self._signed('GET', url, params)
         return data
 
     def Get24hrTicker(self, symbol:str):
@@ -292,26 +660,36 @@ class binance:
         params = {"symbol": symbol}
         return self.reqs._get(url, params)
     
+    def GetOrderBook(self, symbol:str, limit:int=1000):
+        '''
+        Reads a depth snapshot of a symbol
+
+        Parameters:
+        --
+            symbol str:        The symbol, like 'BTCUSDT'
+            limit int:         Levels per side, one of 5, 10, 20, 50, 100, 500, 1000
+        Returns {'lastUpdateId', 'bids': [[price, qty], ...], 'asks': [...]}
+        '''
+        url    = self.basev1 + self.endpoints['orderBook']
+        params = {'symbol': symbol, 'limit': limit}
+        return self.reqs._get(url, params)
+
     def setleverage(self, symbol, leverage:int=1):
         if leverage<1 or leverage>125:
             raise Exception("leverage is not standard")
         params = {}
         params['symbol']     = symbol
         params['leverage']   = leverage
-        params['recvWindow'] = 6000
-        params['timestamp']  = int(round(time.time()*1000)) + self.request_delay
-
 
         url     = self.basev1 + self.endpoints['leverage']
         
-        self.signRequest(params)
-        self.reqs._post(url, params=params, headers=self.headers)
-        params.pop('leverage')
+        self._signed('POST', url, params)
+        params = {}
+        params['symbol']     = symbol
         params['marginType'] = 'ISOLATED'
         url     = self.basev1 + self.endpoints['marginType']
         
-        self.signRequest(params)
-        self.reqs._post(url, params=params, headers=self.headers)
+        self._signed('POST', url, params)
         return True
         
     
@@ -335,26 +713,69 @@ class binance:
             type str:          The type, 'LIMIT', 'MARKET', 'STOP_LIMIT', 'STOP_MARKET'
             quantity float:    The amount to be traded
         '''
-        if not params.keys().__contains__('symbol'):
-            raise Exception("Mandatory parameter 'symbol' is missing")
-        if not params.keys().__contains__('type'):
-            params['type'] = 'MARKET'
-        if not params.keys().__contains__('side'):
-            raise Exception("Mandatory parameter 'side' is missing")
-        if not params.keys().__contains__('recvWindow'):
-            params['recvWindow'] = 6000
+        params = self._order_params(params)
         
-        params['timestamp'] = int(round(time.time()*1000)) + self.request_delay
-        self.signRequest(params)
         url = ''
         if test: 
             url = self.basev1 + self.endpoints['testOrder']
         else:
             url = self.basev1 + self.endpoints['order']
 
-        data = self.reqs._post(url, params=params, headers=self.headers)
+        lookup = None if test else lambda: self._lookup_order(params['symbol'], params['newClientOrderId'])
+        data = self._signed('POST', url, params, lookup=lookup)
         return data
 
+    def _order_params(self, params:dict):
+        ''' Checks an order against the trading rules and gives it a client order id '''
+        params = dict(params)
+        if not params.keys().__contains__('symbol'):
+            raise Exception("Mandatory parameter 'symbol' is missing")
+        if not params.keys().__contains__('type'):
+            params['type'] = 'MARKET'
+        if not params.keys().__contains__('side'):
+            raise Exception("Mandatory parameter 'side' is missing")
+        with self.metrics.stage('order.validate'):
+            info = self.symbolinfo(params['symbol'])
+            if info != None and params.keys().__contains__('quantity'):
+                info.check(params['quantity'], params.get('price'), params.get('reduceOnly', False))
+        if not params.keys().__contains__('newClientOrderId'):
+            # a resent order keeps its id, so binance can never place it twice
+            params['newClientOrderId'] = uuid.uuid4().hex
+        return params
+
+    def _batch_chunks(self, orders:list):
+        ''' Checks the orders of PlaceBatchOrders and splits them in chunks of 5 '''
+        batch = []
+        for params in orders:
+            params = self._order_params(params)
+            # the batch is a json list of string values, booleans included
+            batch.append({k: str(v).lower() if isinstance(v, bool) else str(v) for k, v in params.items()})
+        return [batch[i:i + 5] for i in range(0, len(batch), 5)]
+
+    def PlaceBatchOrders(self, orders:list):
+        '''
+        Places several orders with one signed request per 5 orders
+
+        Parameters:
+        --
+            orders list:       Order params, as PlaceOrder takes them
+        Returns one result per order, in the same order: the placed order,
+        or the {'code', 'msg'} error of the order that was rejected
+        '''
+        url     = self.basev1 + self.endpoints['batchOrders']
+        results = []
+        for chunk in self._batch_chunks(orders):
+            def lookup(chunk=chunk):
+                # a batch of unknown outcome is only known placed if all of its orders are
+                found = [self._lookup_order(order['symbol'], order['newClientOrderId']) for order in chunk]
+                return None if None in found else found
+            data  = self._signed('POST', url, {'batchOrders': json.dumps(chunk, separators=(',', ':'))}, lookup)
+            if isinstance(data, list):
+                results.extend(data)
+            else:
+                results.extend([data]*len(chunk))       # the whole request failed
+        return results
+
     def CancelOrder(self, symbol, orderId):
         '''
             Cancels the order on a symbol based on orderId
@@ -362,11 +783,33 @@ class binance:
         params = {}
         params['symbol']     = symbol
         params['orderId']    = orderId
-        params['recvWindow'] = 6000
-        params['timestamp'] = int(round(time.time()*1000)) + self.request_delay
-        self.signRequest(params)
         url  = self.basev1 + self.endpoints['order']
-        data = self.reqs._delete(url, params=params, headers=self.headers)
+        data = self._signed('DELETE', url, params)
+        return data
+
+    def CancelBatchOrders(self, symbol:str, orderIds:list):
+        '''
+            Cancels several orders of a symbol with one signed request per 10 orders,
+            returns one result per orderId, in the same order
+        '''
+        url     = self.basev1 + self.endpoints['batchOrders']
+        results = []
+        for i in range(0, len(orderIds), 10):
+            chunk = [int(orderId) for orderId in orderIds[i:i + 10]]
+            data  = self._signed('DELETE', url, {'symbol': symbol,
+                                                 'orderIdList': json.dumps(chunk, separators=(',', ':'))})
+            if isinstance(data, list):
+                results.extend(data)
+            else:
+                results.extend([data]*len(chunk))
+        return results
+
+    def CancelAllOpenOrders(self, symbol:str):
+        '''
+            Cancels every open order of a symbol with one signed request
+        '''
+        url  = self.basev1 + self.endpoints['allOpenOrders']
+        data = self._signed('DELETE', url, {'symbol': symbol})
         return data
 
     def GetOrderInfo(self, symbol, orderId):
@@ -376,27 +819,20 @@ class binance:
         params = {}
         params['symbol']     = symbol
         params['orderId']    = orderId
-        params['recvWindow'] = 6000
-        params['timestamp']  = int(round(time.time()*1000)) + self.request_delay
-        self.signRequest(params)
 
         url  = self.basev1 + self.endpoints['order']
-        data = self.reqs._get(url, params=params, headers=self.headers)
+        data = self._signed('GET', url, params)
         return data
 
     def GetAllOrderInfo(self, symbol, status:str='NEW'):
         '''
-            Gets info about all order on a symbol
+            Gets info about all order on a symbol, open orders come from
+            openOrders, any other status needs the whole allOrders history
         '''
-        params = {}
-        params['symbol']     = symbol
-        params['recvWindow'] = 6000
-        params['timestamp']  = int(round(time.time()*1000)) + self.request_delay
-
-        self.signRequest(params)
-
-        url = self.basev1 + self.endpoints['allOrders']
-        data = self.reqs._get(url, params=params, headers=self.headers)
+        if status in ('NEW', 'PARTIALLY_FILLED'):
+            data = self.GetOpenOrders(symbol)
+        else:
+            data = self.GetOrderHistory(symbol)
         orders = []
         # if data:
         if not status=='ALL':
@@ -407,13 +843,27 @@ class binance:
             orders = data
         return orders
 
+    def GetOrderHistory(self, symbol, orderId=None, limit:int=500):
+        '''
+            Gets the orders of a symbol from allOrders, from orderId on if given
+        '''
+        params = {}
+        params['symbol']     = symbol
+        params['limit']      = limit
+        if orderId != None:
+            params['orderId'] = orderId
+
+        url = self.basev1 + self.endpoints['allOrders']
+        data = self._signed('GET', url, params)
+        return data
+
     def place_limit_order(self, symbol, side, quantity, price):
         params = {}
         params['symbol']      = symbol
         params['side']        = side
-        params['quantity']    = quantity
+        params['quantity']    = self.round_quantity(symbol, quantity)
         params['type']        = 'LIMIT'
-        params['price']       = float2fixed(price, self.prec)
+        params['price']       = self.round_price(symbol, price)
         params['timeInForce'] = 'GTC' #'GTX'
         order = self.PlaceOrder(params, test=False)
         return order
@@ -422,7 +872,7 @@ class binance:
         params = {}
         params['symbol']      = symbol
         params['side']        = side
-        params['quantity']    = quantity
+        params['quantity']    = self.round_quantity(symbol, quantity, market=True)
         params['type']        = 'MARKET'
         if reduceOnly:
             params['reduceOnly']  = True
@@ -433,9 +883,9 @@ class binance:
         params = {}
         params['symbol']          = symbol
         params['side']            = side
-        params['quantity']        = quantity
+        params['quantity']        = self.round_quantity(symbol, quantity)
         params['type']            = 'LIMIT' # LIMIT, MARKET, STOP, STOP_MARKET, TAKE_PROFIT, TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
-        params['price']           = float2fixed(price, self.prec)
+        params['price']           = self.round_price(symbol, price)
         params['reduceOnly']      = True
         params['timeInForce']     = 'GTX'  # GTC, IOC, FOK, GTX
         order = self.PlaceOrder(params, test=False)
@@ -445,10 +895,10 @@ class binance:
         params = {}
         params['symbol']          = symbol
         params['side']            = reverse(side)
-        params['quantity']        = quantity
-        params['stopPrice']       = float2fixed(stprice, self.prec)
+        params['quantity']        = self.round_quantity(symbol, quantity)
+        params['stopPrice']       = self.round_price(symbol, stprice)
         params['type']            = 'TAKE_PROFIT' # LIMIT, MARKET, STOP, STOP_MARKET, TAKE_PROFIT, TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
-        params['price']           = float2fixed(price, self.prec)
+        params['price']           = self.round_price(symbol, price)
         params['reduceOnly']      = True
         params['workingType']     = 'CONTRACT_PRICE' # MARK_PRICE, CONTRACT_PRICE (default)
         params['priceProtection'] = True
@@ -460,8 +910,8 @@ class binance:
         params = {}
         params['symbol']          = symbol
         params['side']            = reverse(side)
-        params['quantity']        = quantity
-        params['stopPrice']       = float2fixed(stprice, self.prec)
+        params['quantity']        = self.round_quantity(symbol, quantity, market=True)
+        params['stopPrice']       = self.round_price(symbol, stprice)
         params['type']            = 'TAKE_PROFIT_MARKET' # LIMIT, MARKET, STOP, STOP_MARKET, TAKE_PROFIT, TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
         params['reduceOnly']      = True
         params['workingType']     = 'MARK_PRICE' # MARK_PRICE, CONTRACT_PRICE (default)
@@ -474,10 +924,10 @@ class binance:
         params = {}
         params['symbol']          = symbol
         params['side']            = reverse(side)
-        params['quantity']        = quantity
-        params['stopPrice']       = float2fixed(stprice, self.prec)
+        params['quantity']        = self.round_quantity(symbol, quantity)
+        params['stopPrice']       = self.round_price(symbol, stprice)
         params['type']            = 'STOP' # LIMIT, MARKET, STOP, STOP_MARKET, TAKE_PROFIT, TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
-        params['price']           = float2fixed(price, self.prec)
+        params['price']           = self.round_price(symbol, price)
         params['reduceOnly']      = True
         params['workingType']     = 'CONTRACT_PRICE' # MARK_PRICE, CONTRACT_PRICE (default)
         params['priceProtection'] = True
@@ -489,8 +939,8 @@ class binance:
         params = {}
         params['symbol']          = symbol
         params['side']            = reverse(side)
-        params['quantity']        = quantity
-        params['stopPrice']       = float2fixed(stprice, self.prec)
+        params['quantity']        = self.round_quantity(symbol, quantity, market=True)
+        params['stopPrice']       = self.round_price(symbol, stprice)
         params['type']            = 'STOP' # LIMIT, MARKET, STOP, STOP_MARKET, TAKE_PROFIT, TAKE_PROFIT_MARKET, TRAILING_STOP_MARKET
         params['reduceOnly']      = True
         params['workingType']     = 'MARK_PRICE' # MARK_PRICE, CONTRACT_PRICE (default)
@@ -499,14 +949,68 @@ class binance:
         order = self.PlaceOrder(params, test=False)
         return order
 
-    def cancel_all_orders(self, symbol):
-        orders = self.GetAllOrderInfo(symbol, status='NEW')
-        if orders:
-            for item in orders:
-                self.CancelOrder(symbol, item['orderId'])
-            return True
+    def place_bracket_order(self, symbol, side, quantity, price, tp_stprice, sl_stprice,
+                            tp_price=None, sl_price=None):
+        '''
+        Places an entry with its take profit and stop loss in one request
+
+        Parameters:
+        --
+            symbol str:        The symbol to trade
+            side str:          The side of the entry 'BUY' or 'SELL'
+            quantity float:    The amount to be traded
+            price float:       The limit price of the entry, None for a market entry
+            tp_stprice float:  The trigger price of the take profit
+            sl_stprice float:  The trigger price of the stop loss
+            tp_price float:    The limit price of the take profit, None for a market one
+            sl_price float:    The limit price of the stop loss, None for a market one
+        Returns {'entry', 'tp', 'sl'}, each the placed order or its error
+        '''
+        entry, tp, sl = self.PlaceBatchOrders(self._bracket_orders(symbol, side, quantity, price, tp_stprice,
+                                                                   sl_stprice, tp_price, sl_price))
+        return {'entry': entry, 'tp': tp, 'sl': sl}
+
+    def _bracket_orders(self, symbol, side, quantity, price, tp_stprice, sl_stprice, tp_price=None, sl_price=None):
+        ''' The entry, take profit and stop loss params of place_bracket_order '''
+        entry = {}
+        entry['symbol']      = symbol
+        entry['side']        = side
+        if price == None:
+            entry['type']        = 'MARKET'
+            entry['quantity']    = self.round_quantity(symbol, quantity, market=True)
         else:
+            entry['type']        = 'LIMIT'
+            entry['quantity']    = self.round_quantity(symbol, quantity)
+            entry['price']       = self.round_price(symbol, price)
+            entry['timeInForce'] = 'GTC'
+        exits = []
+        for kind, stprice, lmtprice in (('TAKE_PROFIT', tp_stprice, tp_price), ('STOP', sl_stprice, sl_price)):
+            params = {}
+            params['symbol']          = symbol
+            params['side']            = reverse(side)
+            params['stopPrice']       = self.round_price(symbol, stprice)
+            params['reduceOnly']      = True
+            params['priceProtection'] = True
+            params['timeInForce']     = 'GTC'
+            if lmtprice == None:
+                params['type']        = kind + '_MARKET' if kind == 'TAKE_PROFIT' else 'STOP_MARKET'
+                params['quantity']    = self.round_quantity(symbol, quantity, market=True)
+                params['workingType'] = 'MARK_PRICE'
+            else:
+                params['type']        = kind
+                params['quantity']    = self.round_quantity(symbol, quantity)
+                params['price']       = self.round_price(symbol, lmtprice)
+                params['workingType'] = 'CONTRACT_PRICE'
+            exits.append(params)
+        return [entry] + exits
+
+    def cancel_all_orders(self, symbol):
+        ''' Cancels every open order of a symbol in one request,
+            False if it had no open order to cancel '''
+        if not self.GetOpenOrders(symbol):
             return False
+        data = self.CancelAllOpenOrders(symbol)
+        return isinstance(data, dict) and str(data.get('code')) == '200'
 
     def proctor(self, symbol):
         position           = self.GetPositionData(symbol)[0]
@@ -514,22 +1018,18 @@ class binance:
         if posamt_signed=='0.000':
             return None
         else:
-            # posamt         = str(abs(float(posamt_signed)))
-            entryPrice     = position['entryPrice']
-            # markPrice      = position['markPrice']
-            liqPrice       = position['liquidationPrice']
-            # side           = whichside(entryPrice, liqPrice)
             neworders      = self.GetAllOrderInfo(symbol)
-            if len(neworders)==2:
-                tpy = []
-                for item in neworders:
-                    tpy.append(item['type'])
-                if (('PROFIT' in tpy[0]) or 'PROFIT' in tpy[1]) and (('STOP' in tpy[0]) or ('STOP' in tpy[1])):
-                    print('position is safe!')
-                    return 'PROTECTED'
+            if protected(neworders):
+                print('position is safe!')
+                return 'PROTECTED'
             print('position is not safe! Need to close emergentically')
             return 'NOT PROTECTED'
 
+    def proctor_all(self, maxage:float=None):
+        ''' The proctor check of every open position in two requests,
+            from a portfolio snapshot at most maxage seconds old '''
+        return self.portfolio.protection(maxage)
+
     def closeposition(self, symbol):
         position           = self.GetPositionData(symbol)[0]
         posamt_signed      = position['positionAmt']
@@ -538,27 +1038,48 @@ class binance:
             entryPrice     = position['entryPrice']
             liqPrice       = position['liquidationPrice']
             side           = whichside(entryPrice, liqPrice)
-            order          = self.place_market_order(symbol, reverse(side), posamt, True)
-            self.cancel_all_orders(symbol)
+            # the close and the cancel of the protecting orders go out together
+            with ThreadPoolExecutor(2) as pool:
+                order      = pool.submit(self.place_market_order, symbol, reverse(side), posamt, True)
+                pool.submit(self.cancel_all_orders, symbol).result()
+                order.result()
             return True
         else:
             return False
 
-    def pending_tofill_order(self, symbol, orderId, durab:int=60):
+    def start_userstream(self, url:str='wss://fstream.binance.com'):
+        ''' Follows the user data stream, order waits then need no polling '''
+        if self.userstream == None:
+            self.userstream = userstream(self, url).start()
+            self.orderindex.attach(self.userstream)
+        return self.userstream
+
+    def pending_tofill_order(self, symbol, orderId, durab:int=60, poll:float=1):
+        ''' Waits for an order to fill, cancels it after durab seconds.
+            Uses the user data stream when started, else polls every `poll` seconds '''
         stime   = time.time()
         endtime = stime + durab
-        print(stime)
-        print(endtime)
+        if self.userstream != None:
+            order = self.userstream.wait(symbol, orderId, timeout=durab)
+            if order == None:
+                order = self.GetOrderInfo(symbol, orderId)     # it may have filled unseen by the stream
+            if order.get('status') == 'FILLED':
+                print('Order number {} filled successfully'.format(orderId))
+                return True
+            if order.get('status') not in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                self.CancelOrder(symbol, orderId)
+            return False
         while True:
             order = self.GetOrderInfo(symbol, orderId)
-            print(order)
-            if order['status'] in ('FILLED'):
+            if order.get('status') == 'FILLED':
                 print('Order number {} filled successfully'.format(orderId))
                 return True
-            else:
-                if time.time()>endtime:
-                    self.CancelOrder(symbol, orderId)
-                    return False
+            if order.get('status') in ('CANCELED', 'EXPIRED', 'REJECTED'):
+                return False
+            if time.time() > endtime:
+                self.CancelOrder(symbol, orderId)
+                return False
+            time.sleep(min(poll, max(0, endtime - time.time())))
 
 if __name__ == '__main__':
     symbol   = 'BTCUSDT'
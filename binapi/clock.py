@@ -0,0 +1,94 @@
+import threading
+import time
+
+"""
+Here a clock synchronizer is defined, measuring the offset between the
+local clock and the server clock of binance from a few samples of the
+`time` endpoint, NTP style: every sample brackets the server time with
+the local send and receive times, and the sample with the shortest
+round trip gives the offset. It resyncs on an interval in a background
+thread, so stamping a signed request is only an addition.
+Args:
+    client:     a binance instance used to reach the `time` endpoint
+    samples:    number of samples taken on every sync
+    interval:   seconds between two background syncs
+Returns:
+    Nothing
+"""
+
+class clocksync:
+
+    def __init__(self, client, samples:int=5, interval:float=300):
+        self.client   = client
+        self.samples  = samples
+        self.interval = interval
+        self.offset   = 0.0      # server time minus local time, in ms
+        self.rtt      = None     # round trip of the best sample, in ms
+        self.synced   = 0        # local time of the last successful sync
+        self.wakeup   = threading.Event()
+        self.running  = False
+        self.thread   = None
+        self.lock     = threading.Lock()
+
+    def sample(self):
+        ''' Takes one (offset, round trip) sample, None if the server did not answer '''
+        url  = self.client.basev1 + self.client.endpoints['time']
+        t0   = time.time()*1000
+        data = self.client.reqs._get(url)
+        t1   = time.time()*1000
+        if not isinstance(data, dict) or not data.__contains__('serverTime'):
+            return None
+        return data['serverTime'] - (t0 + t1)/2, t1 - t0
+
+    def sync(self):
+        ''' Measures the offset again, returns False if no sample succeeded '''
+        with self.lock:
+            samples = [s for s in (self.sample() for _ in range(self.samples)) if s != None]
+            if not samples:
+                return False
+            self.offset, self.rtt = min(samples, key=lambda s: s[1])
+            self.synced = time.time()
+            return True
+
+    def now(self):
+        ''' The current server time in ms, as estimated locally '''
+        return int(time.time()*1000 + self.offset)
+
+    @property
+    def latency(self):
+        ''' One way latency to the server in ms, None before the first sync '''
+        return None if self.rtt == None else self.rtt/2
+
+    def recv_window(self, margin:float=250, minimum:int=1000, maximum:int=60000):
+        ''' A recvWindow that covers the measured latency plus a safety margin '''
+        if self.rtt == None:
+            return maximum
+        return int(min(maximum, max(minimum, 2*self.rtt + margin)))
+
+    def _run(self, sync:bool=False):
+        if sync:
+            self.sync()
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.running:
+                self.sync()
+
+    def start(self, sync:bool=False):
+        ''' Starts resyncing in the background every `interval` seconds, sync also syncs right away '''
+        if self.running:
+            return
+        self.running = True
+        self.thread  = threading.Thread(target=self._run, args=(sync,), daemon=True)
+        self.thread.start()
+
+    def resync(self):
+        ''' Asks the background thread for a sync now, without waiting for it '''
+        if self.running:
+            self.wakeup.set()
+        else:
+            threading.Thread(target=self.sync, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
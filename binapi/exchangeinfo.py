@@ -0,0 +1,155 @@
+import threading
+import time
+from decimal import Decimal, ROUND_DOWN
+
+"""
+Here a cache of the exchange metadata is defined. The exchangeInfo
+document is downloaded once per `ttl` seconds, indexed by symbol and
+quote asset, and the trading filters of every symbol are precomputed,
+so rounding and validating an order is a dict lookup instead of a
+network fetch or a rejected order.
+Args:
+    client:     a binance instance used to download exchangeInfo
+    ttl:        seconds after which the document is downloaded again
+Returns:
+    data
+"""
+
+class symbolinfo:
+    ''' The trading rules of one symbol '''
+
+    __slots__ = ('symbol', 'status', 'baseAsset', 'quoteAsset', 'tickSize', 'minPrice', 'maxPrice',
+                 'stepSize', 'minQty', 'maxQty', 'marketStepSize', 'marketMinQty', 'minNotional', 'data')
+
+    def __init__(self, pair:dict):
+        self.symbol     = pair['symbol']
+        self.status     = pair['status']
+        self.baseAsset  = pair.get('baseAsset')
+        self.quoteAsset = pair.get('quoteAsset')
+        self.data       = pair
+        filters         = {f['filterType']: f for f in pair.get('filters', [])}
+        price           = filters.get('PRICE_FILTER', {})
+        lot             = filters.get('LOT_SIZE', {})
+        market          = filters.get('MARKET_LOT_SIZE', lot)
+        notional        = filters.get('MIN_NOTIONAL', {})
+        self.tickSize   = Decimal(price.get('tickSize', '0')).normalize()
+        self.minPrice   = Decimal(price.get('minPrice', '0'))
+        self.maxPrice   = Decimal(price.get('maxPrice', '0'))
+        self.stepSize   = Decimal(lot.get('stepSize', '0')).normalize()
+        self.minQty     = Decimal(lot.get('minQty', '0'))
+        self.maxQty     = Decimal(lot.get('maxQty', '0'))
+        self.marketStepSize = Decimal(market.get('stepSize', '0')).normalize()
+        self.marketMinQty   = Decimal(market.get('minQty', '0'))
+        self.minNotional    = Decimal(notional.get('notional', notional.get('minNotional', '0')))
+
+    @staticmethod
+    def _floor(value, step):
+        value = Decimal(str(value))
+        if not step:
+            return value
+        return ((value / step).to_integral_value(ROUND_DOWN) * step).quantize(step)
+
+    def price(self, price):
+        ''' Rounds a price down to the tick size, as a string '''
+        return format(self._floor(price, self.tickSize), 'f')
+
+    def quantity(self, quantity, market:bool=False):
+        ''' Rounds a quantity down to the step size, as a string '''
+        return format(self._floor(quantity, self.marketStepSize if market else self.stepSize), 'f')
+
+    def check(self, quantity, price=None, reduceOnly:bool=False):
+        ''' Raises if an order of this quantity and price would be rejected by the filters '''
+        quantity = Decimal(str(quantity))
+        minQty   = self.marketMinQty if price == None else self.minQty
+        if quantity < minQty:
+            raise Exception("Quantity {} of {} is below the minimum {}".format(quantity, self.symbol, minQty))
+        if self.maxQty and quantity > self.maxQty:
+            raise Exception("Quantity {} of {} is above the maximum {}".format(quantity, self.symbol, self.maxQty))
+        if price != None:
+            price = Decimal(str(price))
+            if price < self.minPrice or (self.maxPrice and price > self.maxPrice):
+                raise Exception("Price {} of {} is out of [{}, {}]".format(price, self.symbol, self.minPrice, self.maxPrice))
+            if not reduceOnly and price*quantity < self.minNotional:
+                raise Exception("Notional {} of {} is below the minimum {}".format(price*quantity, self.symbol, self.minNotional))
+
+
+class exchangeinfo:
+
+    min_refresh = 60    # seconds, an unknown symbol triggers at most one refresh this often
+
+    def __init__(self, client, ttl:float=3600):
+        self.client     = client
+        self.ttl        = ttl
+        self.lock       = threading.Lock()
+        self.fetched    = 0
+        self.symbols    = {}     # symbol -> symbolinfo
+        self.by_quote   = {}     # quote asset -> [symbol, ...]
+        self.rateLimits = []
+        self.refreshing = False
+
+    def refresh(self, force:bool=False):
+        ''' Downloads exchangeInfo again if forced or older than ttl '''
+        with self.lock:
+            if not force and self.symbols and time.time() - self.fetched < self.ttl:
+                return False
+            url  = self.client.basev1 + self.client.endpoints['exchangeInfo']
+            data = self.client.reqs._get(url)
+            if data.__contains__('code'):
+                raise Exception("Failed to read exchange information")
+            symbols  = {}
+            by_quote = {}
+            for pair in data['symbols']:
+                info = symbolinfo(pair)
+                symbols[info.symbol] = info
+                by_quote.setdefault(info.quoteAsset, []).append(info.symbol)
+            self.symbols, self.by_quote = symbols, by_quote
+            self.rateLimits = data.get('rateLimits', [])
+            self.fetched    = time.time()
+        self._apply_limits()
+        return True
+
+    def _apply_limits(self):
+        ''' Keeps the client rate limiter in line with the published limits '''
+        limiter = getattr(self.client, 'limiter', None)
+        if limiter == None:
+            return
+        for limit in self.rateLimits:
+            kind = (limit.get('rateLimitType'), limit.get('interval'), limit.get('intervalNum', 1))
+            if kind == ('REQUEST_WEIGHT', 'MINUTE', 1):
+                limiter.weight_limit = int(limit['limit'])
+            elif kind == ('ORDERS', 'MINUTE', 1):
+                limiter.order_limit_1m = int(limit['limit'])
+            elif kind == ('ORDERS', 'SECOND', 10):
+                limiter.order_limit_10s = int(limit['limit'])
+
+    def _refresh_async(self):
+        ''' Downloads exchangeInfo again in the background, keeping the stale copy meanwhile '''
+        if self.refreshing:
+            return
+        self.refreshing = True
+        def run():
+            try:
+                self.refresh(force=True)
+            except Exception as e:
+                print(e)
+            finally:
+                self.refreshing = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, symbol:str):
+        ''' Returns the symbolinfo of a symbol, None if the exchange does not list it.
+            A stale cache is still served while it is refreshed in the background '''
+        if not self.symbols:
+            self.refresh()
+        elif time.time() - self.fetched > self.ttl:
+            self._refresh_async()
+        info = self.symbols.get(symbol)
+        if info == None and time.time() - self.fetched > self.min_refresh:
+            self.refresh(force=True)                # maybe listed since the last download
+            info = self.symbols.get(symbol)
+        return info
+
+    def quote(self, quoteAssets:list):
+        ''' Returns the symbols of the given quote assets '''
+        self.refresh()
+        return [symbol for asset in quoteAssets for symbol in self.by_quote.get(asset, [])]
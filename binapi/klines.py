@@ -0,0 +1,72 @@
+import json
+import numpy as np
+
+"""
+Here the kline parsing engine is defined. A raw klines response is
+decoded in a single pass straight into typed numpy columns, without
+building python lists or object arrays on the way. Pandas is only
+touched by `frame`, as an optional last step.
+Args:
+    raw:        the undecoded response body of the klines endpoint
+Returns:
+    data
+"""
+
+COLUMNS       = ['time', 'open', 'high', 'low', 'close', 'volume']
+EXTRA_COLUMNS = ['quote_volume', 'trades', 'taker_base_volume', 'taker_quote_volume']
+
+# position of every column in a kline row of the api
+_FIELDS = {'time': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5,
+           'quote_volume': 7, 'trades': 8, 'taker_base_volume': 9, 'taker_quote_volume': 10}
+_INTS   = ('time', 'trades')
+
+
+def parse(raw:bytes, extra:bool=False):
+    '''
+    Decodes a klines response into a dict of contiguous numpy columns
+
+    Parameters:
+    --
+        raw bytes:         The response body, a json list of kline rows
+        extra bool:        Also keep the quote volume, trade count and taker-buy columns
+    '''
+    # all the numbers, quoted or not, become one comma separated list
+    body   = raw.translate(None, b'[]" \n\r\t')
+    values = np.fromstring(body, dtype=np.float64, sep=',') if body else np.empty(0)
+    if values.size % 12:
+        raise Exception("Malformed klines response: {}".format(raw[:200]))
+    table  = values.reshape(-1, 12)
+    names  = COLUMNS + EXTRA_COLUMNS if extra else COLUMNS
+    return {name: np.ascontiguousarray(table[:, _FIELDS[name]],
+                                       dtype=np.int64 if name in _INTS else np.float64)
+            for name in names}
+
+
+def error(raw:bytes):
+    ''' Returns the decoded error if raw is an error answer instead of klines '''
+    if isinstance(raw, dict):
+        return raw
+    if raw[:1] == b'{':
+        return json.loads(raw)
+    return None
+
+
+def frame(columns:dict):
+    ''' Wraps parsed columns into a DataFrame with the GetSymbolKlines layout '''
+    import pandas as pd
+    df = pd.DataFrame(columns, copy=False)
+    df['date'] = columns['time'].astype('datetime64[ms]').astype('datetime64[ns]')
+    return df
+
+
+def merge(pages:list):
+    ''' Concatenates parsed pages once, by open time, the last copy of a
+        candle read twice wins, like the newer page it came from '''
+    full = [page for page in pages if len(page['time'])]
+    if len(full) < 2:
+        return full[0] if full else pages[0]
+    columns = {name: np.concatenate([page[name] for page in full]) for name in full[0]}
+    times   = columns['time'][::-1]
+    _, last = np.unique(times, return_index=True)
+    keep    = len(times) - 1 - last
+    return {name: values[keep] for name, values in columns.items()}
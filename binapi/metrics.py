@@ -0,0 +1,177 @@
+import threading
+import time
+from bisect import bisect_left
+
+"""
+Here the instrumentation of a binance instance is defined: latency
+histograms per endpoint and per stage (network, decoding, signing,
+parsing, frame building), and counters of calls, retries, errors and
+consumed weight. Histograms keep counts in fixed log spaced buckets, so
+recording a sample is a binary search and an increment, and p50/p95/p99
+are read from the buckets. Everything can be exported in the Prometheus
+text format or pushed to hooks as it is recorded. A disabled instance
+returns at the first line of every call and its stage timer is a shared
+no-op context.
+Args:
+    enabled:    record samples, False makes every call a no-op
+Returns:
+    data
+"""
+
+# bucket bounds in seconds, from 50us to about 80s, every bucket 1.5 times the previous one
+BOUNDS = [0.00005*1.5**i for i in range(36)]
+
+
+class histogram:
+
+    def __init__(self, bounds:list=BOUNDS):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds) + 1)
+        self.count  = 0
+        self.sum    = 0.0
+        self.max    = 0.0
+        self.lock   = threading.Lock()
+
+    def observe(self, value:float):
+        i = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count     += 1
+            self.sum       += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q:float):
+        ''' The q quantile (0 to 1), interpolated inside its bucket, None without samples '''
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q*self.count
+            seen = 0
+            for i, count in enumerate(self.counts):
+                if count and seen + count >= rank:
+                    low  = self.bounds[i - 1] if i else 0.0
+                    high = self.bounds[i] if i < len(self.bounds) else self.max
+                    return min(self.max, low + (high - low)*(rank - seen)/count)
+                seen += count
+            return self.max
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max, 'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95), 'p99': self.percentile(0.99)}
+
+
+class _stage:
+    ''' Times a block into a histogram '''
+
+    __slots__ = ('metrics', 'name', 'label', 'started')
+
+    def __init__(self, metrics, name, label):
+        self.metrics = metrics
+        self.name    = name
+        self.label   = label
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, self.label, time.perf_counter() - self.started)
+
+
+class _nostage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOSTAGE = _nostage()
+
+
+class metrics:
+
+    def __init__(self, enabled:bool=True):
+        self.enabled    = enabled
+        self.histograms = {}          # (name, label) -> histogram
+        self.counters   = {}          # (name, label) -> value
+        self.hooks      = []
+        self.lock       = threading.Lock()
+
+    def hook(self, callback):
+        ''' Calls callback(kind, name, label, value) on every sample, kind is 'observe' or 'inc' '''
+        self.hooks.append(callback)
+
+    def observe(self, name:str, label:str, seconds:float):
+        ''' Records a duration, like observe('request', 'klines', 0.012) '''
+        if not self.enabled:
+            return
+        h = self.histograms.get((name, label))
+        if h is None:
+            with self.lock:
+                h = self.histograms.setdefault((name, label), histogram())
+        h.observe(seconds)
+        for callback in self.hooks:
+            callback('observe', name, label, seconds)
+
+    def inc(self, name:str, label:str, value:float=1):
+        ''' Adds to a counter, like inc('weight', 'klines', 5) '''
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+        for callback in self.hooks:
+            callback('inc', name, label, value)
+
+    def stage(self, label:str, name:str='stage'):
+        ''' A context manager timing a block, like `with metrics.stage('klines.parse'):` '''
+        if not self.enabled:
+            return NOSTAGE
+        return _stage(self, name, label)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters   = {}
+
+    def summary(self):
+        ''' {'histograms': {name: {label: {count, sum, max, p50, p95, p99}}}, 'counters': {name: {label: value}}} '''
+        with self.lock:
+            histograms, counters = dict(self.histograms), dict(self.counters)
+        data = {'histograms': {}, 'counters': {}}
+        for (name, label), h in sorted(histograms.items()):
+            data['histograms'].setdefault(name, {})[label] = h.summary()
+        for (name, label), value in sorted(counters.items()):
+            data['counters'].setdefault(name, {})[label] = value
+        return data
+
+    def prometheus(self, prefix:str='binapi'):
+        ''' Everything recorded, in the Prometheus text exposition format '''
+        with self.lock:
+            histograms, counters = dict(self.histograms), dict(self.counters)
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            metric = '{}_{}_seconds'.format(prefix, name)
+            key    = 'stage' if name == 'stage' else 'endpoint'
+            lines.append('# TYPE {} histogram'.format(metric))
+            for (hname, label), h in sorted(histograms.items()):
+                if hname != name:
+                    continue
+                with h.lock:
+                    counts, count, total = list(h.counts), h.count, h.sum
+                cumulative = 0
+                for bound, n in zip(h.bounds, counts):
+                    cumulative += n
+                    lines.append('{}_bucket{{{}="{}",le="{:.6g}"}} {}'.format(metric, key, label, bound, cumulative))
+                lines.append('{}_bucket{{{}="{}",le="+Inf"}} {}'.format(metric, key, label, count))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(metric, key, label, total))
+                lines.append('{}_count{{{}="{}"}} {}'.format(metric, key, label, count))
+        for name in sorted({name for name, _ in counters}):
+            metric = '{}_{}_total'.format(prefix, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            for (cname, label), value in sorted(counters.items()):
+                if cname == name:
+                    lines.append('{}{{endpoint="{}"}} {}'.format(metric, label, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,226 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+"""
+Here a locally maintained order book is defined. It starts from a REST
+depth snapshot and applies the diff events of the `@depth@100ms` stream
+on top, following the update id sequencing of binance futures: events
+older than the snapshot are dropped, the first applied event must
+straddle the snapshot id, and every later event must continue the
+previous one (pu == last u), else the book is resynced from a new
+snapshot while the events keep being buffered. Each side keeps its
+prices in a sorted array with a price -> quantity dict, so the best
+level is O(1) and a level update is a binary search.
+Args:
+    symbol:     the symbol of the book
+    client:     a binance instance, for the depth snapshots
+    limit:      number of levels of the snapshots
+Returns:
+    data
+"""
+
+class bookside:
+    ''' One side of a book, best level first '''
+
+    def __init__(self, descending:bool):
+        self.sign   = -1 if descending else 1
+        self.keys   = []          # sign*price, ascending, so the best level is keys[0]
+        self.levels = {}          # price -> quantity
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys   = []
+        self.levels = {}
+
+    def set(self, price:float, quantity:float):
+        ''' Sets the quantity of a level, 0 removes it '''
+        key = self.sign*price
+        if quantity == 0:
+            if self.levels.pop(price, None) != None:
+                del self.keys[bisect_left(self.keys, key)]
+        else:
+            if price not in self.levels:
+                i = bisect_left(self.keys, key)
+                self.keys.insert(i, key)
+            self.levels[price] = quantity
+
+    def best(self):
+        ''' (price, quantity) of the best level, None if empty '''
+        if not self.keys:
+            return None
+        price = self.sign*self.keys[0]
+        return price, self.levels[price]
+
+    def top(self, n:int):
+        ''' The n best levels as [(price, quantity), ...] '''
+        return [(self.sign*key, self.levels[self.sign*key]) for key in self.keys[:n]]
+
+    def walk(self, quantity:float):
+        ''' (filled quantity, cost, last price reached) of taking `quantity` off this side '''
+        filled = cost = 0.0
+        price  = None
+        for key in self.keys:
+            price = self.sign*key
+            take  = min(self.levels[price], quantity - filled)
+            filled += take
+            cost   += take*price
+            if filled >= quantity:
+                break
+        return filled, cost, price
+
+    def depth(self, bound:float):
+        ''' Cumulative quantity of the levels at or better than a price '''
+        return sum(self.levels[self.sign*k] for k in self.keys[:bisect_right(self.keys, self.sign*bound)])
+
+
+class orderbook:
+
+    def __init__(self, symbol:str, client=None, limit:int=1000):
+        self.symbol       = symbol.upper()
+        self.client       = client
+        self.limit        = limit
+        self.bids         = bookside(descending=True)
+        self.asks         = bookside(descending=False)
+        self.lastUpdateId = None          # id of the last event applied, or of the snapshot
+        self.synced       = False         # False until a snapshot and its first event are applied
+        self.pending      = []            # events received while waiting for a snapshot
+        self.resyncs      = 0
+        self.updates      = 0
+        self.lock         = threading.RLock()
+        self.fetching     = False
+
+    def load(self, snapshot:dict):
+        ''' Replaces the book with a REST depth snapshot, then replays the buffered events '''
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            for price, quantity in snapshot['bids']:
+                self.bids.set(float(price), float(quantity))
+            for price, quantity in snapshot['asks']:
+                self.asks.set(float(price), float(quantity))
+            self.lastUpdateId = snapshot['lastUpdateId']
+            self.synced       = False
+            pending, self.pending = self.pending, []
+            for event in pending:
+                self.apply(event)
+
+    def resync(self, wait:bool=False):
+        ''' Downloads a new snapshot, in the background unless `wait` '''
+        if self.client == None:
+            raise Exception("orderbook of {} needs a client to resync".format(self.symbol))
+        with self.lock:
+            if self.fetching:
+                return
+            self.fetching = True
+            self.synced   = False
+            self.resyncs += 1
+        def run():
+            try:
+                snapshot = self.client.GetOrderBook(self.symbol, self.limit)
+                if snapshot.__contains__('code'):
+                    raise Exception("Failed to read the order book of {}: {}".format(self.symbol, snapshot))
+                with self.lock:
+                    self.fetching = False
+                    self.load(snapshot)
+            except Exception as e:
+                print(e)
+                with self.lock:
+                    self.fetching     = False
+                    self.lastUpdateId = None
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, daemon=True).start()
+
+    def apply(self, event:dict):
+        '''
+        Applies one depthUpdate event, returns True if the book changed
+
+        Parameters:
+        --
+            event dict:        The payload of the depth stream, with U, u, pu, b and a
+        '''
+        with self.lock:
+            if self.lastUpdateId == None or self.fetching:
+                self.pending.append(event)
+                if self.lastUpdateId == None and not self.fetching and self.client != None:
+                    self.resync()
+                return False
+            if event['u'] < self.lastUpdateId:
+                return False                        # already in the snapshot
+            if self.synced:
+                if event['pu'] != self.lastUpdateId:
+                    self.pending.append(event)      # a gap, the book cannot be trusted anymore
+                    if self.client != None:
+                        self.resync()
+                    else:
+                        self.lastUpdateId = None
+                        self.synced       = False
+                    return False
+            elif event['U'] > self.lastUpdateId:
+                self.pending.append(event)          # the snapshot is older than the stream
+                if self.client != None:
+                    self.resync()
+                return False
+            for price, quantity in event['b']:
+                self.bids.set(float(price), float(quantity))
+            for price, quantity in event['a']:
+                self.asks.set(float(price), float(quantity))
+            self.lastUpdateId = event['u']
+            self.synced       = True
+            self.updates     += 1
+            return True
+
+    def bid(self):
+        ''' (price, quantity) of the best bid '''
+        return self.bids.best()
+
+    def ask(self):
+        ''' (price, quantity) of the best ask '''
+        return self.asks.best()
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid == None or ask == None:
+            return None
+        return (bid[0] + ask[0])/2
+
+    def spread(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid == None or ask == None:
+            return None
+        return ask[0] - bid[0]
+
+    def top(self, n:int=10):
+        ''' The n best levels of each side, as {'bids': [(price, qty), ...], 'asks': [...]} '''
+        with self.lock:
+            return {'bids': self.bids.top(n), 'asks': self.asks.top(n)}
+
+    def depth(self, side:str, price:float):
+        ''' Cumulative quantity offered at or better than a price, side is 'BUY' or 'SELL'
+            for the order that would take it '''
+        with self.lock:
+            return (self.asks if side == 'BUY' else self.bids).depth(price)
+
+    def slippage(self, side:str, quantity:float):
+        '''
+        Estimates the fill of a market order against the book
+
+        Parameters:
+        --
+            side str:          'BUY' takes the asks, 'SELL' takes the bids
+            quantity float:    The quantity of the order
+        Returns a dict with the filled quantity, the average price, the worst price
+        reached and the slippage of the average price to the best price, as a fraction
+        '''
+        with self.lock:
+            book = self.asks if side == 'BUY' else self.bids
+            best = book.best()
+            if best == None:
+                return None
+            filled, cost, worst = book.walk(quantity)
+            average = cost/filled if filled else None
+            return {'filled': filled, 'average': average, 'worst': worst,
+                    'slippage': abs(average - best[0])/best[0] if average else None}
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+from .userstream import order_update
+
+"""
+Here a local index of the orders of an account is defined. Live orders
+come from openOrders, history comes from allOrders read incrementally
+with an orderId cursor per symbol, so every order is downloaded once.
+Orders are indexed by (symbol, orderId), orderIds being unique within a
+symbol only, and by symbol and status for O(1) lookups, can be kept on
+disk between runs, follow the user data stream if one is attached, and
+can be reconciled against the exchange at any time.
+Args:
+    client:     a binance instance used to read the orders
+    path:       json file the index is kept in, None to keep it in memory
+Returns:
+    data
+"""
+
+OPEN_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+
+
+class orderindex:
+
+    def __init__(self, client, path:str=None):
+        self.client    = client
+        self.path      = path
+        self.lock      = threading.RLock()
+        self.orders    = {}          # (symbol, orderId) -> order
+        self.by_symbol = {}          # symbol -> {(symbol, orderId), ...}
+        self.by_status = {}          # status -> {(symbol, orderId), ...}
+        self.cursors   = {}          # symbol -> highest orderId read from allOrders
+        if path != None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order:dict):
+        ''' Inserts or updates an order, keeping the indexes in line '''
+        key = (order['symbol'], int(order['orderId']))
+        with self.lock:
+            known = self.orders.get(key)
+            if known != None:
+                if known.get('updateTime', 0) > order.get('updateTime', 0):
+                    return known                    # an older copy of the order
+                self.by_status.get(known['status'], set()).discard(key)
+                order = dict(known, **order)
+            self.orders[key] = order
+            self.by_symbol.setdefault(order['symbol'], set()).add(key)
+            self.by_status.setdefault(order['status'], set()).add(key)
+            return order
+
+    def get(self, symbol:str, orderId):
+        return self.orders.get((symbol, int(orderId)))
+
+    def symbol(self, symbol:str, status:str=None):
+        ''' The orders of a symbol, of one status if given, by orderId '''
+        with self.lock:
+            keys = self.by_symbol.get(symbol, set())
+            if status != None:
+                keys = keys & self.by_status.get(status, set())
+            return [self.orders[key] for key in sorted(keys)]
+
+    def status(self, status:str):
+        ''' The orders of one status, by symbol and orderId '''
+        with self.lock:
+            return [self.orders[key] for key in sorted(self.by_status.get(status, set()))]
+
+    def open(self, symbol:str=None):
+        ''' The orders known to be open, of a symbol or of every symbol '''
+        with self.lock:
+            keys = set().union(*(self.by_status.get(status, set()) for status in OPEN_STATUSES))
+            if symbol != None:
+                keys &= self.by_symbol.get(symbol, set())
+            return [self.orders[key] for key in sorted(keys)]
+
+    def refresh_open(self, symbol:str=None):
+        ''' Reads the live orders from openOrders, of a symbol or of the whole account '''
+        data = self.client.GetOpenOrders(symbol)
+        if not isinstance(data, list):
+            raise Exception("Failed to read the open orders: {}".format(data))
+        for order in data:
+            self.add(order)
+        return data
+
+    def history(self, symbol:str, limit:int=1000):
+        ''' Reads the orders of a symbol placed since the last call, returns the new ones '''
+        new = []
+        while True:
+            cursor = self.cursors.get(symbol)
+            data   = self.client.GetOrderHistory(symbol, None if cursor == None else cursor + 1, limit)
+            if not isinstance(data, list):
+                raise Exception("Failed to read the orders of {}: {}".format(symbol, data))
+            for order in data:
+                new.append(self.add(order))
+            if data:
+                self.cursors[symbol] = max(int(order['orderId']) for order in data)
+            if len(data) < limit:
+                break
+        return new
+
+    def reconcile(self, symbol:str=None):
+        '''
+        Brings the index in line with the exchange
+
+        Parameters:
+        --
+            symbol str:        The symbol to reconcile, None for the whole account
+        Returns {'added': [...], 'closed': [...]}: the open orders the index
+        did not know, and the orders it thought open that are not anymore
+        '''
+        with self.lock:
+            known  = set(self.orders)
+            opened = self.open(symbol)
+        live   = {(order['symbol'], int(order['orderId'])): order for order in self.refresh_open(symbol)}
+        added  = [order for key, order in live.items() if key not in known]
+        closed = []
+        for order in opened:
+            if (order['symbol'], int(order['orderId'])) not in live:
+                data = self.client.GetOrderInfo(order['symbol'], order['orderId'])
+                if isinstance(data, dict) and data.__contains__('status'):
+                    closed.append(self.add(data))
+        if self.path != None:
+            self.save()
+        return {'added': added, 'closed': closed}
+
+    def attach(self, stream):
+        ''' Follows the order updates of a userstream '''
+        def follow(event):
+            if event.get('e') == 'ORDER_TRADE_UPDATE':
+                self.add(order_update(event['o']))
+        stream.on_event(follow)
+
+    def save(self, path:str=None):
+        ''' Writes the index to its json file, atomically '''
+        path = path or self.path
+        with self.lock:
+            data = {'orders': list(self.orders.values()), 'cursors': self.cursors}
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path:str=None):
+        ''' Reads the index back from its json file '''
+        with open(path or self.path) as f:
+            data = json.load(f)
+        with self.lock:
+            for order in data['orders']:
+                self.add(order)
+            self.cursors.update(data['cursors'])
@@ -0,0 +1,84 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Here an account wide portfolio snapshot is defined. The positions of
+every symbol (positionRisk without a symbol) and the open orders of the
+whole account (openOrders without a symbol) are read in two concurrent
+calls and indexed by symbol, so supervising many symbols costs two
+requests per sweep instead of two per symbol. The snapshot is reused
+until it is older than `maxage` seconds.
+Args:
+    client:     a binance instance used to read the account
+    maxage:     seconds a snapshot is served before it is read again
+Returns:
+    data
+"""
+
+def protected(orders:list):
+    ''' True if the open orders of a position are exactly a take profit and a stop loss '''
+    if len(orders) != 2:
+        return False
+    types = [order['type'] for order in orders]
+    return (('PROFIT' in types[0]) or ('PROFIT' in types[1])) and (('STOP' in types[0]) or ('STOP' in types[1]))
+
+
+class portfolio:
+
+    def __init__(self, client, maxage:float=5):
+        self.client    = client
+        self.maxage    = maxage
+        self.lock      = threading.Lock()
+        self.fetched   = 0
+        self.positions = {}          # symbol -> [position, ...], one per position side
+        self.orders    = {}          # symbol -> [open order, ...]
+
+    def refresh(self):
+        ''' Reads the positions and the open orders of the whole account again '''
+        with self.lock:
+            started = time.time()
+            with ThreadPoolExecutor(2) as pool:
+                positions = pool.submit(self.client.GetPositionData)
+                orders    = pool.submit(self.client.GetOpenOrders)
+                positions, orders = positions.result(), orders.result()
+            if not isinstance(positions, list):
+                raise Exception("Failed to read the positions: {}".format(positions))
+            if not isinstance(orders, list):
+                raise Exception("Failed to read the open orders: {}".format(orders))
+            self.positions = {}
+            for position in positions:
+                self.positions.setdefault(position['symbol'], []).append(position)
+            self.orders = {}
+            for order in orders:
+                self.orders.setdefault(order['symbol'], []).append(order)
+            self.fetched = started                  # the age counts from the request, not the answer
+        return self
+
+    def invalidate(self):
+        ''' Forces the next read to refresh, e.g. after placing or cancelling orders '''
+        self.fetched = 0
+
+    def snapshot(self, maxage:float=None):
+        ''' Returns itself, refreshed first if older than maxage (default self.maxage) '''
+        if time.time() - self.fetched > (self.maxage if maxage == None else maxage):
+            self.refresh()
+        return self
+
+    def position(self, symbol:str):
+        ''' The positions of a symbol, like GetPositionData(symbol) '''
+        return self.positions.get(symbol, [])
+
+    def open_orders(self, symbol:str):
+        return self.orders.get(symbol, [])
+
+    def open_positions(self):
+        ''' The symbols that have a position '''
+        return [symbol for symbol, positions in self.positions.items()
+                if any(float(p['positionAmt']) != 0 for p in positions)]
+
+    def protection(self, maxage:float=None):
+        ''' The proctor check of every open position at once, as {symbol: 'PROTECTED' or 'NOT PROTECTED'} '''
+        self.snapshot(maxage)
+        return {symbol: 'PROTECTED' if protected(self.open_orders(symbol)) else 'NOT PROTECTED'
+                for symbol in self.open_positions()}
@@ -0,0 +1,239 @@
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import parse_qsl
+
+"""
+Here a weight-aware client side rate limiter is defined. Every call of
+a reqs instance asks it for the weight of its endpoint before going out
+and reports the used weight and order counts the server sent back, so
+the local view never drifts from what binance counts. Waiting calls are
+served by priority, orders and cancels always go ahead of data pulls,
+and data pulls can never eat the weight kept in reserve for orders.
+Binance counts weight per IP and orders per account, so one limiter can
+serve many accounts: the weight is shared, every account, told apart by
+its api key, has its own order budget.
+Args:
+    weight_limit:      request weight allowed per minute
+    order_limit_10s:   orders allowed per 10 seconds, per account
+    order_limit_1m:    orders allowed per minute, per account
+    reserve:           share of the minute weight only orders may use
+Returns:
+    Nothing
+"""
+
+PRIORITY_ORDER   = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BULK    = 10
+
+# endpoints whose weight does not depend on the parameters
+WEIGHTS = {'allOrders': 5, 'positionRisk': 5, 'account': 5, 'batchOrders': 5,
+           'exchangeInfo': 1, 'time': 1, 'ping': 1, 'order': 1, 'order/test': 1,
+           'leverage': 1, 'marginType': 1, 'allOpenOrders': 1, 'avgPrice': 1,
+           'listenKey': 1}
+ORDER_ENDPOINTS = ('order', 'batchOrders', 'allOpenOrders')
+
+
+class ratelimiter:
+
+    def __init__(self, weight_limit:int=2400, order_limit_10s:int=300, order_limit_1m:int=1200,
+                 reserve:float=0.1):
+        self.weight_limit    = weight_limit
+        self.order_limit_10s = order_limit_10s
+        self.order_limit_1m  = order_limit_1m
+        self.reserve         = reserve
+        self.cond            = threading.Condition()
+        self.queue           = []                   # heap of waiting (priority, ticket)
+        self.tickets         = itertools.count()
+        self.windows         = {60: 0, 10: 0}       # start of the current 1m and 10s windows
+        self.used            = 0                    # weight used in the current minute
+        self.orders          = {}                   # account -> orders placed in the current {60: n, 10: n}
+        self.banned_until    = 0
+
+    @staticmethod
+    def endpoint(url):
+        ''' The endpoint name of a full api url, as in binance.endpoints '''
+        return url.split('/fapi/', 1)[-1].split('/', 1)[-1].split('?')[0]
+
+    @staticmethod
+    def cost(method, url, params=None):
+        '''
+        Returns the (weight, orders, priority) of a call
+
+        Parameters:
+        --
+            method str:        'GET', 'POST', 'PUT' or 'DELETE'
+            url str:           The full url of the call
+            params:            The parameters, as a dict or a query string
+        '''
+        name   = ratelimiter.endpoint(url)
+        params = dict(parse_qsl(params)) if isinstance(params, (str, bytes)) else (params or {})
+        if name == 'klines':
+            limit  = int(params.get('limit', 500))
+            weight = 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+        elif name == 'depth':
+            limit  = int(params.get('limit', 500))
+            weight = 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+        elif name in ('ticker/24hr', 'openOrders'):
+            weight = 1 if 'symbol' in params else 40
+        elif method == 'DELETE' and name == 'batchOrders':
+            weight = 1
+        else:
+            weight = WEIGHTS.get(name, 1)
+
+        orders = 0
+        if method == 'POST' and name == 'order':
+            orders = 1
+        elif method == 'POST' and name == 'batchOrders':
+            orders = max(1, str(params.get('batchOrders', '')).count('{'))
+
+        if method in ('POST', 'DELETE') and name in ORDER_ENDPOINTS:
+            priority = PRIORITY_ORDER
+        elif name == 'klines':
+            priority = PRIORITY_BULK
+        else:
+            priority = PRIORITY_DEFAULT
+        return weight, orders, priority
+
+    def _roll(self, now):
+        ''' Starts new windows once the current ones are over '''
+        for span in (60, 10):
+            start = now - now % span
+            if start != self.windows[span]:
+                self.windows[span] = start
+                for counts in self.orders.values():
+                    counts[span] = 0
+                if span == 60:
+                    self.used = 0
+
+    def _counts(self, account):
+        ''' The order counts of an account, under self.cond '''
+        if account not in self.orders:
+            self.orders[account] = {60: 0, 10: 0}
+        return self.orders[account]
+
+    def _wait(self, weight, priority, now):
+        ''' Seconds to wait before a call fits in the weight limit, 0 if it fits now '''
+        if now < self.banned_until:
+            return self.banned_until - now
+        self._roll(now)
+        limit = self.weight_limit
+        if priority != PRIORITY_ORDER:
+            limit = limit*(1 - self.reserve)
+        if self.used + weight > limit and self.used > 0:
+            return self.windows[60] + 60 - now
+        return 0
+
+    def _order_wait(self, orders, account, now):
+        ''' Seconds to wait before the orders of a call fit in the budget of its account '''
+        if not orders:
+            return 0
+        self._roll(now)
+        counts = self._counts(account)
+        if counts[10] + orders > self.order_limit_10s:
+            return self.windows[10] + 10 - now
+        if counts[60] + orders > self.order_limit_1m:
+            return self.windows[60] + 60 - now
+        return 0
+
+    def _book(self, weight, orders, account):
+        ''' Counts the weight of a call and the orders of its account, under self.cond '''
+        self.used += weight
+        if orders:
+            counts      = self._counts(account)
+            counts[10] += orders
+            counts[60] += orders
+
+    def acquire(self, weight:int=1, orders:int=0, priority:int=PRIORITY_DEFAULT, account=None):
+        ''' Blocks until the call fits in the limits and no call of
+            a higher priority is waiting, then books its weight.
+            A call waiting for the order budget of its account stays
+            out of the queue, so it never holds up other accounts '''
+        with self.cond:
+            while True:
+                wait = self._order_wait(orders, account, time.time())
+                if wait > 0:
+                    self.cond.wait(wait + 0.001)
+                    continue
+                ticket = (priority, next(self.tickets))
+                heapq.heappush(self.queue, ticket)
+                try:
+                    if self._serve(ticket, weight, orders, priority, account):
+                        return
+                except BaseException:
+                    if ticket in self.queue:
+                        self.queue.remove(ticket)
+                        heapq.heapify(self.queue)
+                        self.cond.notify_all()
+                    raise
+
+    def _serve(self, ticket, weight, orders, priority, account):
+        ''' Waits for a queued call to come first and fit in the weight limit, then
+            books it. False if its account spent its order budget meanwhile '''
+        while True:
+            if self.queue[0] != ticket:
+                self.cond.wait()
+                continue
+            now = time.time()
+            if self._order_wait(orders, account, now) > 0:
+                heapq.heappop(self.queue)           # back to waiting out of the queue
+                self.cond.notify_all()
+                return False
+            wait = self._wait(weight, priority, now)
+            if wait <= 0:
+                heapq.heappop(self.queue)
+                self._book(weight, orders, account)
+                self.cond.notify_all()
+                return True
+            self.cond.wait(wait + 0.001)
+
+    async def acquire_async(self, weight:int=1, orders:int=0, priority:int=PRIORITY_DEFAULT, account=None):
+        ''' acquire() for asyncio code, sleeps on the event loop instead of blocking it.
+            It gives way to blocked calls of a higher priority, but does not queue itself '''
+        import asyncio
+        while True:
+            with self.cond:
+                now  = time.time()
+                if self.queue and self.queue[0][0] < priority:
+                    wait = 0.001
+                else:
+                    wait = max(self._order_wait(orders, account, now), self._wait(weight, priority, now))
+                if wait <= 0:
+                    self._book(weight, orders, account)
+                    return
+            await asyncio.sleep(wait + 0.001)
+
+    def update(self, headers, status:int=200, started=None, account=None):
+        ''' Syncs with the weight and order counts reported by the server
+            for a call of an account that was sent at `started` '''
+        now = time.time()
+        with self.cond:
+            self._roll(now)
+            if started == None or started - started % 60 == self.windows[60]:
+                used = headers.get('X-MBX-USED-WEIGHT-1M')
+                if used != None:
+                    self.used = max(self.used, int(used))
+                count = headers.get('X-MBX-ORDER-COUNT-1M')
+                if count != None:
+                    counts     = self._counts(account)
+                    counts[60] = max(counts[60], int(count))
+            if started == None or started - started % 10 == self.windows[10]:
+                count = headers.get('X-MBX-ORDER-COUNT-10S')
+                if count != None:
+                    counts     = self._counts(account)
+                    counts[10] = max(counts[10], int(count))
+            if status in (418, 429):
+                retry = headers.get('Retry-After')
+                until = now + int(retry) if retry else self.windows[60] + 60
+                self.banned_until = max(self.banned_until, until)
+            self.cond.notify_all()
+
+    def status(self, account=None):
+        ''' Returns the current view of the limits, the order counts of one account '''
+        with self.cond:
+            self._roll(time.time())
+            counts = self.orders.get(account, {60: 0, 10: 0})
+            return {'used_weight': self.used, 'weight_limit': self.weight_limit,
+                    'orders_10s': counts[10], 'orders_1m': counts[60],
+                    'banned_until': self.banned_until, 'waiting': len(self.queue)}
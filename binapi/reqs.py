@@ -1,53 +1,186 @@
-import requests 
+import requests
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from .ratelimit import ratelimiter
+from .metrics import metrics as _metrics
+from .resilience import retrypolicy, circuitbreaker, classify, sent, NETWORK, SERVER, RATELIMIT, BUSINESS
 
 """
 Here a wrapper class is defined to simplify http requests,
-for the binapi class.
+for the binapi class. Every instance owns a keep-alive session
+so consecutive calls reuse already opened connections instead
+of paying a new TCP+TLS handshake each time.
 Args:
-    Nothing
+    headers:     default headers sent with every request
+    pool_size:   number of keep-alive connections kept per host
+    timeout:     seconds to wait for the server before giving up
+    limiter:     the weight-aware rate limiter every call goes through,
+                 a new one if not given
+    policy:      the retrypolicy of failed calls, a default one if not given
+    hedge:       seconds after which a GET still unanswered is sent a second
+                 time and the first answer wins, None to never hedge
+    metrics:     where latencies and counts are recorded, a disabled one
+                 if not given
 Returns:
     data
 """
 
 class reqs:
-    
-    def __init__():
-        """Nothing to do yet"""
-        
-    def _get(url, params=None, headers=None):
-        """ Makes a Get Request """
-        retries = 3
-        for pj in range(0, retries):
-            try: 
-                response    = requests.get(url, params=params, headers=headers)
-                data        = json.loads(response.text)
-                return data
+
+    def __init__(self, headers=None, pool_size:int=10, timeout=10, limiter=None, policy=None, hedge=None,
+                 metrics=None):
+        self.pool_size = pool_size
+        self.timeout   = timeout
+        self.limiter   = limiter if limiter is not None else ratelimiter()
+        self.policy    = policy if policy is not None else retrypolicy()
+        self.hedge     = hedge
+        self.metrics   = metrics if metrics is not None else _metrics(enabled=False)
+        self.breakers  = {}              # endpoint -> circuitbreaker
+        self.lock      = threading.Lock()
+        self.executor  = None            # threads of the hedged calls, made on first use
+        self.session   = requests.Session()
+        adapter        = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def warmup(self, url, connections:int=1):
+        ''' Opens up to `connections` pooled connections to the host of url
+            ahead of time, so the first real calls skip the handshake '''
+        connections = max(1, min(connections, self.pool_size))
+        if connections == 1:
+            return self._get(url)
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            results = list(pool.map(lambda _: self._get(url), range(connections)))
+        return results[0]
+
+    def close(self):
+        ''' Closes every pooled connection '''
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.session.close()
+
+    def breaker(self, url):
+        ''' The circuit breaker of the endpoint of a url '''
+        name = ratelimiter.endpoint(url)
+        with self.lock:
+            if name not in self.breakers:
+                self.breakers[name] = circuitbreaker()
+            return self.breakers[name]
+
+    def _send(self, method, url, params=None, headers=None):
+        """ Sends a request once the rate limiter lets it through """
+        weight, orders, priority = self.limiter.cost(method, url, params)
+        account  = headers.get('X-MBX-APIKEY') if headers else None    # orders are counted per account
+        queued   = time.time()
+        self.limiter.acquire(weight, orders, priority, account)
+        started  = time.time()
+        response = self.session.request(method, url, params=params, headers=headers, timeout=self.timeout)
+        self.limiter.update(response.headers, response.status_code, started, account)
+        if self.metrics.enabled:
+            name = ratelimiter.endpoint(url)
+            self.metrics.observe('request', name, time.time() - started)
+            self.metrics.observe('queue', name, started - queued)
+            self.metrics.inc('calls', name)
+            self.metrics.inc('weight', name, weight)
+        return response
+
+    def _hedged(self, method, url, params, headers, delay):
+        """ Sends a request, and a duplicate if no answer came within delay, first answer wins """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        calls = [self.executor.submit(self._send, method, url, params, headers)]
+        done, _ = wait(calls, timeout=delay)
+        if not done:
+            calls.append(self.executor.submit(self._send, method, url, params, headers))
+        error = None
+        while calls:
+            done, _ = wait(calls, return_when=FIRST_COMPLETED)
+            for call in done:
+                calls.remove(call)
+                if call.exception() is None:
+                    return call.result()
+                error = call.exception()
+        raise error
+
+    def _request(self, method, url, params=None, headers=None, raw:bool=False, lookup=None, hedge=None):
+        """ Sends a request under the retry policy and the circuit breaker of its endpoint.
+            lookup, for writes, is called before resending a write whose outcome is unknown:
+            it returns the result if the write went through, None if it can be sent again.
+            params may be a callable giving the params of every attempt """
+        breaker  = self.breaker(url)
+        hedge    = self.hedge if hedge is None else hedge
+        data     = None
+        executed = False
+        for attempt in range(self.policy.retries + 1):
+            if attempt:
+                self.metrics.inc('retries', ratelimiter.endpoint(url))
+                time.sleep(self.policy.delay(attempt - 1, retry_after))
+                if executed and lookup is not None:
+                    found = lookup()
+                    if found is not None:
+                        return found
+            if not breaker.allow():
+                return {'code': -1, 'kind': 'circuit', 'url': url,
+                        'msg': 'Circuit open on {}, {} failures in a row'.format(url, breaker.failures)}
+            retry_after = None
+            query       = params() if callable(params) else params     # signed calls sign every attempt anew
+            try:
+                if hedge and method == 'GET':
+                    response = self._hedged(method, url, query, headers, hedge)
+                else:
+                    response = self._send(method, url, query, headers)
             except Exception as e:
-                print("Exception occured when trying to get from " + url)
-                print(e)
-                data = {'code': -1, 'url':url, 'msg': e}
+                kind, executed = NETWORK, sent(e)
+                data = {'code': -1, 'kind': NETWORK, 'url': url, 'msg': e}
+            else:
+                retry_after = response.headers.get('Retry-After')
+                try:
+                    with self.metrics.stage(ratelimiter.endpoint(url), 'decode'):
+                        data = json.loads(response.text) if not raw or response.status_code >= 400 else None
+                except ValueError:
+                    data = {'code': -1, 'url': url, 'msg': response.text}
+                kind     = classify(response.status_code, data)
+                executed = kind != RATELIMIT
+                if kind is None or kind == BUSINESS:
+                    if kind == BUSINESS:
+                        self.metrics.inc('errors_' + kind, ratelimiter.endpoint(url))
+                    breaker.success()
+                    return response.content if raw and kind is None else data
+                data = dict(data, kind=kind) if isinstance(data, dict) else data
+            self.metrics.inc('errors_' + kind, ratelimiter.endpoint(url))
+            if kind in (NETWORK, SERVER):
+                breaker.failure()
+            else:
+                breaker.release()                   # rate limited, says nothing of the endpoint
+            if not self.policy.retry(method, kind, executed) and lookup is None:
+                break
+        print("Request to {} failed: {}".format(url, data.get('msg') if isinstance(data, dict) else data))
         return data
 
-    def _post(url, params=None, headers=None):
+    def _get(self, url, params=None, headers=None, raw:bool=False, hedge=None):
+        """ Makes a Get Request, raw returns the undecoded body """
+        return self._request('GET', url, params, headers, raw=raw, hedge=hedge)
+
+    def _post(self, url, params=None, headers=None, lookup=None):
         """ Makes a Post Request """
-        try: 
-            response    = requests.post(url, params=params, headers=headers)
-            data        = json.loads(response.text)
-        except Exception as e:
-            print("Exception occured when trying to post to " + url)
-            print(e)
-            data = {'code': '-1', 'url':url, 'msg': e}
-        return data
+        return self._request('POST', url, params, headers, lookup=lookup)
 
-    def _delete(url, params=None, headers=None):
-        """ Makes a delete Request """
-        try: 
-            response    = requests.delete(url, params=params, headers=headers)
-            data        = json.loads(response.text)
-        except Exception as e:
-            print("Exception occured when trying to delete on " + url)
-            print(e)
-            data = {'code': '-1', 'msg':e}
-        return data
+    def _put(self, url, params=None, headers=None):
+        """ Makes a Put Request """
+        return self._request('PUT', url, params, headers)
 
+    def _delete(self, url, params=None, headers=None):
+        """ Makes a delete Request """
+        return self._request('DELETE', url, params, headers)
@@ -0,0 +1,99 @@
+import numpy as np
+
+"""
+Here the resampling engine is defined. Candles of any higher interval
+are derived from already downloaded candles of a lower one, without
+asking the exchange again: rows are grouped by the open time of the
+candle they belong to, then every group is reduced at once with numpy
+(first open, highest high, lowest low, last close, summed volumes).
+Weeks open on mondays and months follow the calendar, like on binance.
+Args:
+    data:       candles as a GetSymbolKlines DataFrame or as its numpy columns
+    interval:   the interval to build, one of binance.KLINE_INTERVALS
+Returns:
+    data
+"""
+
+# candle width and open time offset in ms, weeks open on mondays, the epoch was a thursday
+WIDTHS  = {'1m': 60000, '3m': 180000, '5m': 300000, '15m': 900000, '30m': 1800000,
+           '1h': 3600000, '2h': 7200000, '4h': 14400000, '6h': 21600000, '8h': 28800000,
+           '12h': 43200000, '1d': 86400000, '3d': 259200000, '1w': 604800000}
+OFFSETS = {'1w': 4*86400000}
+
+# how every column is reduced over the candles of a group
+_FIRST = ('open',)
+_LAST  = ('close',)
+_MAX   = ('high',)
+_MIN   = ('low',)
+
+
+def opentime(times, interval:str):
+    ''' The open time, in ms, of the `interval` candle every time in `times` falls into '''
+    times = np.asarray(times, dtype=np.int64)
+    if interval == '1M':
+        months = times.astype('datetime64[ms]').astype('datetime64[M]')
+        return months.astype('datetime64[ms]').astype(np.int64)
+    if interval not in WIDTHS:
+        raise Exception("Unknown interval: {}".format(interval))
+    offset = OFFSETS.get(interval, 0)
+    return (times - offset)//WIDTHS[interval]*WIDTHS[interval] + offset
+
+
+def closetime(opentimes, interval:str):
+    ''' The open time, in ms, of the candle that follows every candle in `opentimes` '''
+    opentimes = np.asarray(opentimes, dtype=np.int64)
+    if interval == '1M':
+        months = opentimes.astype('datetime64[ms]').astype('datetime64[M]') + 1
+        return months.astype('datetime64[ms]').astype(np.int64)
+    return opentimes + WIDTHS[interval]
+
+
+def resample(data, interval:str, subinterval:str=None, complete:bool=False):
+    '''
+    Builds candles of a higher interval out of lower interval candles
+
+    Parameters:
+    --
+        data:              A GetSymbolKlines DataFrame, or its numpy columns (fmt='numpy'),
+                           sorted by time
+        interval str:      The interval to build, like '4h', '1w' or '1M'
+        subinterval str:   The interval of data, needed when complete is True
+        complete bool:     Drop the candles some of whose lower candles are missing,
+                           like the still forming last one
+    Returns the same layout as data, one row per candle of `interval`
+    '''
+    frame   = not isinstance(data, dict)
+    columns = {name: np.asarray(data[name]) for name in data if name != 'date'} if frame else data
+    times   = columns['time']
+    if len(times) == 0:
+        return data
+
+    groups = opentime(times, interval)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends   = np.r_[starts[1:], len(times)] - 1
+    result = {'time': groups[starts]}
+    for name, values in columns.items():
+        if name == 'time':
+            continue
+        if name in _FIRST:
+            result[name] = values[starts]
+        elif name in _LAST:
+            result[name] = values[ends]
+        elif name in _MAX:
+            result[name] = np.maximum.reduceat(values, starts)
+        elif name in _MIN:
+            result[name] = np.minimum.reduceat(values, starts)
+        else:                                   # volumes and trade counts add up
+            result[name] = np.add.reduceat(values, starts)
+
+    if complete:
+        if subinterval == None:
+            raise Exception("complete=True needs the subinterval of the data")
+        expected = (closetime(result['time'], interval) - result['time'])//WIDTHS[subinterval]
+        keep     = (ends - starts + 1) == expected
+        result   = {name: values[keep] for name, values in result.items()}
+
+    if not frame:
+        return result
+    from .klines import frame as toframe
+    return toframe(result)
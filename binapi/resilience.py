@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+import requests
+
+"""
+Here the resilience policy of reqs is defined: how a failed call is
+classified, how long to back off before trying again, and a circuit
+breaker per endpoint so a struggling endpoint is given time to recover
+instead of being hammered. A call fails in one of a few ways:
+    network:    no answer; the request may or may not have reached binance,
+                unless the connection could not even be opened
+    server:     a 5xx answer, the outcome of a write is unknown
+    ratelimit:  a 429 or 418 answer, nothing was executed
+    business:   any other 4xx answer, retrying would fail the same way
+Reads are retried on network, server and ratelimit failures. Writes are
+retried when they were certainly not executed, and otherwise only after
+a lookup tells they did not go through.
+Args:
+    retries:    retries after the first attempt
+    base:       backoff of the first retry, in seconds
+    cap:        maximum backoff, in seconds
+    threshold:  consecutive failures that open the breaker of an endpoint
+    reset:      seconds an open breaker waits before letting a probe through
+Returns:
+    Nothing
+"""
+
+NETWORK   = 'network'
+SERVER    = 'server'
+RATELIMIT = 'ratelimit'
+BUSINESS  = 'business'
+
+# codes binance answers when the backend did not confirm the outcome of a request
+UNKNOWN_CODES = (-1001, -1006, -1007)
+
+
+def sent(exception):
+    ''' False if the request certainly never reached the server '''
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return False
+    if any(kind.__name__ in ('ClientConnectorError', 'ConnectionTimeoutError') for kind in type(exception).__mro__):
+        return False                            # aiohttp could not open the connection
+    cause = exception
+    for _ in range(8):                          # requests > urllib3 > socket error
+        if cause == None:
+            break
+        if isinstance(cause, ConnectionRefusedError) or type(cause).__name__ in ('NewConnectionError', 'NameResolutionError'):
+            return False
+        nested = cause.args[0] if cause.args and isinstance(cause.args[0], BaseException) else None
+        cause  = getattr(cause, 'reason', None) or nested or cause.__cause__
+    return True
+
+
+def classify(status:int=None, data=None, exception=None):
+    ''' The kind of a failure, None if the call succeeded '''
+    if exception != None:
+        return NETWORK
+    if status in (418, 429):
+        return RATELIMIT
+    if status != None and status >= 500:
+        return SERVER
+    if isinstance(data, dict) and data.get('code') in UNKNOWN_CODES:
+        return SERVER
+    if status != None and status >= 400:
+        return BUSINESS
+    return None
+
+
+class retrypolicy:
+
+    def __init__(self, retries:int=3, base:float=0.2, cap:float=5):
+        self.retries = retries
+        self.base    = base
+        self.cap     = cap
+
+    def delay(self, attempt:int, retry_after=None):
+        ''' Seconds to wait before retry number `attempt`, full jitter,
+            never shorter than a Retry-After sent by the server '''
+        delay = random.uniform(0, min(self.cap, self.base*2**attempt))
+        if retry_after:
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def retry(self, method:str, kind:str, executed:bool):
+        ''' Whether a failed call may be sent again as is '''
+        if kind in (None, BUSINESS):
+            return False
+        if kind == RATELIMIT or not executed:
+            return True
+        return method in ('GET', 'DELETE')
+
+
+class circuitbreaker:
+    ''' Fails calls fast after `threshold` consecutive failures,
+        lets one probe through every `reset` seconds until one succeeds '''
+
+    def __init__(self, threshold:int=5, reset:float=30):
+        self.threshold = threshold
+        self.reset     = reset
+        self.failures  = 0
+        self.opened    = None
+        self.probing   = False
+        self.lock      = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened == None:
+            return 'closed'
+        return 'half-open' if time.time() - self.opened >= self.reset else 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened == None:
+                return True
+            if time.time() - self.opened >= self.reset and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened   = None
+            self.probing  = False
+
+    def release(self):
+        ''' Ends a probe that was neither a success nor a failure, a rate limited one,
+            the next call after it probes again '''
+        with self.lock:
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened  = time.time()
+                self.probing = False
@@ -0,0 +1,280 @@
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from . import klines
+
+"""
+Here kline buffers shared between processes are defined. One publisher
+process downloads the candles and keeps them, per symbol and interval,
+in a ring buffer living in a multiprocessing shared memory block. Any
+number of reader processes attach to the blocks by name and look at the
+candles through numpy views of the shared memory, without copying them
+and without a single request of their own.
+Every candle is written twice, at its slot and at its slot plus the size
+of the ring, so the last `size` candles are always one contiguous slice.
+A sequence counter, odd while the publisher is writing, lets readers tell
+a torn or changed read from a good one without taking a lock.
+Args:
+    name:       prefix of the shared memory blocks, the same for the publisher and its readers
+    size:       candles kept per symbol and interval
+Returns:
+    data
+"""
+
+HEADER = 4                  # int64 words: sequence, candles written, size, reserved
+FIELDS = klines.COLUMNS     # time, open, high, low, close, volume
+
+
+_untracked = threading.Lock()
+
+
+def blockname(name:str, symbol:str, interval:str):
+    return '{}-{}-{}'.format(name, symbol, interval)
+
+
+class sharedkline:
+    ''' The ring of one symbol and interval, in its own shared memory block '''
+
+    def __init__(self, block, owner:bool):
+        self.block  = block
+        self.owner  = owner
+        self.lock   = threading.Lock()      # one writer at a time, like refresh and update from two threads
+        self.header = np.ndarray((HEADER,), dtype=np.int64, buffer=block.buf)
+        self.size   = int(self.header[2])
+        offset      = HEADER*8
+        self.columns = {}
+        for name in FIELDS:
+            dtype = np.int64 if name == 'time' else np.float64
+            self.columns[name] = np.ndarray((2*self.size,), dtype=dtype, buffer=block.buf, offset=offset)
+            offset += 2*self.size*8
+        if not owner:
+            self.header.flags.writeable = False
+            for column in self.columns.values():
+                column.flags.writeable = False
+
+    @classmethod
+    def create(cls, name:str, size:int):
+        block = shared_memory.SharedMemory(name=name, create=True, size=HEADER*8 + 2*size*8*len(FIELDS))
+        np.ndarray((HEADER,), dtype=np.int64, buffer=block.buf)[:] = [0, 0, size, 0]
+        return cls(block, True)
+
+    @classmethod
+    def attach(cls, name:str):
+        # the block belongs to the publisher, the resource tracker must not unlink it when a
+        # reader exits, and a forked reader shares the tracker of the publisher
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)     # python 3.13 on
+        except TypeError:
+            with _untracked:
+                register, resource_tracker.register = resource_tracker.register, lambda *args: None
+                try:
+                    block = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        return cls(block, False)
+
+    @property
+    def sequence(self):
+        return int(self.header[0])
+
+    def __len__(self):
+        return int(min(self.header[1], self.size))
+
+    def write(self, candles:dict):
+        '''
+        Appends candles, or replaces the last one while it is still forming
+
+        Parameters:
+        --
+            candles dict:      Columns like GetSymbolKlines(fmt='numpy') gives, oldest first
+        '''
+        with self.lock:
+            self._write(candles)
+
+    def _write(self, candles:dict):
+        times = np.asarray(candles['time'], dtype=np.int64)
+        count = int(self.header[1])
+        if count:
+            last  = self.columns['time'][(count - 1) % self.size]
+            keep  = times >= last
+            times = times[keep]
+            candles = {name: np.asarray(candles[name])[keep] for name in FIELDS}
+            if len(times) and times[0] == last:
+                count -= 1                       # the first candle overwrites the stored last one
+        if not len(times):
+            return
+        skip   = max(0, len(times) - self.size)  # candles that would be overwritten in this very write
+        first  = count + skip
+        slots  = (first + np.arange(len(times) - skip)) % self.size
+        self.header[0] += 1                      # odd, readers know a write is going on
+        for name in FIELDS:
+            values = np.asarray(candles[name])[skip:]
+            self.columns[name][slots]             = values
+            self.columns[name][slots + self.size] = values
+        self.header[1] = first + len(slots)
+        self.header[0] += 1
+
+    def view(self):
+        ''' (sequence, {field: zero-copy view}) of the buffered candles, oldest first.
+            The views are only good while consistent(sequence) holds '''
+        sequence = int(self.header[0])
+        count    = int(self.header[1])
+        length   = min(count, self.size)
+        start    = (count - length) % self.size
+        return sequence, {name: column[start:start + length] for name, column in self.columns.items()}
+
+    def consistent(self, sequence:int):
+        ''' True if nothing was written since `sequence` was read, and no write was going on '''
+        return sequence % 2 == 0 and int(self.header[0]) == sequence
+
+    def read(self, retries:int=100):
+        ''' A consistent copy of the buffered candles, retried while the publisher writes '''
+        for _ in range(retries):
+            sequence, columns = self.view()
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            copy = {name: column.copy() for name, column in columns.items()}
+            if self.consistent(sequence):
+                return copy
+        raise Exception("No consistent read of {} after {} tries".format(self.block.name, retries))
+
+    def close(self):
+        with self.lock:                          # a write going on finishes first
+            self.header = self.columns = None    # the views have to go before the block
+        if self.owner:
+            self.block.unlink()
+        try:
+            self.block.close()
+        except BufferError:
+            pass                                 # views handed out are still alive, the mapping goes with them
+
+
+class klinepublisher:
+    ''' Downloads the candles of some symbols and intervals into shared buffers '''
+
+    def __init__(self, client, symbols:list, intervals:list=('1m',), size:int=1500, name:str='binapi',
+                 workers:int=8):
+        self.client    = client
+        self.name      = name
+        self.size      = size
+        self.workers   = workers
+        self.errors    = {}          # (symbol, interval) -> exception of the last refresh
+        self.buffers   = {}
+        self.running   = False
+        self.thread    = None
+        for symbol in symbols:
+            for interval in intervals:
+                try:
+                    self.buffers[(symbol, interval)] = sharedkline.create(blockname(name, symbol, interval), size)
+                except Exception:
+                    self.close()
+                    raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fetch(self, symbol, interval):
+        buffer = self.buffers[(symbol, interval)]
+        count  = int(buffer.header[1])
+        if count == 0:
+            return self.client.GetSymbolKlines(symbol, interval, self.size, fmt='numpy')
+        last = int(buffer.columns['time'][(count - 1) % buffer.size])
+        if interval == '1M':
+            missed = 1
+        else:
+            missed = (self.client.servertime() - last)//(self.client.INTERVAL_DETAIL[interval]['insec']*1000)
+        if missed + 2 > self.client.mxlimit:
+            return self.client.GetSymbolKlines(symbol, interval, self.size, fmt='numpy')
+        return self.client.GetSymbolKlines(symbol, interval, int(missed) + 2, start_time=last, fmt='numpy')
+
+    def refresh(self):
+        ''' Downloads the candles opened since the last refresh, every buffer in full the first time '''
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.buffers)))) as pool:
+            futures = [(key, pool.submit(self._fetch, *key)) for key in self.buffers]
+            for key, future in futures:
+                try:
+                    self.buffers[key].write(future.result())
+                    self.errors.pop(key, None)
+                except Exception as e:
+                    self.errors[key] = e
+        return self
+
+    def update(self, symbol:str, interval:str, candle:dict):
+        ''' Writes one candle, like the kline events of a marketstream give them '''
+        self.buffers[(symbol, interval)].write({name: [candle[name]] for name in FIELDS})
+
+    def _run(self, every):
+        while self.running:
+            started = time.time()
+            self.refresh()
+            time.sleep(max(0, every - (time.time() - started)))
+
+    def start(self, every:float=1):
+        ''' Refreshes every `every` seconds in the background '''
+        if not self.running:
+            self.running = True
+            self.thread  = threading.Thread(target=self._run, args=(every,), daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        ''' Stops and removes the shared buffers, readers keep what they already attached '''
+        self.stop()
+        for buffer in self.buffers.values():
+            buffer.close()
+        self.buffers = {}
+
+
+class klinereader:
+    ''' Reads the buffers of a klinepublisher from any process '''
+
+    def __init__(self, name:str='binapi'):
+        self.name    = name
+        self.buffers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def buffer(self, symbol:str, interval:str):
+        ''' The sharedkline of a symbol and interval, attached on first use '''
+        key = (symbol, interval)
+        if key not in self.buffers:
+            self.buffers[key] = sharedkline.attach(blockname(self.name, symbol, interval))
+        return self.buffers[key]
+
+    def view(self, symbol:str, interval:str):
+        ''' (sequence, zero-copy columns), see sharedkline.view '''
+        return self.buffer(symbol, interval).view()
+
+    def read(self, symbol:str, interval:str, fmt:str='numpy'):
+        ''' A consistent copy of the candles, as columns or as a GetSymbolKlines frame '''
+        columns = self.buffer(symbol, interval).read()
+        return columns if fmt == 'numpy' else klines.frame(columns)
+
+    def frame(self, symbol:str, interval:str):
+        ''' The candles as a DataFrame over the shared memory, check consistent() once done '''
+        sequence, columns = self.view(symbol, interval)
+        return sequence, klines.frame(columns)
+
+    def consistent(self, symbol:str, interval:str, sequence:int):
+        return self.buffer(symbol, interval).consistent(sequence)
+
+    def close(self):
+        for buffer in self.buffers.values():
+            buffer.close()
+        self.buffers = {}
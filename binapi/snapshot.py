@@ -0,0 +1,124 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from . import klines
+
+"""
+Here a market snapshot of many symbols is defined. The last `limit`
+candles of every symbol and interval are kept in one 3-D numpy array per
+interval, indexed by symbol, candle and field (time, open, high, low,
+close, volume), newest candle last. The first sweep downloads every
+symbol on a bounded thread pool, later sweeps only ask for the candles
+opened since the last one, which keeps them at the lowest kline weight,
+and shift them in place. All calls go through the rate limiter of the
+client as bulk calls, so orders are never held back by a sweep.
+Args:
+    client:     a binance instance used to download the candles
+    symbols:    the symbols, the USDT trading ones of GetAllSymbols if None
+    intervals:  the intervals to keep
+    limit:      candles kept per symbol and interval
+    workers:    downloads running at the same time
+Returns:
+    data
+"""
+
+FIELDS = klines.COLUMNS
+
+
+class marketsnapshot:
+
+    def __init__(self, client, symbols:list=None, intervals:list=('1m',), limit:int=500, workers:int=8):
+        if limit > client.mxlimit:
+            raise Exception("A snapshot keeps at most {} candles".format(client.mxlimit))
+        if symbols == None:
+            symbols = client.GetAllSymbols(['USDT'])['trading']
+        self.client    = client
+        self.symbols   = list(symbols)
+        self.index     = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.intervals = list(intervals)
+        self.limit     = limit
+        self.workers   = workers
+        self.lock      = threading.Lock()
+        self.errors    = {}          # (symbol, interval) -> exception of the last sweep
+        # interval -> array[symbol, candle, field], missing candles are nan
+        self.data      = {interval: np.full((len(self.symbols), limit, len(FIELDS)), np.nan)
+                          for interval in self.intervals}
+
+    def _fetch(self, symbol, interval):
+        ''' Downloads what is missing of a symbol, returns (symbol, interval, columns, full) '''
+        row  = self.data[interval][self.index[symbol]]
+        last = row[-1, 0]
+        if np.isnan(last):
+            return symbol, interval, self.client.GetSymbolKlines(symbol, interval, self.limit, fmt='numpy'), True
+        if interval == '1M':
+            missed = 1
+        else:
+            width  = self.client.INTERVAL_DETAIL[interval]['insec']*1000
+            missed = int((self.client.servertime() - last)//width)
+        if missed + 1 >= self.limit:
+            return symbol, interval, self.client.GetSymbolKlines(symbol, interval, self.limit, fmt='numpy'), True
+        # the last candle is read again, it was likely still forming
+        columns = self.client.GetSymbolKlines(symbol, interval, missed + 2, start_time=int(last), fmt='numpy')
+        return symbol, interval, columns, False
+
+    def _store(self, symbol, interval, columns, full):
+        row = self.data[interval][self.index[symbol]]
+        new = np.column_stack([columns[name] for name in FIELDS]).astype(np.float64)
+        if full:
+            row[:] = np.nan
+            if len(new):
+                row[-len(new):] = new[-self.limit:]
+            return
+        new = new[new[:, 0] >= row[-1, 0]]
+        if not len(new):
+            return
+        shift = len(new) - 1                    # the first new candle replaces the stored last one
+        if shift:
+            row[:-shift] = row[shift:].copy()
+        row[-len(new):] = new
+
+    def refresh(self, symbols:list=None, intervals:list=None):
+        '''
+        Brings the snapshot up to date
+
+        Parameters:
+        --
+            symbols list:      The symbols to refresh, all of them if None
+            intervals list:    The intervals to refresh, all of them if None
+        Returns the snapshot, the failures are kept in errors
+        '''
+        jobs = [(symbol, interval) for interval in (intervals or self.intervals)
+                for symbol in (symbols or self.symbols)]
+        with self.lock:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(jobs)))) as pool:
+                futures = [(job, pool.submit(self._fetch, *job)) for job in jobs]
+                for job, future in futures:
+                    try:
+                        self._store(*future.result())
+                        self.errors.pop(job, None)
+                    except Exception as e:
+                        self.errors[job] = e
+        return self
+
+    def array(self, interval:str=None):
+        ''' The array[symbol, candle, field] of an interval, the first one if None '''
+        return self.data[interval or self.intervals[0]]
+
+    def field(self, name:str, interval:str=None):
+        ''' A [symbol, candle] panel of one field, like field('close') '''
+        return self.array(interval)[:, :, FIELDS.index(name)]
+
+    def symbol(self, symbol:str, interval:str=None):
+        ''' The [candle, field] candles of one symbol, without the missing ones '''
+        row = self.array(interval)[self.index[symbol]]
+        return row[~np.isnan(row[:, 0])]
+
+    def frame(self, interval:str=None):
+        ''' The snapshot as a DataFrame indexed by (symbol, time), missing candles left out '''
+        import pandas as pd
+        data  = self.array(interval)
+        valid = ~np.isnan(data[:, :, 0])
+        rows  = data[valid]
+        names = np.repeat(np.array(self.symbols, dtype=object), valid.sum(axis=1))
+        index = pd.MultiIndex.from_arrays([names, rows[:, 0].astype(np.int64)], names=['symbol', 'time'])
+        return pd.DataFrame(rows[:, 1:], index=index, columns=FIELDS[1:])
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import numpy as np
+from . import klines
+from . import resample
+
+"""
+Here a persistent local kline store is defined, keyed by symbol and
+interval. Closed candles live in memory-mappable numpy files, next to
+a small json record of the open-time ranges already downloaded, so a
+request only asks the exchange for the ranges that are still missing.
+The still-forming last candle is always fetched fresh and never stored.
+Args:
+    client:     a binance instance used to download missing candles
+    path:       the directory that holds the store
+Returns:
+    data
+"""
+
+KLINE_DTYPE = np.dtype([('time', 'i8'), ('open', 'f8'), ('high', 'f8'),
+                        ('low', 'f8'), ('close', 'f8'), ('volume', 'f8')])
+
+
+class klinestore:
+
+    margin  = 2000   # ms a candle has to be closed for before it is stored, for clock skew
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path   = os.path.expanduser(path)
+        self.lock   = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _files(self, symbol, interval):
+        folder = os.path.join(self.path, symbol)
+        return os.path.join(folder, interval + '.npy'), os.path.join(folder, interval + '.json')
+
+    def load(self, symbol, interval):
+        ''' Returns the stored candles, memory mapped, and the covered open-time ranges '''
+        data, meta = self._files(symbol, interval)
+        if not os.path.exists(meta):
+            return np.empty(0, dtype=KLINE_DTYPE), []
+        with open(meta, 'r') as f:
+            info = json.load(f)
+        if info['count'] == 0:
+            return np.empty(0, dtype=KLINE_DTYPE), info['covered']
+        return np.load(data, mmap_mode='r'), info['covered']
+
+    def save(self, symbol, interval, candles, covered):
+        ''' Atomically replaces the stored candles and covered ranges '''
+        data, meta = self._files(symbol, interval)
+        os.makedirs(os.path.dirname(data), exist_ok=True)
+        with open(data + '.tmp', 'wb') as f:
+            np.save(f, candles)
+        os.replace(data + '.tmp', data)
+        with open(meta + '.tmp', 'w') as f:
+            json.dump({'count': len(candles), 'covered': covered}, f)
+        os.replace(meta + '.tmp', meta)
+
+    @staticmethod
+    def missing(covered, start, end):
+        ''' The parts of [start, end] that are not in the covered ranges '''
+        gaps   = []
+        cursor = start
+        for a, b in covered:
+            if b < cursor:
+                continue
+            if a > end:
+                break
+            if a > cursor:
+                gaps.append((cursor, a - 1))
+            cursor = b + 1
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    @staticmethod
+    def cover(covered, ranges):
+        ''' Merges new ranges into the sorted covered ranges '''
+        merged = []
+        for a, b in sorted([tuple(r) for r in covered] + list(ranges)):
+            if merged and a <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], int(b))
+            else:
+                merged.append([int(a), int(b)])
+        return merged
+
+    @staticmethod
+    def toarray(df):
+        ''' Converts a GetSymbolKlines frame to the stored record layout '''
+        candles = np.empty(len(df), dtype=KLINE_DTYPE)
+        for name in KLINE_DTYPE.names:
+            candles[name] = df[name].to_numpy()
+        return candles
+
+    @staticmethod
+    def toframe(candles):
+        ''' Converts stored records to the GetSymbolKlines frame layout '''
+        return klines.frame({name: np.ascontiguousarray(candles[name]) for name in KLINE_DTYPE.names})
+
+    def update(self, symbol, interval, start_time, end_time):
+        ''' Downloads the closed candles of [start_time, end_time] that are not
+            stored yet, and returns every stored candle of that range '''
+        with self.lock:
+            candles, covered = self.load(symbol, interval)
+            gaps = self.missing(covered, start_time, end_time)
+            if gaps:
+                pages = [self.toarray(self.client.GetSymbolKlinesRange(symbol, interval, a, b))
+                         for a, b in gaps]
+                candles, covered = self._merge(symbol, interval, candles, covered, pages, gaps)
+            lo = np.searchsorted(candles['time'], start_time, 'left')
+            hi = np.searchsorted(candles['time'], end_time, 'right')
+            return candles[lo:hi]
+
+    def older(self, symbol, interval, end_time, count):
+        ''' Returns the last `count` closed candles opening at or before end_time,
+            reading covered ranges from disk and downloading only the rest '''
+        width = self.client.INTERVAL_DETAIL[interval]['insec']*1000
+        end   = end_time
+        parts = []
+        pages = []
+        fresh = []
+        with self.lock:
+            candles, covered = self.load(symbol, interval)
+            while count > 0 and end >= 0:
+                block = [r for r in covered if r[0] <= end <= r[1]]
+                if block:
+                    hi = np.searchsorted(candles['time'], end, 'right')
+                    lo = max(np.searchsorted(candles['time'], block[0][0], 'left'), hi - count)
+                    parts.insert(0, candles[lo:hi])
+                    count -= hi - lo
+                    end    = block[0][0] - 1
+                    continue
+                prior = [r[1] for r in covered if r[1] < end]
+                start = max(end - count*width + 1, max(prior) + 1 if prior else 0)
+                page  = self.toarray(self.client.GetSymbolKlinesRange(symbol, interval, start, end))
+                if len(page) == 0 and not prior:
+                    if start == 0 or not len(self.client.GetSymbolKlines(symbol, interval, 1, start - 1,
+                                                                          fmt='numpy')['time']):
+                        start = 0                 # nothing older exists, history starts here
+                covered = self.cover(covered, [(start, end)])
+                pages.append(page)
+                fresh.append((start, end))
+                parts.insert(0, page[max(0, len(page) - count):])
+                count -= len(parts[0])
+                end    = start - 1
+            if pages:
+                self._merge(symbol, interval, candles, covered, pages, fresh)
+        if not parts:
+            return np.empty(0, dtype=KLINE_DTYPE)
+        return np.concatenate(parts)
+
+    def _merge(self, symbol, interval, candles, covered, pages, ranges):
+        ''' Merges downloaded pages into the stored candles and saves them '''
+        merged   = np.concatenate([np.asarray(candles)] + pages)
+        _, first = np.unique(merged['time'], return_index=True)
+        candles  = merged[first]
+        covered  = self.cover(covered, ranges)
+        self.save(symbol, interval, candles, covered)
+        return candles, covered
+
+    def get(self, symbol:str, interval:str, limit:int=None, end_time=None, start_time=None):
+        '''
+        Gets trading price data for a given symbol, like GetSymbolKlines,
+        serving closed candles from disk and fetching only what is missing
+
+        Parameters:
+        --
+            symbol str:        The symbol for which to get the trading data
+            interval str:      The interval on which to get the trading data
+            limit:             The number of data to get, counted back from end_time
+            end_time:          Open time of the last candle wanted (default now)
+            start_time:        Open time of the first candle wanted, instead of limit
+        '''
+        if interval not in resample.WIDTHS:
+            raise Exception("{} candles have no fixed width and can not be stored".format(interval))
+        if start_time != None and end_time != None and start_time > end_time:
+            raise Exception("start_time is after end_time")
+        now     = self.client.servertime()
+        end     = now if end_time == None else min(int(end_time), now)
+        # open time of the candle that may still be forming, every older one is final
+        forming = int(resample.opentime(now - self.margin, interval))
+
+        frames  = []
+        if end >= forming:
+            frames.append(self.client.GetSymbolKlines(symbol, interval, self.client.mxlimit, end,
+                                                      max(forming, start_time or 0), fmt='numpy'))
+        top = min(end, forming - 1)
+        if start_time == None:
+            limit = limit or self.client.mxlimit
+            count = limit - (len(frames[0]['time']) if frames else 0)
+            rows  = self.older(symbol, interval, top, count) if count > 0 else None
+        else:
+            rows  = self.update(symbol, interval, int(start_time), top) if start_time <= top else None
+        if rows is not None:
+            frames.insert(0, {name: np.ascontiguousarray(rows[name]) for name in KLINE_DTYPE.names})
+        if not frames:                          # nothing has opened in the range yet
+            return self.toframe(np.empty(0, dtype=KLINE_DTYPE))
+        columns = klines.merge(frames)
+        if start_time == None:
+            columns = {name: values[-limit:] for name, values in columns.items()}
+        return klines.frame(columns)
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import threading
+import numpy as np
+from . import klines
+from .metrics import metrics as _metrics
+from .orderbook import orderbook
+from .resilience import NETWORK
+
+try:
+    import websockets
+except ImportError:                       # streaming is optional, the rest of binapi works without it
+    websockets = None
+
+"""
+Here the market data streaming client is defined. It subscribes to the
+combined futures streams (klines, mark price, book ticker), spreads many
+symbols over a few websocket connections, reconnects and resubscribes on
+its own, and hands parsed events to callbacks or to an async iterator.
+Kline events can also be kept in rolling candle buffers laid out like
+the frames of GetSymbolKlines, and depth events in local order books.
+Args:
+    url:        base url of the websocket api
+    per_connection: maximum number of streams on one connection
+    metrics:    counts the disconnections, disabled when None
+Returns:
+    data
+"""
+
+def parse(stream:str, data:dict):
+    ''' Turns a raw stream payload into a flat event dict with typed values '''
+    kind = data.get('e')
+    if kind == 'kline':
+        k = data['k']
+        return {'stream': stream, 'event': 'kline', 'symbol': data['s'], 'interval': k['i'],
+                'time': k['t'], 'open': float(k['o']), 'high': float(k['h']), 'low': float(k['l']),
+                'close': float(k['c']), 'volume': float(k['v']), 'closed': k['x'], 'eventTime': data['E']}
+    if kind == 'markPriceUpdate':
+        return {'stream': stream, 'event': 'markPrice', 'symbol': data['s'], 'markPrice': float(data['p']),
+                'indexPrice': float(data.get('i', 0)), 'fundingRate': float(data.get('r') or 0),
+                'nextFundingTime': data.get('T'), 'eventTime': data['E']}
+    if kind == 'bookTicker' or (kind == None and 'b' in data and 'a' in data):
+        return {'stream': stream, 'event': 'bookTicker', 'symbol': data['s'],
+                'bid': float(data['b']), 'bidQty': float(data['B']),
+                'ask': float(data['a']), 'askQty': float(data['A']), 'eventTime': data.get('E')}
+    event = dict(data)
+    event['stream'] = stream
+    event['event']  = kind
+    return event
+
+
+class candlebuffer:
+    ''' A fixed size rolling window of candles, in the GetSymbolKlines layout '''
+
+    def __init__(self, size:int=1500):
+        self.size    = size
+        self.columns = {name: np.zeros(2*size, dtype=np.int64 if name == 'time' else np.float64)
+                        for name in klines.COLUMNS}
+        self.start   = 0
+        self.end     = 0
+        self.lock    = threading.Lock()
+
+    def __len__(self):
+        return self.end - self.start
+
+    def seed(self, df):
+        ''' Fills the buffer from a GetSymbolKlines frame '''
+        for row in df[klines.COLUMNS].tail(self.size).itertuples(index=False):
+            self.update(dict(zip(klines.COLUMNS, row)))
+
+    def update(self, candle:dict):
+        ''' Appends a new candle, or replaces the last one while it is still forming '''
+        with self.lock:
+            last = self.columns['time'][self.end - 1] if self.end > self.start else None
+            if last != None and candle['time'] < last:
+                return
+            if last == None or candle['time'] > last:
+                if self.end == 2*self.size:             # slide the window back to the front
+                    keep = self.size - 1
+                    for column in self.columns.values():
+                        column[:keep] = column[self.end - keep:self.end]
+                    self.start, self.end = 0, keep
+                self.end += 1
+                if self.end - self.start > self.size:
+                    self.start += 1
+            for name in klines.COLUMNS:
+                self.columns[name][self.end - 1] = candle[name]
+
+    def arrays(self):
+        ''' Copies of the buffered columns '''
+        with self.lock:
+            return {name: column[self.start:self.end].copy() for name, column in self.columns.items()}
+
+    def frame(self):
+        ''' The buffered candles as a DataFrame, like GetSymbolKlines '''
+        return klines.frame(self.arrays())
+
+
+class wsconnection:
+    ''' One websocket connection that reconnects with backoff until stopped,
+        url may be a callable giving the url of every new connection '''
+
+    def __init__(self, url, on_message, on_open=None, max_backoff:float=30, metrics=None):
+        self.url         = url
+        self.on_message  = on_message
+        self.on_open     = on_open
+        self.max_backoff = max_backoff
+        self.metrics     = metrics if metrics is not None else _metrics(enabled=False)
+        self.socket      = None
+        self.running     = False
+        self.connects    = 0
+        self.error       = None          # the last disconnection
+
+    async def send(self, message:dict):
+        if self.socket != None:
+            await self.socket.send(json.dumps(message))
+
+    async def run(self):
+        self.running = True
+        backoff = 1
+        while self.running:
+            url = None
+            try:
+                url = self.url() if callable(self.url) else self.url
+                async with websockets.connect(url, max_size=None) as socket:
+                    self.socket    = socket
+                    self.connects += 1
+                    backoff        = 1
+                    if self.on_open != None:
+                        await self.on_open(self)
+                    async for message in socket:
+                        self.on_message(json.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.running:
+                    self.error = e
+                    self.metrics.inc('errors_' + NETWORK, 'stream')
+                    print("Stream {} disconnected: {}".format(url, e))
+            finally:
+                self.socket = None
+            if self.running:
+                await asyncio.sleep(backoff)
+                backoff = min(2*backoff, self.max_backoff)
+
+    async def close(self):
+        self.running = False
+        if self.socket != None:
+            await self.socket.close()
+
+
+class marketstream:
+
+    def __init__(self, url:str='wss://fstream.binance.com', per_connection:int=200, metrics=None):
+        if websockets == None:
+            raise Exception("marketstream needs the websockets package")
+        self.url            = url
+        self.per_connection = per_connection
+        self.metrics        = metrics
+        self.callbacks      = {}          # stream name -> [callback, ...]
+        self.listeners      = []          # callbacks of every event
+        self.buffers        = {}          # (symbol, interval) -> candlebuffer
+        self.books          = {}          # symbol -> orderbook
+        self.connections    = []          # [(wsconnection, [stream, ...]), ...]
+        self.queues         = []          # [(loop, asyncio.Queue), ...] of the async iterators
+        self.loop           = None
+        self.tasks          = []
+        self.thread         = None
+        self.ids            = 0
+
+    def subscribe(self, streams:list, callback=None):
+        ''' Subscribes to raw stream names, like "btcusdt@kline_1m" '''
+        for stream in streams:
+            if stream not in self.callbacks:
+                self.callbacks[stream] = []
+                self._assign(stream)
+            if callback != None:
+                self.callbacks[stream].append(callback)
+
+    def kline(self, symbol:str, interval:str, callback=None):
+        self.subscribe(['{}@kline_{}'.format(symbol.lower(), interval)], callback)
+
+    def markprice(self, symbol:str, callback=None, fast:bool=True):
+        self.subscribe(['{}@markPrice{}'.format(symbol.lower(), '@1s' if fast else '')], callback)
+
+    def bookticker(self, symbol:str, callback=None):
+        self.subscribe(['{}@bookTicker'.format(symbol.lower())], callback)
+
+    def depth(self, symbol:str, callback=None, speed:str='100ms'):
+        self.subscribe(['{}@depth@{}'.format(symbol.lower(), speed)], callback)
+
+    def on_event(self, callback):
+        ''' Registers a callback for every event of every stream '''
+        self.listeners.append(callback)
+
+    def buffer(self, symbol:str, interval:str, size:int=1500, client=None):
+        ''' Keeps a rolling candle buffer of a symbol, seeded from the REST api if a client is given '''
+        key = (symbol.upper(), interval)
+        if key not in self.buffers:
+            self.buffers[key] = candlebuffer(size)
+            if client != None:
+                self.buffers[key].seed(client.GetSymbolKlines(symbol.upper(), interval, size))
+            self.kline(symbol, interval)
+        return self.buffers[key]
+
+    def orderbook(self, symbol:str, client=None, limit:int=1000):
+        ''' Keeps a local order book of a symbol, synced from the REST snapshots of the client '''
+        symbol = symbol.upper()
+        if symbol not in self.books:
+            self.books[symbol] = orderbook(symbol, client, limit)
+            self.depth(symbol)
+        return self.books[symbol]
+
+    def _assign(self, stream):
+        ''' Puts a stream on a connection with room left, or on a new one '''
+        for connection, streams in self.connections:
+            if len(streams) < self.per_connection:
+                streams.append(stream)
+                if connection.socket != None and self.loop != None:
+                    self.ids += 1
+                    message = {'method': 'SUBSCRIBE', 'params': [stream], 'id': self.ids}
+                    asyncio.run_coroutine_threadsafe(connection.send(message), self.loop)
+                return
+        streams    = [stream]
+        # every (re)connection asks for all the streams it carries in its url
+        url        = lambda: self.url + '/stream?streams=' + '/'.join(streams)
+        connection = wsconnection(url, self._dispatch, metrics=self.metrics)
+        self.connections.append((connection, streams))
+        if self.loop != None:
+            self.loop.call_soon_threadsafe(self._launch, connection)
+
+    def _dispatch(self, message):
+        if 'stream' not in message:                 # answers to SUBSCRIBE
+            return
+        event = parse(message['stream'], message['data'])
+        if event['event'] == 'kline':
+            buffer = self.buffers.get((event['symbol'], event['interval']))
+            if buffer != None:
+                buffer.update(event)
+        elif event['event'] == 'depthUpdate':
+            book = self.books.get(event['s'])
+            if book != None:
+                book.apply(event)
+        for callback in self.callbacks.get(message['stream'], []) + self.listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print("Stream callback failed: {}".format(e))
+        # the iterators may run on another loop than the streams, after start()
+        for loop, queue in list(self.queues):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _launch(self, connection):
+        self.tasks.append(self.loop.create_task(connection.run()))
+
+    async def run(self):
+        ''' Runs every connection until stop() is called '''
+        self.loop = asyncio.get_running_loop()
+        for connection, _ in self.connections:
+            self._launch(connection)
+        while self.loop != None:
+            await asyncio.sleep(0.1)
+
+    def __aiter__(self):
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        self.queues.append(entry)
+        async def events():
+            try:
+                while True:
+                    yield await entry[1].get()
+            finally:
+                self.queues.remove(entry)
+        return events()
+
+    def start(self):
+        ''' Runs the streams in a background thread, for code that is not async '''
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        self.thread.start()
+        return self
+
+    async def aclose(self):
+        for connection, _ in self.connections:
+            await connection.close()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        self.loop  = None
+
+    def stop(self):
+        ''' Closes every connection '''
+        if self.loop == None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.aclose(), self.loop)
+        future.result(10)
+        if self.thread != None:
+            self.thread.join(10)
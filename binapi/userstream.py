@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from .streams import wsconnection, websockets
+
+"""
+Here the user data stream client is defined. It creates the listenKey,
+keeps it alive and renews it when it expires, follows the
+ORDER_TRADE_UPDATE and ACCOUNT_UPDATE events of the account and keeps a
+local copy of its orders, positions and balances. Callers can block on,
+or await, an order reaching a final status without a single poll.
+Args:
+    client:     a binance instance, for the listenKey endpoints
+    url:        base url of the websocket api
+    keepalive:  seconds between two listenKey keepalives
+Returns:
+    data
+"""
+
+FINAL_STATUSES = ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED')
+
+
+def order_update(o:dict):
+    ''' Converts the order of an ORDER_TRADE_UPDATE event to the layout of GetOrderInfo '''
+    return {'orderId': o['i'], 'symbol': o['s'], 'status': o['X'], 'clientOrderId': o['c'],
+            'price': o['p'], 'avgPrice': o['ap'], 'origQty': o['q'], 'executedQty': o['z'],
+            'type': o['o'], 'side': o['S'], 'stopPrice': o['sp'], 'timeInForce': o['f'],
+            'reduceOnly': o['R'], 'positionSide': o.get('ps', 'BOTH'), 'updateTime': o['T'],
+            'executionType': o['x'], 'lastFilledQty': o['l'], 'lastFilledPrice': o['L']}
+
+
+class userstream:
+
+    def __init__(self, client, url:str='wss://fstream.binance.com', keepalive:float=1800):
+        if websockets == None:
+            raise Exception("userstream needs the websockets package")
+        self.client     = client
+        self.url        = url
+        self.keepalive  = keepalive
+        self.listenKey  = None
+        self.orders     = {}          # (symbol, orderId) -> order, as GetOrderInfo returns it
+        self.positions  = {}          # (symbol, positionSide) -> position
+        self.balances   = {}          # asset -> balance
+        self.callbacks  = []
+        self.cond       = threading.Condition()
+        self.futures    = {}          # (symbol, orderId) -> [(loop, future, statuses), ...]
+        self.waiting    = {}          # (symbol, orderId) -> waiters, for recovery after a reconnect
+        self.connection = None
+        self.loop       = None
+        self.thread     = None
+        self.stopped    = threading.Event()
+
+    def _listenkey(self, method):
+        url  = self.client.basev1 + self.client.endpoints['listenKey']
+        send = {'POST': self.client.reqs._post, 'PUT': self.client.reqs._put,
+                'DELETE': self.client.reqs._delete}[method]
+        data = send(url, headers=self.client.headers)
+        if method == 'POST':
+            if not isinstance(data, dict) or not data.__contains__('listenKey'):
+                raise Exception("Failed to create a listenKey: {}".format(data))
+            self.listenKey = data['listenKey']
+        return data
+
+    def on_event(self, callback):
+        ''' Registers a callback for every raw event of the stream '''
+        self.callbacks.append(callback)
+
+    def _dispatch(self, event):
+        kind = event.get('e')
+        if kind == 'ORDER_TRADE_UPDATE':
+            self._order(order_update(event['o']))
+        elif kind == 'ACCOUNT_UPDATE':
+            with self.cond:
+                for b in event['a'].get('B', []):
+                    self.balances[b['a']] = {'asset': b['a'], 'walletBalance': b['wb'],
+                                             'crossWalletBalance': b['cw']}
+                for p in event['a'].get('P', []):
+                    self.positions[(p['s'], p.get('ps', 'BOTH'))] = {
+                        'symbol': p['s'], 'positionAmt': p['pa'], 'entryPrice': p['ep'],
+                        'unRealizedProfit': p['up'], 'marginType': p.get('mt'),
+                        'positionSide': p.get('ps', 'BOTH'), 'updateTime': event['E']}
+        elif kind == 'listenKeyExpired':
+            # a blocking rest call, it would stall the stream on the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._renew)
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print("User stream callback failed: {}".format(e))
+
+    def _order(self, order):
+        ''' Stores an order update and wakes whoever waits on it '''
+        key = (order['symbol'], int(order['orderId']))      # orderIds are unique within a symbol only
+        with self.cond:
+            known = self.orders.get(key)
+            if known != None and known['updateTime'] > order['updateTime']:
+                return                              # an older update arriving late
+            self.orders[key] = order
+            self.cond.notify_all()
+            futures = self.futures.get(key, [])
+            for entry in list(futures):
+                loop, future, statuses = entry
+                if order['status'] in statuses:
+                    futures.remove(entry)
+                    loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(order))
+
+    def _renew(self):
+        ''' Takes a new listenKey and reconnects with it '''
+        self._listenkey('POST')
+        if self.connection != None and self.connection.socket != None:
+            asyncio.run_coroutine_threadsafe(self.connection.socket.close(), self.loop)
+
+    async def _recover(self, connection):
+        ''' After a (re)connection, catches up on the orders somebody waits for,
+            as their updates may have been sent while the stream was down '''
+        with self.cond:
+            waiting = list(self.waiting)
+        for symbol, orderId in waiting:
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, self.client.GetOrderInfo, symbol, orderId)
+            if isinstance(data, dict) and data.__contains__('status'):
+                data.setdefault('updateTime', 0)
+                self._order(data)
+
+    def _keepalive(self):
+        while not self.stopped.wait(self.keepalive):
+            data = self._listenkey('PUT')
+            if isinstance(data, dict) and data.get('code') == -1125:     # the key does not exist anymore
+                self._renew()
+
+    async def run(self):
+        ''' Follows the stream until stop() is called '''
+        self.loop       = asyncio.get_running_loop()
+        self.connection = wsconnection(lambda: self.url + '/ws/' + self.listenKey,
+                                       self._dispatch, self._recover, metrics=self.client.metrics)
+        await self.connection.run()
+
+    def start(self):
+        ''' Creates the listenKey and follows the stream in background threads '''
+        self._listenkey('POST')
+        self.stopped.clear()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        self.thread.start()
+        threading.Thread(target=self._keepalive, daemon=True).start()
+        return self
+
+    def stop(self):
+        ''' Closes the stream and the listenKey '''
+        self.stopped.set()
+        if self.connection != None and self.loop != None:
+            asyncio.run_coroutine_threadsafe(self.connection.close(), self.loop).result(10)
+        if self.thread != None:
+            self.thread.join(10)
+        if self.listenKey != None:
+            self._listenkey('DELETE')
+            self.listenKey = None
+
+    def order(self, symbol:str, orderId):
+        ''' The last known state of an order, None if no update was seen '''
+        return self.orders.get((symbol, int(orderId)))
+
+    def position(self, symbol:str, positionSide:str='BOTH'):
+        return self.positions.get((symbol, positionSide))
+
+    def _watch(self, key):
+        ''' Counts a waiter of an order, under self.cond '''
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+
+    def _unwatch(self, key):
+        ''' Drops a waiter of an order, the order once nobody waits for it, under self.cond '''
+        self.waiting[key] = self.waiting.get(key, 1) - 1
+        if not self.waiting[key]:
+            self.waiting.pop(key)
+
+    def wait(self, symbol:str, orderId, statuses=FINAL_STATUSES, timeout:float=None):
+        '''
+        Blocks until an order reaches one of the statuses, without polling
+
+        Parameters:
+        --
+            symbol str:        The symbol of the order
+            orderId:           The order to wait for
+            statuses:          The statuses that end the wait
+            timeout float:     Seconds to wait at most, None for ever
+        Returns the order, or None on timeout
+        '''
+        key      = (symbol, int(orderId))
+        deadline = None if timeout == None else time.time() + timeout
+        with self.cond:
+            self._watch(key)
+            try:
+                while True:
+                    order = self.orders.get(key)
+                    if order != None and order['status'] in statuses:
+                        return order
+                    left = None if deadline == None else deadline - time.time()
+                    if left != None and left <= 0:
+                        return None
+                    self.cond.wait(left)
+            finally:
+                self._unwatch(key)
+
+    async def wait_async(self, symbol:str, orderId, statuses=FINAL_STATUSES, timeout:float=None):
+        ''' Awaits an order reaching one of the statuses, None on timeout '''
+        key    = (symbol, int(orderId))
+        loop   = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.cond:
+            order = self.orders.get(key)
+            if order != None and order['status'] in statuses:
+                return order
+            entry = (loop, future, statuses)
+            self.futures.setdefault(key, []).append(entry)
+            self._watch(key)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self.cond:
+                if entry in self.futures.get(key, []):
+                    self.futures[key].remove(entry)
+                if not self.futures.get(key):
+                    self.futures.pop(key, None)
+                self._unwatch(key)
@@ -18,4 +18,5 @@ setuptools.setup(
     license='MIT',
     packages=['binapi'],
     install_requires=['requests', 'pandas'],
+    extras_require={'streams': ['websockets'], 'async': ['aiohttp']},
 )